@@ -0,0 +1,234 @@
+# backend/benchmarks/date_resolution.py
+"""
+Corpus and plan check for the date resolver (core/date_resolver.py).
+
+- Correctness: resolves a corpus of questions against a fixed "today" and
+  compares the dates each rewritten question ends up with to the expected
+  ones; the original `preprocess_question_for_dates` (kept here as the
+  baseline) is scored on the same corpus. Also times both.
+- Plan check: for every date range in the corpus (resolved against the real
+  today, so it matches the fixture's rows), asks SQLite for the plan and the
+  run time of a count over PSGTMS.BATCHFILE and PSGTMS.DetailFile1 filtered on
+  ProcessDate
+    - as the bot now runs it: the question's dates bound as string parameters
+      (`sql_templates.parameterize` + `query_executor.bound_statement`),
+    - with the column converted to a number, which is what SQL Server does to
+      every row for the prompt's old `ProcessDate = CONVERT(int, ...)`.
+  The first must search the ProcessDate index, the second scans the table.
+
+Exits with status 1 if a question resolves wrongly or a bound query does not
+use the index.
+
+Run from the backend folder:
+    python -m benchmarks.date_resolution --batches 20000
+"""
+import argparse
+import re
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+import core.date_resolver as date_resolver
+import core.query_executor as query_executor
+import core.sql_templates as sql_templates
+from benchmarks.fixtures import build_fixture, make_engine
+
+# A Friday; the expected dates below are relative to it.
+TODAY = date(2025, 10, 17)
+
+# (question, expected (start, end) of each date expression, in order)
+CORPUS = [
+    ("How many batches were processed today?", [("20251017", "20251017")]),
+    ("total transactions yesterday", [("20251016", "20251016")]),
+    ("rejected items the day before yesterday", [("20251015", "20251015")]),
+    ("How many transactions were processed last week?", [("20251006", "20251012")]),
+    ("batches this week", [("20251013", "20251017")]),
+    ("sum of checks last month", [("20250901", "20250930")]),
+    ("items processed this month", [("20251001", "20251017")]),
+    ("rejections last quarter", [("20250701", "20250930")]),
+    ("transactions this quarter", [("20251001", "20251017")]),
+    ("total batches last year", [("20240101", "20241231")]),
+    ("year to date transaction count", [("20250101", "20251017")]),
+    ("rejections month to date", [("20251001", "20251017")]),
+    ("batches in the last 7 days", [("20251011", "20251017")]),
+    ("rejects previous day", [("20251016", "20251016")]),
+    ("rejected items over the past 30 days", [("20250918", "20251017")]),
+    ("checks processed in the past two weeks", [("20251004", "20251017")]),
+    ("batches processed within the last 14 days for batch mode 2", [("20251004", "20251017")]),
+    ("batches for the last 3 months", [("20250718", "20251017")]),
+    ("transactions 3 days ago", [("20251014", "20251014")]),
+    ("items processed a week ago", [("20251006", "20251012")]),
+    ("batches processed last monday", [("20251013", "20251013")]),
+    ("what was processed last friday?", [("20251010", "20251010")]),
+    ("compare yesterday with last friday", [("20251016", "20251016"), ("20251010", "20251010")]),
+    ("total for Q2 2025", [("20250401", "20250630")]),
+    ("transactions for 2025 Q1", [("20250101", "20250331")]),
+    ("rejections in Q4", [("20251001", "20251231")]),
+    ("third quarter of 2024 totals", [("20240701", "20240930")]),
+    ("batches on 2025-10-01", [("20251001", "20251001")]),
+    ("transactions on 10/05/2025", [("20251005", "20251005")]),
+    ("items processed on October 3, 2025", [("20251003", "20251003")]),
+    ("rejects on 3rd October 2025", [("20251003", "20251003")]),
+    ("Why were transactions rejected on Oct 16?", [("20251016", "20251016")]),
+    ("batches on Dec 24", [("20241224", "20241224")]),
+    ("batches for September 2025", [("20250901", "20250930")]),
+    ("what happened in March?", [("20250301", "20250331")]),
+    ("totals in 2024", [("20240101", "20241231")]),
+    ("totals in 2024 and 2025", [("20240101", "20241231"), ("20250101", "20251231")]),
+    ("how many batches on 20251016", [("20251016", "20251016")]),
+    ("transactions between 2025-10-01 and 2025-10-05", [("20251001", "20251005")]),
+    ("rejected items from September 1 to September 15, 2025", [("20250901", "20250915")]),
+    ("batches since last monday", [("20251013", "20251017")]),
+    ("items since 2025-10-10", [("20251010", "20251017")]),
+    ("status of batch 0000513258", []),
+    ("May I see the rejections for batch 0000578130?", []),
+    ("top 5 batches by total transactions", []),
+    ("sum of amounts on 2025-02-30", []),
+    ("which batches had over 2000 transactions?", []),
+    ("amount over 2024.50", []),
+    ("for 2021 transactions", []),
+]
+
+_DATE = re.compile(r"\b(?:19|20)\d{6}\b")
+
+
+def legacy_preprocess_question_for_dates(user_question: str, today: date) -> str:
+    """The original pre-processing from main.py (with `today` as a parameter), kept as the baseline."""
+    question_lower = user_question.lower()
+    if "today" in question_lower:
+        return question_lower.replace("today", f"on the date {today.strftime('%Y%m%d')}")
+    elif "yesterday" in question_lower:
+        yesterday = today - timedelta(days=1)
+        return question_lower.replace("yesterday", f"on the date {yesterday.strftime('%Y%m%d')}")
+    elif "last month" in question_lower:
+        last_day_of_last_month = today.replace(day=1) - timedelta(days=1)
+        first_day_of_last_month = last_day_of_last_month.replace(day=1)
+        return question_lower.replace(
+            "last month", f"between the dates {first_day_of_last_month.strftime('%Y%m%d')} and {last_day_of_last_month.strftime('%Y%m%d')}"
+        )
+    elif "last week" in question_lower:
+        start_of_last_week = today - timedelta(days=today.weekday() + 7)
+        end_of_last_week = start_of_last_week + timedelta(days=6)
+        return question_lower.replace(
+            "last week", f"between the dates {start_of_last_week.strftime('%Y%m%d')} and {end_of_last_week.strftime('%Y%m%d')}"
+        )
+    weekdays = {"monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6}
+    for day_name, day_number in weekdays.items():
+        if f"last {day_name}" in question_lower:
+            days_ago = 1
+            while True:
+                day_to_check = today - timedelta(days=days_ago)
+                if day_to_check.weekday() == day_number:
+                    last_day_date = day_to_check
+                    break
+                days_ago += 1
+            return question_lower.replace(f"last {day_name}", f"on the date {last_day_date.strftime('%Y%m%d')}")
+    return user_question
+
+
+def expected_dates(ranges: list[tuple[str, str]]) -> list[str]:
+    """The YYYYMMDD dates a correctly rewritten question contains, in order."""
+    return [day for start, end in ranges for day in ((start,) if start == end else (start, end))]
+
+
+def check_corpus(rewrite) -> list[tuple[str, list[str], list[str]]]:
+    """(question, expected, got) for every question `rewrite` gets wrong."""
+    wrong = []
+    for question, ranges in CORPUS:
+        got = _DATE.findall(rewrite(question))
+        if got != expected_dates(ranges):
+            wrong.append((question, expected_dates(ranges), got))
+    return wrong
+
+
+def time_per_question_us(rewrite, repeats: int) -> float:
+    questions = [question for question, _ in CORPUS]
+    runs = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for question in questions:
+            rewrite(question)
+        runs.append((time.perf_counter() - started) / len(questions) * 1e6)
+    return statistics.median(runs)
+
+
+def plan_and_time(connection, sql: str, params: dict, repeats: int) -> tuple[str, float]:
+    """SQLite's plan for the query (one line) and its median run time in ms."""
+    plan = connection.execute(query_executor.bound_statement(f"EXPLAIN QUERY PLAN {sql}", params), params).all()
+    runs = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        connection.execute(query_executor.bound_statement(sql, params), params).all()
+        runs.append((time.perf_counter() - started) * 1000)
+    return "; ".join(row[-1] for row in plan), statistics.median(runs)
+
+
+def check_plans(engine, repeats: int) -> list[dict]:
+    results = []
+    with engine.connect() as connection:
+        for question, _ in CORPUS:
+            resolved = date_resolver.resolve_dates(question)
+            for date_range in resolved.ranges:
+                start, end = date_range.bounds
+                for table in ("PSGTMS.BATCHFILE", "PSGTMS.DetailFile1"):
+                    # The SQL the prompt now asks for, run as the pipeline runs it.
+                    predicate = f"ProcessDate = '{start}'" if start == end else f"ProcessDate BETWEEN '{start}' AND '{end}'"
+                    parameterized = sql_templates.parameterize(date_range.describe(), f"SELECT COUNT(*) FROM {table} WHERE {predicate};")
+                    if parameterized is None:
+                        raise RuntimeError(f"Could not bind the dates of {date_range.describe()!r}")
+                    bound_sql, params = parameterized
+                    converted_sql = (f"SELECT COUNT(*) FROM {table} WHERE CAST(ProcessDate AS INTEGER) "
+                                     + (f"= {start};" if start == end else f"BETWEEN {start} AND {end};"))
+                    bound_plan, bound_ms = plan_and_time(connection, bound_sql, params, repeats)
+                    converted_plan, converted_ms = plan_and_time(connection, converted_sql, {}, repeats)
+                    results.append({
+                        "question": question, "table": table, "bound_sql": bound_sql,
+                        "bound_plan": bound_plan, "bound_ms": bound_ms,
+                        "converted_plan": converted_plan, "converted_ms": converted_ms,
+                        "uses_index": "USING" in bound_plan and "INDEX" in bound_plan and not bound_plan.startswith("SCAN"),
+                    })
+    return results
+
+
+def main(args) -> int:
+    print(f"--- Corpus: {len(CORPUS)} questions, today = {TODAY} ---")
+    failures = 0
+    for label, rewrite in (
+        ("original", lambda q: legacy_preprocess_question_for_dates(q, TODAY)),
+        ("resolver", lambda q: date_resolver.rewrite_question(q, TODAY)),
+    ):
+        wrong = check_corpus(rewrite)
+        us = time_per_question_us(rewrite, args.repeats)
+        print(f"{label:>9}: {len(CORPUS) - len(wrong):>3}/{len(CORPUS)} resolved correctly, {us:6.1f} us per question")
+        if label == "resolver":
+            failures += len(wrong)
+            for question, expected, got in wrong:
+                print(f"           WRONG {question!r}: expected {expected}, got {got}")
+
+    print(f"\n--- Plan check: SQLite fixture with {args.batches} batches ---")
+    engine = make_engine(*build_fixture(batches=args.batches))
+    results = check_plans(engine, args.query_repeats)
+    for table in ("PSGTMS.BATCHFILE", "PSGTMS.DetailFile1"):
+        rows = [r for r in results if r["table"] == table]
+        bound_ms = statistics.median(r["bound_ms"] for r in rows)
+        converted_ms = statistics.median(r["converted_ms"] for r in rows)
+        print(f"{table}: {sum(r['uses_index'] for r in rows)}/{len(rows)} bound queries search the ProcessDate index; "
+              f"median {bound_ms:.2f} ms bound vs {converted_ms:.2f} ms converted")
+    example = next(r for r in results if r["table"] == "PSGTMS.DetailFile1")
+    print(f"\nExample ({example['question']!r}):")
+    print(f"  bound:     {example['bound_sql']}\n             -> {example['bound_plan']}")
+    print(f"  converted: -> {example['converted_plan']}")
+    for r in results:
+        if not r["uses_index"]:
+            failures += 1
+            print(f"NO INDEX for {r['question']!r} on {r['table']}: {r['bound_plan']}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the date resolver against a corpus and its queries' plans.")
+    parser.add_argument("--batches", type=int, default=20000, help="Batches in the SQLite fixture (20 items each).")
+    parser.add_argument("--repeats", type=int, default=50, help="Timed passes over the corpus.")
+    parser.add_argument("--query-repeats", type=int, default=3, help="Timed runs of each fixture query.")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,66 @@
+# backend/benchmarks/db_timeouts.py
+"""
+Runaway-query benchmark for the executor's timeout and concurrency limiter.
+
+Fires a few artificially slow queries (a recursive CTE that counts to a huge
+number) at the SQLite fixture together with many fast ones, and shows that
+the slow ones are cancelled at QUERY_TIMEOUT_SECONDS while the fast ones only
+wait for a free slot. Exits with status 1 if a query fails with any other
+error, or a fast one is cancelled.
+
+Run from the backend folder:
+    python -m benchmarks.db_timeouts --timeout 1 --concurrency 2
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import core.query_executor as query_executor
+from benchmarks.fixtures import build_fixture, make_engine
+
+SLOW_QUERY = """WITH RECURSIVE counter(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM counter WHERE x < 1000000000)
+SELECT COUNT(*) AS n FROM counter"""
+FAST_QUERY = "SELECT COUNT(*) AS BatchCount FROM PSGTMS.BATCHFILE"
+
+
+async def timed(sql_query: str) -> tuple[str, float, str | None]:
+    started = time.perf_counter()
+    _, error = await query_executor.execute_query_async(sql_query)
+    label = "slow" if sql_query is SLOW_QUERY else "fast"
+    return label, time.perf_counter() - started, error
+
+
+async def main_async(args):
+    query_executor.QUERY_TIMEOUT_SECONDS = args.timeout
+    query_executor.DB_MAX_CONCURRENCY_PER_ENGINE = args.concurrency
+    query_executor.engines["tms"] = make_engine(*build_fixture())
+
+    queries = [SLOW_QUERY] * args.slow + [FAST_QUERY] * args.fast
+    results = await asyncio.gather(*(timed(q) for q in queries))
+
+    print("\n--- Query outcomes ---")
+    failures = 0
+    for label in ("slow", "fast"):
+        rows = [r for r in results if r[0] == label]
+        cancelled = sum(1 for r in rows if r[2] and "cancelled" in r[2])
+        failed = [r[2] for r in rows if r[2] and "cancelled" not in r[2]]
+        print(f"{label}: {len(rows)} queries, {len(rows) - cancelled - len(failed)} succeeded, {cancelled} cancelled, "
+              f"{len(failed)} failed, max latency {max(r[1] for r in rows):.2f}s")
+        for error in dict.fromkeys(failed):
+            print(f"  FAILED: {error}")
+        # Fast queries must succeed; slow ones must succeed or be cancelled.
+        failures += len(failed) + (cancelled if label == "fast" else 0)
+    print("\n--- Engine metrics ---")
+    print(json.dumps(query_executor.engine_stats(), indent=2))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show per-query timeouts and queue-wait metrics.")
+    parser.add_argument("--timeout", type=float, default=1.0, help="QUERY_TIMEOUT_SECONDS to use.")
+    parser.add_argument("--concurrency", type=int, default=2, help="DB_MAX_CONCURRENCY_PER_ENGINE to use.")
+    parser.add_argument("--slow", type=int, default=3)
+    parser.add_argument("--fast", type=int, default=20)
+    sys.exit(asyncio.run(main_async(parser.parse_args())))
@@ -0,0 +1,102 @@
+# backend/benchmarks/fixtures.py
+"""
+SQLite stand-ins for the PSGTMS and PSGAuditStats databases.
+
+Each schema lives in its own SQLite file, which is ATTACHed under the schema
+name so that the bot's qualified T-SQL table names (e.g. PSGTMS.BATCHFILE)
+resolve unchanged.
+"""
+import random
+import sqlite3
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, event
+
+TMS_DDL = [
+    """CREATE TABLE BATCHFILE (SiteId INTEGER, BatchNo CHAR(10), ProcessDate CHAR(8), WorkDate CHAR(8),
+       CheckCount INTEGER, StubCount INTEGER, TotalTrans INTEGER, BatchValue INTEGER, BatchMode INTEGER,
+       PRIMARY KEY (SiteId, BatchNo))""",
+    """CREATE TABLE DetailFile1 (DetailKey INTEGER PRIMARY KEY, BatchNo CHAR(10), TranNo INTEGER,
+       ProcessDate CHAR(8), ItemType INTEGER, Amount NUMERIC, Reject INTEGER, RejectPgm INTEGER,
+       RejectReason INTEGER, WorkSrc VARCHAR(20))""",
+    "CREATE TABLE TDF_BatchValues (BatchValue INTEGER PRIMARY KEY, BatchValueDesc VARCHAR(50))",
+    "CREATE TABLE TDF_BatchModes (BatchMode INTEGER PRIMARY KEY, BatchModeDesc VARCHAR(50))",
+    "CREATE TABLE WorkSrcDesc (WorkSource VARCHAR(20) PRIMARY KEY, WSIdx INTEGER)",
+    "CREATE TABLE REJREASON (PgmID INTEGER, RejID INTEGER, WSIdx INTEGER, RejDesc VARCHAR(100), PRIMARY KEY (PgmID, RejID, WSIdx))",
+    "CREATE INDEX IX_BATCHFILE_ProcessDate ON BATCHFILE (ProcessDate)",
+    "CREATE INDEX IX_DetailFile1_ProcessDate ON DetailFile1 (ProcessDate)",
+]
+
+AUDIT_DDL = [
+    """CREATE TABLE tblAuditLogMaster (LogId INTEGER PRIMARY KEY, BatchNo CHAR(10), TranNo INTEGER,
+       Usercode CHAR(10), Action VARCHAR(20), LogDateTime DATETIME)""",
+    "CREATE TABLE tblAuditLogDetail (LogId INTEGER, FieldName VARCHAR(50), OldValue VARCHAR(50), NewValue VARCHAR(50))",
+]
+
+
+def build_fixture(directory: str | Path | None = None, batches: int = 200, items_per_batch: int = 20, seed: int = 7):
+    """
+    Creates and populates the two SQLite database files.
+
+    Returns:
+        tuple: (tms_path, audit_path)
+    """
+    directory = Path(directory or tempfile.mkdtemp(prefix="tmsbot-bench-"))
+    tms_path = directory / "PSGTMS.db"
+    audit_path = directory / "PSGAuditStats.db"
+    rng = random.Random(seed)
+    today = date.today()
+
+    with sqlite3.connect(tms_path) as conn:
+        for ddl in TMS_DDL:
+            conn.execute(ddl)
+        conn.executemany("INSERT INTO TDF_BatchValues VALUES (?, ?)",
+                         [(1, "Open"), (2, "In Progress"), (3, "Process Done")])
+        conn.executemany("INSERT INTO TDF_BatchModes VALUES (?, ?)",
+                         [(1, "Standard Processing"), (2, "Rush Processing")])
+        conn.executemany("INSERT INTO WorkSrcDesc VALUES (?, ?)", [("LBX", 1), ("RDC", 2)])
+        conn.executemany("INSERT INTO REJREASON VALUES (?, ?, ?, ?)",
+                         [(1, 1, 0, "Invalid Amount"), (1, 2, 0, "Missing Signature"), (1, 1, 1, "Amount Mismatch")])
+
+        batch_rows, detail_rows = [], []
+        detail_key = 1
+        for b in range(batches):
+            batch_no = f"{513258 + b:010d}"
+            process_date = (today - timedelta(days=b % 30)).strftime("%Y%m%d")
+            rejected = 0
+            for item in range(items_per_batch):
+                reject = 1 if rng.random() < 0.1 else 0
+                rejected += reject
+                detail_rows.append((detail_key, batch_no, item // 2 + 1, process_date, item % 2,
+                                    round(rng.uniform(1, 5000), 2), reject, 1 if reject else 0,
+                                    rng.choice([1, 2]) if reject else 0, rng.choice(["LBX", "RDC"])))
+                detail_key += 1
+            accepted = items_per_batch - rejected
+            batch_rows.append((1, batch_no, process_date, process_date, accepted // 2,
+                               accepted - accepted // 2, accepted, rng.choice([1, 2, 3]), rng.choice([1, 2])))
+        conn.executemany("INSERT INTO BATCHFILE VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch_rows)
+        conn.executemany("INSERT INTO DetailFile1 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", detail_rows)
+
+    with sqlite3.connect(audit_path) as conn:
+        for ddl in AUDIT_DDL:
+            conn.execute(ddl)
+        conn.executemany("INSERT INTO tblAuditLogMaster VALUES (?, ?, ?, ?, ?, ?)",
+                         [(i, f"{513258 + i:010d}", 1, "OPER1", "Update", f"{today} 10:00:00") for i in range(1, 51)])
+        conn.executemany("INSERT INTO tblAuditLogDetail VALUES (?, ?, ?, ?)",
+                         [(i, "Amount", "100.00", "110.00") for i in range(1, 51)])
+
+    return tms_path, audit_path
+
+
+def make_engine(tms_path, audit_path):
+    """An engine whose connections see both fixture databases under their schema names."""
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def _attach_schemas(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE '{tms_path}' AS PSGTMS")
+        dbapi_connection.execute(f"ATTACH DATABASE '{audit_path}' AS PSGAuditStats")
+
+    return engine
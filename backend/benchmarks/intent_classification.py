@@ -0,0 +1,142 @@
+# backend/benchmarks/intent_classification.py
+"""
+Accuracy and latency of the local intent classifier versus the LLM call.
+
+Runs every labeled example (models/intent_examples.jsonl) through
+    - the LLM (`main.classify_intent`, what every request used to do),
+    - the local classifier, with k-fold cross-validation so no question is
+      classified by a model trained on it,
+    - both combined as the app runs them: the local answer when its
+      confidence reaches the threshold, the LLM otherwise,
+and reports accuracy, how many LLM calls remain and the latency of the
+intent decision. The question embedding is not counted for the local
+classifier: schema retrieval computes it for the question anyway.
+
+By default it runs against the stub Azure OpenAI server, whose intent answer
+is a keyword rule and whose embeddings are hashed bags of words; with
+--live it uses the Azure OpenAI deployment configured in config/.env.
+
+Run from the backend folder:
+    python -m benchmarks.intent_classification --folds 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from pathlib import Path
+
+from benchmarks.load_test import configure_environment, percentile
+from benchmarks.stub_llm import start_stub_server
+
+
+def configure_clients():
+    """Points the modules that call Azure OpenAI at the endpoint in the environment."""
+    from openai import AsyncAzureOpenAI
+    import core.nl_to_sql as nl_to_sql
+    import core.schema_retriever as schema_retriever
+
+    client = AsyncAzureOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=os.getenv("AZURE_API_VERSION"),
+    )
+    schema_retriever.client = nl_to_sql.client = client
+    schema_retriever.AZURE_EMBEDDING_MODEL_NAME = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")
+    nl_to_sql.AZURE_MODEL_NAME = os.getenv("AZURE_OPENAI_MODEL_NAME")
+
+
+async def llm_intents(questions: list[str], concurrency: int) -> tuple[list[str], list[float]]:
+    """The LLM's intent for each question, and how long each call took (ms)."""
+    import main
+
+    limit = asyncio.Semaphore(concurrency)
+
+    async def classify(question: str):
+        async with limit:
+            started = time.perf_counter()
+            intent = await main.classify_intent([{"role": "user", "content": question}])
+            return intent, (time.perf_counter() - started) * 1000
+
+    results = await asyncio.gather(*(classify(q) for q in questions))
+    return [intent for intent, _ in results], [ms for _, ms in results]
+
+
+def cross_validate(embeddings, intents: list[str], folds: int, seed: int) -> tuple[list[tuple[str, float]], list[float]]:
+    """(intent, confidence) for every example from a model trained on the other folds, and each prediction's time (ms)."""
+    import core.intent_classifier as intent_classifier
+
+    order = list(range(len(intents)))
+    random.Random(seed).shuffle(order)
+    predictions, times = [None] * len(intents), [0.0] * len(intents)
+    for fold in range(folds):
+        held_out = set(order[fold::folds])
+        train = [i for i in order if i not in held_out]
+        model = intent_classifier.train(embeddings[train], [intents[i] for i in train])
+        for i in held_out:
+            started = time.perf_counter()
+            predictions[i] = model.predict(embeddings[i])
+            times[i] = (time.perf_counter() - started) * 1000
+    return predictions, times
+
+
+def summarize(label: str, correct: list[bool], llm_calls: int, latencies_ms: list[float]):
+    print(f"{label:>24} | {sum(correct) / len(correct):>8.1%} | {llm_calls:>9} | "
+          f"{statistics.median(latencies_ms):>10.3f} | {percentile(latencies_ms, 95):>10.3f}")
+
+
+async def run(args):
+    stub = None
+    if args.live:
+        from dotenv import load_dotenv
+        load_dotenv(dotenv_path="config/.env")
+    else:
+        endpoint, stub = start_stub_server(args.chat_latency_ms, args.embedding_latency_ms)
+        configure_environment(endpoint)
+    try:
+        import core.intent_classifier as intent_classifier
+
+        configure_clients()
+        examples = intent_classifier.load_examples(Path(args.examples))
+        questions = [question for question, _ in examples]
+        intents = [intent for _, intent in examples]
+        audit = intents.count("audit_history")
+        print(f"{len(examples)} labeled questions ({audit} audit_history, {len(examples) - audit} data_retrieval), "
+              f"{args.folds}-fold cross-validation, {'live Azure OpenAI' if args.live else 'stub LLM'}\n")
+
+        embeddings = await intent_classifier.embed(questions)
+        predictions, local_ms = cross_validate(embeddings, intents, args.folds, args.seed)
+        llm_answers, llm_ms = await llm_intents(questions, args.concurrency)
+    finally:
+        if stub is not None:
+            stub.should_exit = True
+
+    print(f"{'intent decided by':>24} | {'accuracy':>8} | {'LLM calls':>9} | {'p50 ms':>10} | {'p95 ms':>10}")
+    summarize("LLM (before)", [a == b for a, b in zip(llm_answers, intents)], len(questions), llm_ms)
+    summarize("local only", [p[0] == b for p, b in zip(predictions, intents)], 0, local_ms)
+    for threshold in args.thresholds:
+        confident = [p[1] >= threshold for p in predictions]
+        answers = [p[0] if c else llm for p, c, llm in zip(predictions, confident, llm_answers)]
+        latencies = [local if c else local + llm for local, c, llm in zip(local_ms, confident, llm_ms)]
+        summarize(f"local >= {threshold:g}, else LLM", [a == b for a, b in zip(answers, intents)],
+                  confident.count(False), latencies)
+
+    wrong = [(q, b, p) for q, b, p in zip(questions, intents, predictions) if p[0] != b]
+    if wrong:
+        print("\nMisclassified by the local model:")
+        for question, expected, (intent, confidence) in wrong:
+            print(f"  {question!r}: {intent} ({confidence:.2f}), labeled {expected}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the local intent classifier with the LLM call.")
+    parser.add_argument("--examples", default="models/intent_examples.jsonl", help="Labeled questions (JSON lines).")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.7, 0.8, 0.9, 0.95])
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM calls in flight at once.")
+    parser.add_argument("--chat-latency-ms", type=float, default=200, help="Stub chat completion latency.")
+    parser.add_argument("--embedding-latency-ms", type=float, default=50, help="Stub embedding latency.")
+    parser.add_argument("--live", action="store_true", help="Use the Azure OpenAI deployment in config/.env.")
+    asyncio.run(run(parser.parse_args()))
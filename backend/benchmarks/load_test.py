@@ -0,0 +1,121 @@
+# backend/benchmarks/load_test.py
+"""
+Load benchmark for the /query endpoint.
+
+Drives the FastAPI app in-process with N concurrent simulated users, against the
+stub Azure OpenAI server and the SQLite fixture, and reports requests-per-second
+and latency percentiles.
+
+Run from the backend folder:
+    python -m benchmarks.load_test --users 50 --requests 500
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks.fixtures import build_fixture, make_engine
+from benchmarks.stub_llm import start_stub_server
+
+QUESTIONS = [
+    "how many batches were processed yesterday?",
+    "how many transactions were processed last week?",
+    "what is the status of batch 0000513258?",
+    "what is the status of batch 0000513301?",
+    "which transactions were rejected in batch 0000513260?",
+    "show me the audit history for batch 0000513259",
+]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def configure_environment(endpoint: str):
+    """Points the app at the stub server before `main` is imported."""
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": endpoint,
+        "AZURE_OPENAI_API_KEY": "stub-key",
+        "AZURE_API_VERSION": "2024-02-01",
+        "AZURE_OPENAI_MODEL_NAME": "stub-chat",
+        "AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME": "stub-embedding",
+        "DATABASE_URL_TMS": "sqlite://",
+        "DATABASE_URL_AUDIT": "sqlite://",
+    })
+
+
+async def start_app():
+    """Imports and starts the app, then swaps in the SQLite fixture engines."""
+    import main
+    import core.query_executor as query_executor
+
+    await main.startup_event()
+    await main.startup_task  # the schema index is built in the background
+    engine = make_engine(*build_fixture())
+    query_executor.engines.update(tms=engine, audit=engine)
+    return main.app
+
+
+async def run_load(app, users: int, total_requests: int):
+    latencies, errors = [], 0
+    counter = iter(range(total_requests))
+
+    async def user(client: httpx.AsyncClient):
+        nonlocal errors
+        for i in counter:
+            question = QUESTIONS[i % len(QUESTIONS)]
+            started = time.perf_counter()
+            response = await client.post("/query", json={"history": [{"role": "user", "content": question}]})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(client) for _ in range(users)))
+        elapsed = time.perf_counter() - started
+        cache_stats = (await client.get("/cache/stats")).json()
+        summary_stats = (await client.get("/summary/stats")).json()
+
+    return {
+        "users": users,
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "cache_stats": cache_stats,
+        "summary_stats": summary_stats,
+    }
+
+
+async def main_async(args):
+    endpoint, server = start_stub_server(args.chat_latency_ms, args.embedding_latency_ms)
+    configure_environment(endpoint)
+    try:
+        app = await start_app()
+        report = await run_load(app, args.users, args.requests)
+    finally:
+        server.should_exit = True
+
+    print("\n--- Load Test Results ---")
+    for key, value in report.items():
+        print(f"{key:>16}: {value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the /query endpoint.")
+    parser.add_argument("--users", type=int, default=50, help="Concurrent simulated users.")
+    parser.add_argument("--requests", type=int, default=500, help="Total requests to send.")
+    parser.add_argument("--chat-latency-ms", type=float, default=200, help="Stub chat completion latency.")
+    parser.add_argument("--embedding-latency-ms", type=float, default=50, help="Stub embedding latency.")
+    asyncio.run(main_async(parser.parse_args()))
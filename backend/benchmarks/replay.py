@@ -0,0 +1,400 @@
+# backend/benchmarks/replay.py
+"""
+Offline replay of production traffic from the bot's log files.
+
+The logs (text or LOG_JSON lines, see core/logger.py) are parsed into a
+replay corpus: each received question with the conversation that preceded it
+(rebuilt from the "Full history contains N messages" lines and the logged
+summaries), the tables that were retrieved for it and the SQL the model
+generated. The corpus is then sent through the /query endpoint, in-process,
+against the stub Azure OpenAI server and the SQLite fixture; by default the
+stub answers each question with its logged SQL.
+
+The report gives throughput, end-to-end and per-stage latency percentiles,
+peak memory, cache hit rates and how often the replay retrieved the same
+tables and ran the same SQL as production. It is saved as JSON; pass an
+earlier report to --compare to see what regressed.
+
+Conversations are rebuilt in log order, so overlapping conversations from
+several users can get mixed up; such questions are counted as incomplete.
+
+Run from the backend folder:
+    python -m benchmarks.replay --logs "logs/*.log" --users 10 --output replay_report.json
+    python -m benchmarks.replay --compare replay_report.json
+"""
+import argparse
+import asyncio
+import contextvars
+import glob
+import json
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+import httpx
+
+from benchmarks import stub_llm
+from benchmarks.load_test import QUESTIONS, configure_environment, percentile, start_app
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+# "INFO | 2025-10-17 14:24:36 | main | 155 | Received question: '...'"
+TEXT_RECORD = re.compile(r"^(DEBUG|INFO|WARNING|ERROR|CRITICAL) \| [^|]+ \| ([^|]+?) \| \d+ \| (.*)$")
+QUESTION = re.compile(r"^Received question: '(.*)'$", re.DOTALL)
+HISTORY_LENGTH = re.compile(r"^Full history contains (\d+) messages")
+TABLE_LINE = re.compile(r"^Table:\s*(\S+)", re.MULTILINE)
+TRUNCATED = " ...[truncated "
+
+# Results of the request being sent, filled in by the pipeline wrapper.
+_current_record = contextvars.ContextVar("replay_record", default=None)
+
+
+# --- Corpus ---
+
+def read_log_records(paths: list[str]):
+    """
+    Yields (request_id, logger name, message, "file:line") for every record of
+    the log files; continuation lines of multi-line text records are joined.
+    """
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            record = None
+            for number, line in enumerate(f, 1):
+                line = line.rstrip("\r\n")
+                if line.startswith("{"):
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        entry = None
+                    if isinstance(entry, dict) and "message" in entry:
+                        if record:
+                            yield record
+                        yield entry.get("request_id"), entry.get("logger", ""), entry["message"], f"{path}:{number}"
+                        record = None
+                        continue
+                match = TEXT_RECORD.match(line)
+                if match:
+                    if record:
+                        yield record
+                    record = (None, match.group(2), match.group(3), f"{path}:{number}")
+                elif record:
+                    record = (record[0], record[1], f"{record[2]}\n{line}", record[3])
+            if record:
+                yield record
+
+
+def build_corpus(records) -> list[dict]:
+    """
+    Turns log records into one corpus entry per received question:
+        {"question", "history", "history_complete", "tables", "sql", "summary", "source"}
+    "history" is the conversation before the question (user questions and
+    assistant summaries); "tables", "sql" and "summary" are None when they
+    were not logged (e.g. the request failed or reused a SQL template).
+    """
+    corpus = []
+    open_entries = {}   # request ID (None for text logs) -> entry being filled in
+    for request_id, logger_name, message, source in records:
+        if logger_name.strip() != "main":
+            continue
+        question = QUESTION.match(message)
+        if question:
+            entry = {"question": question.group(1), "history_length": 1, "tables": None,
+                     "sql": None, "summary": None, "source": source}
+            open_entries[request_id] = entry
+            corpus.append(entry)
+            continue
+        entry = open_entries.get(request_id)
+        if entry is None:
+            continue
+        history_length = HISTORY_LENGTH.match(message)
+        if history_length:
+            entry["history_length"] = int(history_length.group(1))
+        elif message.startswith("Retrieved schemas for: "):
+            entry["tables"] = [t.strip() for t in message[len("Retrieved schemas for: "):].split(",") if t.strip()]
+        elif message.startswith("Retrieved Schemas:"):
+            # Older logs wrote the whole schema text.
+            entry["tables"] = TABLE_LINE.findall(message)
+        elif message.startswith("Generated SQL: ") and TRUNCATED not in message:
+            entry["sql"] = message[len("Generated SQL: "):].strip()
+        elif message.startswith("Generated Summary: ") and TRUNCATED not in message:
+            entry["summary"] = message[len("Generated Summary: "):].strip()
+
+    # Rebuild the conversations: a question with N history messages follows
+    # the N - 1 messages of the conversation before it.
+    conversation = []
+    for entry in corpus:
+        previous = entry.pop("history_length") - 1
+        if previous <= 0:
+            conversation = []
+        entry["history"] = conversation[-previous:] if previous > 0 else []
+        entry["history_complete"] = len(entry["history"]) == max(previous, 0)
+        conversation = entry["history"] + [{"role": "user", "content": entry["question"]}]
+        if entry["summary"] is not None:
+            conversation.append({"role": "assistant", "content": entry["summary"]})
+    return corpus
+
+
+def describe_corpus(corpus: list[dict], files: list[str]) -> dict:
+    return {
+        "files": files,
+        "questions": len(corpus),
+        "distinct_questions": len({entry["question"].lower() for entry in corpus}),
+        "follow_ups": sum(1 for entry in corpus if entry["history"]),
+        "incomplete_histories": sum(1 for entry in corpus if not entry["history_complete"]),
+        "with_logged_sql": sum(1 for entry in corpus if entry["sql"]),
+    }
+
+
+def script_logged_sql(corpus: list[dict], preprocess) -> int:
+    """Makes the stub answer each question with the SQL logged for it. Returns how many were scripted."""
+    stub_llm.scripted_sql.clear()
+    for entry in corpus:
+        if entry["sql"]:
+            for question in (entry["question"], preprocess(entry["question"])):
+                stub_llm.scripted_sql[question.lower().strip()] = entry["sql"]
+    return len(stub_llm.scripted_sql)
+
+
+# --- Replay ---
+
+def record_pipeline_results(main):
+    """
+    Wraps main.run_query_pipeline and nl_to_sql.generate_sql_query so each
+    request's stage timings, retrieved tables and generated SQL are kept in
+    the record of the request being replayed.
+    """
+    import core.nl_to_sql as nl_to_sql
+    original_pipeline = main.run_query_pipeline
+    original_generate = nl_to_sql.generate_sql_query
+
+    async def recording_pipeline(history, timings, **kwargs):
+        record = _current_record.get()
+        try:
+            async for event, data in original_pipeline(history, timings, **kwargs):
+                if record is not None and event == "tables":
+                    record["tables"] = data["tables"]
+                yield event, data
+        finally:
+            if record is not None:
+                record["timings"] = dict(timings)
+
+    async def recording_generate(history, retrieved_schemas):
+        sql_query = await original_generate(history, retrieved_schemas)
+        record = _current_record.get()
+        if record is not None:
+            record["sql"] = sql_query
+        return sql_query
+
+    main.run_query_pipeline = recording_pipeline
+    nl_to_sql.generate_sql_query = recording_generate
+
+
+def rss_peak_mb() -> float | None:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS).
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def hit_rates(stats: dict, prefix: str = "") -> dict:
+    """Flattens the "hit_rate" of every cache in /cache/stats to {"retrieval.embeddings": 0.5, ...}."""
+    rates = {}
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            if "hit_rate" in value:
+                rates[prefix + key] = value["hit_rate"]
+            rates.update(hit_rates(value, f"{prefix}{key}."))
+    return rates
+
+
+async def replay(app, corpus: list[dict], users: int, repeat: int) -> dict:
+    records = []
+    work = iter([entry for _ in range(repeat) for entry in corpus])
+
+    async def user(client: httpx.AsyncClient):
+        for entry in work:
+            record = {"entry": entry}
+            _current_record.set(record)
+            history = entry["history"] + [{"role": "user", "content": entry["question"]}]
+            started = time.perf_counter()
+            response = await client.post("/query", json={"history": history})
+            record["latency"] = time.perf_counter() - started
+            record["status"] = response.status_code
+            records.append(record)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=300) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(client) for _ in range(users)))
+        elapsed = time.perf_counter() - started
+        cache_stats = (await client.get("/cache/stats")).json()
+        summary_stats = (await client.get("/summary/stats")).json()
+
+    latencies = [record["latency"] for record in records]
+    stage_samples = {}
+    for record in records:
+        for stage, ms in record.get("timings", {}).items():
+            stage_samples.setdefault(stage, []).append(ms)
+
+    # How closely the replay followed production, where production logged it.
+    same_tables = [
+        {t.upper() for t in record["tables"]} == {t.upper() for t in record["entry"]["tables"]}
+        for record in records if record.get("tables") is not None and record["entry"]["tables"] is not None
+    ]
+    same_sql = [
+        record["sql"] == record["entry"]["sql"]
+        for record in records if record.get("sql") and record["entry"]["sql"]
+    ]
+
+    return {
+        "requests": len(records),
+        "status_codes": {str(code): count for code, count in sorted(Counter(r["status"] for r in records).items())},
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(records) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            f"p{pct}": round(percentile(latencies, pct) * 1000, 1) for pct in (50, 95, 99)
+        } | {"max": round(max(latencies, default=0) * 1000, 1)},
+        "stages_ms": {
+            stage: {"count": len(samples), **{f"p{pct}": percentile(samples, pct) for pct in (50, 95, 99)}}
+            for stage, samples in sorted(stage_samples.items())
+        },
+        "agreement": {
+            "same_tables": round(sum(same_tables) / len(same_tables), 4) if same_tables else None,
+            "same_sql": round(sum(same_sql) / len(same_sql), 4) if same_sql else None,
+        },
+        "cache_hit_rates": hit_rates(cache_stats),
+        "summary_stats": summary_stats,
+    }
+
+
+# --- Comparison ---
+
+def compare(report: dict, baseline: dict, tolerance_pct: float) -> list[str]:
+    """Lines comparing a report with a baseline one; regressions beyond the tolerance are marked."""
+    rows = [("requests_per_s", baseline.get("requests_per_s"), report["requests_per_s"], True)]
+    for pct in ("p50", "p95", "p99"):
+        rows.append((f"latency {pct}", baseline.get("latency_ms", {}).get(pct), report["latency_ms"][pct], False))
+    for stage, samples in report["stages_ms"].items():
+        old = baseline.get("stages_ms", {}).get(stage, {})
+        for pct in ("p50", "p95"):
+            rows.append((f"{stage} {pct}", old.get(pct), samples[pct], False))
+    rows.append(("rss_peak_mb", baseline.get("memory", {}).get("rss_peak_mb"), report["memory"]["rss_peak_mb"], False))
+
+    lines = []
+    for name, old, new, higher_is_better in rows:
+        if not old or new is None:
+            lines.append(f"{name:>28}: {old} -> {new}")
+            continue
+        change = (new - old) / old * 100
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > tolerance_pct else ""
+        lines.append(f"{name:>28}: {old} -> {new} ({change:+.1f}%){flag}")
+    return lines
+
+
+async def main_async(args) -> int:
+    baseline = None
+    if args.compare:
+        # Read first: the new report may be saved over it.
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            saved = json.load(f)
+        files, corpus = saved["files"], saved["corpus"]
+    else:
+        files = sorted(glob.glob(args.logs))
+        corpus = build_corpus(read_log_records(files))
+    if not corpus:
+        print(f"No questions found in {args.logs}; replaying the built-in sample questions.")
+        corpus = [{"question": q, "history": [], "history_complete": True, "tables": None,
+                   "sql": None, "summary": None, "source": "sample"} for q in QUESTIONS]
+    if args.save_corpus:
+        with open(args.save_corpus, "w", encoding="utf-8") as f:
+            json.dump({"files": files, "corpus": corpus}, f, indent=2)
+        print(f"Saved the corpus to {args.save_corpus}")
+
+    # The replay's own logs go to a scratch folder, so they are not replayed next time.
+    import core.logger as logger
+    logger.LOG_DIR = tempfile.mkdtemp(prefix="replay-logs-")
+
+    endpoint, server = stub_llm.start_stub_server(args.chat_latency_ms, args.embedding_latency_ms)
+    configure_environment(endpoint)
+    try:
+        app = await start_app()
+        import main
+        record_pipeline_results(main)
+        scripted = script_logged_sql(corpus, main.date_resolver.rewrite_question) if args.sql == "logged" else 0
+
+        rss_before = rss_peak_mb()
+        if args.trace_memory:
+            tracemalloc.start()
+        results = await replay(app, corpus, args.users, args.repeat)
+        python_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+        tracemalloc.stop()
+    finally:
+        server.should_exit = True
+
+    report = {
+        "run": {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "users": args.users,
+            "repeat": args.repeat,
+            "sql": args.sql,
+            "scripted_questions": scripted,
+            "chat_latency_ms": args.chat_latency_ms,
+            "embedding_latency_ms": args.embedding_latency_ms,
+        },
+        "corpus": describe_corpus(corpus, files),
+        **results,
+        "memory": {
+            "rss_peak_before_replay_mb": rss_before,
+            "rss_peak_mb": rss_peak_mb(),
+            "python_peak_mb": round(python_peak / 1024 / 1024, 1) if python_peak is not None else None,
+        },
+        "llm_calls": dict(stub_llm.call_counts),
+    }
+
+    print("\n--- Replay Results ---")
+    for key, value in report.items():
+        print(f"{key:>16}: {value}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved the report to {args.output}")
+
+    if baseline is not None:
+        print(f"\n--- Compared with {args.compare} ({baseline.get('run', {}).get('time')}) ---")
+        lines = compare(report, baseline, args.tolerance)
+        print("\n".join(lines))
+        if any(line.endswith("REGRESSION") for line in lines):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay logged questions through the pipeline.")
+    parser.add_argument("--logs", default=os.path.join("logs", "*.log"), help="Glob of the log files to replay.")
+    parser.add_argument("--corpus", help="Replay a corpus saved with --save-corpus instead of parsing logs.")
+    parser.add_argument("--save-corpus", help="Write the parsed corpus to this JSON file.")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent simulated users.")
+    parser.add_argument("--repeat", type=int, default=1, help="Times to replay the whole corpus.")
+    parser.add_argument("--sql", choices=("logged", "canned"), default="logged",
+                        help="Answer with the logged SQL, or with the stub's canned SQL.")
+    parser.add_argument("--chat-latency-ms", type=float, default=200, help="Stub chat completion latency.")
+    parser.add_argument("--embedding-latency-ms", type=float, default=50, help="Stub embedding latency.")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Also measure the peak Python heap with tracemalloc (slows the replay down).")
+    parser.add_argument("--output", default="replay_report.json", help="Where to save the JSON report ('' to skip).")
+    parser.add_argument("--compare", help="An earlier report to compare with.")
+    parser.add_argument("--tolerance", type=float, default=10, help="Percent change reported as a regression.")
+    raise SystemExit(asyncio.run(main_async(parser.parse_args())))
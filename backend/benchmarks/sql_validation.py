@@ -0,0 +1,118 @@
+# backend/benchmarks/sql_validation.py
+"""
+Microbenchmark for the SQL validator.
+
+Generates a corpus of realistic read-only queries (the few-shot shapes from
+the SQL prompt with random batch numbers, dates and columns) plus unsafe
+variants, then compares:
+
+- the original validator (one regex scan per forbidden keyword, then a full
+  sqlparse.parse), kept here as the baseline,
+- the single-pass token validator (`sql_validator.check_query`),
+- `sql_validator.is_safe_query` on repeated queries, served from the
+  verdict cache.
+
+It also counts how many of the unsafe variants each validator lets through.
+
+Run from the backend folder:
+    python -m benchmarks.sql_validation --queries 2000 --repeats 5
+"""
+import argparse
+import random
+import re
+import time
+
+import sqlparse
+
+import core.sql_validator as sql_validator
+
+LEGACY_FORBIDDEN_KEYWORDS = [
+    'INSERT', 'UPDATE', 'DELETE', 'DROP', 'TRUNCATE', 'ALTER', 'CREATE',
+    'RENAME', 'GRANT', 'REVOKE', 'COMMIT', 'ROLLBACK'
+]
+
+SAFE_SHAPES = [
+    "SELECT COUNT(DISTINCT TranNo) FROM PSGTMS.DetailFile1 WHERE BatchNo = '{batch}' AND Reject = 1;",
+    "SELECT SUM(TotalTrans) FROM PSGTMS.BATCHFILE WHERE ProcessDate = '{date}';",
+    "SELECT T1.BatchNo, T1.TranNo FROM PSGTMS.DetailFile1 AS T1 WHERE T1.ProcessDate BETWEEN '{date}' AND '{date}' AND T1.Reject = 1 ORDER BY T1.BatchNo;",
+    "SELECT T3.RejDesc FROM PSGTMS.DetailFile1 AS T1 JOIN PSGTMS.WorkSrcDesc AS T2 ON T1.WorkSrc = T2.WorkSource "
+    "JOIN PSGTMS.REJREASON AS T3 ON T1.RejectPgm = T3.PgmID AND T1.RejectReason = T3.RejID "
+    "WHERE T1.BatchNo = '{batch}' AND T1.Reject = 1 AND (T3.WSIdx = T2.WSIdx OR T3.WSIdx = 0) ORDER BY T3.WSIdx DESC;",
+    "SELECT M.UserId, M.LogDate, D.FieldName FROM PSGAuditStats.tblAuditLogMaster AS M "
+    "JOIN PSGAuditStats.tblAuditLogDetail AS D ON M.LogId = D.LogId WHERE M.BatchNo = '{batch}';",
+    "WITH Rejected AS (SELECT BatchNo, COUNT(*) AS Items FROM PSGTMS.DetailFile1 WHERE Reject = 1 GROUP BY BatchNo) "
+    "SELECT TOP 10 * FROM Rejected WHERE Items > {amount} ORDER BY Items DESC;",
+    "SELECT {column} FROM PSGTMS.BATCHFILE WHERE BatchNo IN (SELECT BatchNo FROM PSGTMS.DetailFile1 WHERE Amount > {amount});",
+]
+
+# Unsafe shapes; the ones marked with a comment slip past the original validator.
+UNSAFE_SHAPES = [
+    "DELETE FROM PSGTMS.DetailFile1 WHERE BatchNo = '{batch}';",
+    "SELECT * FROM PSGTMS.BATCHFILE; DROP TABLE PSGTMS.BATCHFILE;",
+    "SELECT * INTO #copy FROM PSGTMS.DetailFile1 WHERE BatchNo = '{batch}';",     # SELECT ... INTO
+    "SELECT 1; EXEC xp_cmdshell 'dir';",
+    "SELECT BatchNo FROM PSGTMS.BATCHFILE /* ok */; WAITFOR DELAY '0:0:30';",
+    "SELECT name FROM sys.tables WHERE name LIKE '%{batch}%';",                    # system schema
+    "SELECT * FROM OPENROWSET('SQLNCLI', 'Server=x;', 'SELECT 1');",               # linked data source
+]
+
+
+def legacy_is_safe_query(sql_query: str):
+    """The original implementation, kept here as the baseline."""
+    query_upper = sql_query.upper()
+    if not query_upper.strip().startswith('SELECT'):
+        return False, "Validation failed: Query must be a SELECT statement."
+    for keyword in LEGACY_FORBIDDEN_KEYWORDS:
+        if re.search(r'\b' + keyword + r'\b', query_upper):
+            return False, f"Validation failed: Query contains forbidden keyword '{keyword}'."
+    for stmt in sqlparse.parse(sql_query):
+        if stmt.get_type() != "SELECT":
+            return False, "Validation failed: Non-SELECT SQL detected."
+    return True, "Query is safe."
+
+
+def fill(shape: str, rng: random.Random) -> str:
+    return shape.format(
+        batch=f"{rng.randrange(10**10):010d}",
+        date=f"2025{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}",
+        amount=rng.randint(1, 5000),
+        column=rng.choice(["BatchNo", "ProcessDate", "TotalTrans", "CheckCount"]),
+    )
+
+
+def time_per_query(fn, corpus: list[str]) -> float:
+    started = time.perf_counter()
+    for sql_query in corpus:
+        fn(sql_query)
+    return (time.perf_counter() - started) / len(corpus) * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the SQL validator.")
+    parser.add_argument("--queries", type=int, default=2000, help="Distinct generated queries.")
+    parser.add_argument("--repeats", type=int, default=5, help="How often each query is validated in the cached run.")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    corpus = [fill(rng.choice(SAFE_SHAPES), rng) for _ in range(args.queries)]
+    unsafe = [fill(shape, rng) for shape in UNSAFE_SHAPES]
+
+    wrong = [q for q in corpus if not sql_validator.check_query(q)[0]]
+    if wrong:
+        raise SystemExit(f"Validator rejected a safe query: {wrong[0]}")
+
+    legacy_us = time_per_query(legacy_is_safe_query, corpus)
+    single_pass_us = time_per_query(sql_validator.check_query, corpus)
+    sql_validator.verdicts.clear()
+    cached_us = time_per_query(sql_validator.is_safe_query, corpus * args.repeats)
+
+    print(f"{len(corpus)} distinct queries")
+    print(f"{'validator':<28} | {'us/query':>9}")
+    print(f"{'original (regex + parse)':<28} | {legacy_us:>9.1f}")
+    print(f"{'single pass':<28} | {single_pass_us:>9.1f}")
+    print(f"{f'cached (x{args.repeats} repeats)':<28} | {cached_us:>9.1f}")
+    print(f"verdict cache: {sql_validator.cache_stats()}")
+
+    print(f"\nUnsafe queries let through (of {len(unsafe)}):")
+    print(f"  original:    {sum(legacy_is_safe_query(q)[0] for q in unsafe)}")
+    print(f"  single pass: {sum(sql_validator.check_query(q)[0] for q in unsafe)}")
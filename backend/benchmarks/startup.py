@@ -0,0 +1,106 @@
+# backend/benchmarks/startup.py
+"""
+Cold start benchmark: import time of `main` and time until the server is
+live, ready and fully indexed.
+
+- Import time is measured in fresh interpreters, as the app imports now
+  (pandas, numpy, sqlalchemy and openai bound lazily) and with those
+  libraries imported up front, as `main` used to.
+- The server timeline starts `uvicorn main:app` against the stub Azure OpenAI
+  server with an empty embedding store and a synthetic schema catalog, and
+  polls "/" (live), "/ready" (ready) and the "schema_index" it reports
+  (indexed), with the index built in the background and, as before, during
+  startup (SCHEMA_INDEX_IN_BACKGROUND=false).
+
+Run from the backend folder:
+    python -m benchmarks.startup --chunks 1000 --embedding-latency-ms 100
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.stub_llm import _free_port, start_stub_server
+from benchmarks.worker_memory import BACKEND_DIR, worker_env, write_schema_file
+
+EAGER_IMPORTS = "import numpy, pandas, sqlalchemy, openai; "
+
+
+def import_time_ms(env: dict, prelude: str, repeats: int) -> float:
+    """Fastest time to `import main` in a fresh interpreter, after running `prelude`."""
+    code = f"import time; t = time.perf_counter(); {prelude}import main; print((time.perf_counter() - t) * 1000)"
+    times = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+                             capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return min(times)
+
+
+def server_timeline(env: dict, cwd: Path) -> dict:
+    """Seconds from launching uvicorn until "/" answers, "/ready" is 200 and the schema index is ready."""
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", str(BACKEND_DIR), "--port", str(port)],
+        cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    timeline = {"live_s": None, "ready_s": None, "indexed_s": None}
+    try:
+        with httpx.Client(base_url=base_url, timeout=1) as client:
+            while timeline["indexed_s"] is None and time.perf_counter() - started < 600:
+                try:
+                    if timeline["live_s"] is None and client.get("/").status_code == 200:
+                        timeline["live_s"] = time.perf_counter() - started
+                    if timeline["live_s"] is not None:
+                        response = client.get("/ready")
+                        if response.status_code == 200 and timeline["ready_s"] is None:
+                            timeline["ready_s"] = time.perf_counter() - started
+                        if response.json().get("schema_index") == "ready":
+                            timeline["indexed_s"] = time.perf_counter() - started
+                except httpx.TransportError:
+                    pass  # not listening yet
+                time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    return {key: round(value, 2) if value is not None else None for key, value in timeline.items()}
+
+
+def main(args):
+    endpoint, stub = start_stub_server(chat_latency_ms=0, embedding_latency_ms=args.embedding_latency_ms)
+    try:
+        with tempfile.TemporaryDirectory() as scratch:
+            scratch = Path(scratch)
+            schema_file = scratch / "schema_description.txt"
+            write_schema_file(schema_file, args.chunks)
+            env = {**worker_env(endpoint, schema_file, str(scratch / "store")), "EMBEDDING_BATCH_SIZE": "16"}
+
+            print(f"--- Import time of main (ms, fastest of {args.repeats}) ---")
+            print(f"  lazy (now):          {import_time_ms(env, '', args.repeats):8.1f}")
+            print(f"  eager (as before):   {import_time_ms(env, EAGER_IMPORTS, args.repeats):8.1f}")
+
+            print(f"\n--- Server timeline (s), {args.chunks} chunks, empty embedding store ---")
+            print(f"{'index built':>22} | {'live':>6} | {'ready':>6} | {'indexed':>7}")
+            for label, background in (("in the background", "true"), ("during startup", "false")):
+                store = scratch / f"store-{background}"
+                timeline = server_timeline(
+                    {**env, "SCHEMA_INDEX_IN_BACKGROUND": background, "SCHEMA_EMBEDDING_CACHE_DIR": str(store)},
+                    scratch,
+                )
+                print(f"{label:>22} | {timeline['live_s']:>6} | {timeline['ready_s']:>6} | {timeline['indexed_s']:>7}")
+    finally:
+        stub.should_exit = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure import time and time-to-ready of the app.")
+    parser.add_argument("--chunks", type=int, default=1000, help="Schema chunks in the synthetic catalog.")
+    parser.add_argument("--embedding-latency-ms", type=float, default=100, help="Stub embedding latency.")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters per import measurement.")
+    main(parser.parse_args())
@@ -0,0 +1,88 @@
+# backend/benchmarks/stream_latency.py
+"""
+Time-to-first-useful-byte benchmark for /query/stream versus /query.
+
+Serves the app with uvicorn (so responses really stream) against the stub
+Azure OpenAI server and the SQLite fixture, with the result and template
+caches turned off so every request runs the full pipeline.
+
+Run from the backend folder:
+    python -m benchmarks.stream_latency --requests 20
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+import httpx
+
+from benchmarks.fixtures import build_fixture, make_engine
+from benchmarks.load_test import QUESTIONS, configure_environment
+from benchmarks.stub_llm import serve_in_thread, start_stub_server
+
+
+def start_app_server() -> tuple[str, object]:
+    """Serves `main.app` on a background thread with the fixture engines swapped in."""
+    import main
+    import core.query_executor as query_executor
+
+    engine = make_engine(*build_fixture())
+
+    async def use_fixture_engines():
+        await main.startup_task  # the schema index is built in the background
+        query_executor.engines.update(tms=engine, audit=engine)
+
+    # Registered after main's own startup handler, so it runs last.
+    main.app.router.on_startup.append(use_fixture_engines)
+    return serve_in_thread(main.app)
+
+
+def time_streaming(client: httpx.Client, question: str) -> dict:
+    marks = {}
+    started = time.perf_counter()
+    payload = {"history": [{"role": "user", "content": question}]}
+    with client.stream("POST", "/query/stream", json=payload) as response:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)["event"]
+            elapsed = (time.perf_counter() - started) * 1000
+            marks.setdefault("first_event", elapsed)
+            marks.setdefault(event, elapsed)
+    return marks
+
+
+def time_blocking(client: httpx.Client, question: str) -> float:
+    started = time.perf_counter()
+    client.post("/query", json={"history": [{"role": "user", "content": question}]})
+    return (time.perf_counter() - started) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure time to first useful byte of /query/stream.")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--chat-latency-ms", type=float, default=200)
+    parser.add_argument("--embedding-latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    endpoint, stub_server = start_stub_server(args.chat_latency_ms, args.embedding_latency_ms)
+    configure_environment(endpoint)
+    os.environ.update({"RESULT_CACHE_BACKEND": "off", "SQL_TEMPLATE_CACHE_SIZE": "0"})
+    base_url, app_server = start_app_server()
+
+    streamed, blocking = [], []
+    with httpx.Client(base_url=base_url, timeout=60) as client:
+        for i in range(args.requests):
+            question = QUESTIONS[i % len(QUESTIONS)]
+            streamed.append(time_streaming(client, question))
+            blocking.append(time_blocking(client, question))
+
+    app_server.should_exit = stub_server.should_exit = True
+
+    print("\n--- Median milliseconds from request start ---")
+    print(f"{'/query (whole response)':>28}: {statistics.median(blocking):8.1f}")
+    for mark in ["first_event", "sql", "rows", "summary_token", "done"]:
+        values = [m[mark] for m in streamed if mark in m]
+        if values:
+            print(f"{'/query/stream ' + mark:>28}: {statistics.median(values):8.1f}")
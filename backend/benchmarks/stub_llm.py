@@ -0,0 +1,211 @@
+# backend/benchmarks/stub_llm.py
+"""
+A local stand-in for the Azure OpenAI service, used by the benchmarks.
+
+It serves the two deployment routes the bot calls (chat completions and
+embeddings) with deterministic canned answers and a configurable artificial
+latency, so the pipeline can be load tested without network or API quota.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import socket
+import threading
+import time
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+EMBEDDING_DIM = 256
+
+# Canned SQL answers, picked by the first keyword found in the user's question.
+CANNED_SQL = [
+    ("reject", "SELECT BatchNo, TranNo FROM PSGTMS.DetailFile1 WHERE BatchNo = '0000513258' AND Reject = 1;"),
+    ("status", "SELECT T2.BatchValueDesc FROM PSGTMS.BATCHFILE AS T1 JOIN PSGTMS.TDF_BatchValues AS T2 ON T1.BatchValue = T2.BatchValue WHERE T1.BatchNo = '0000513258';"),
+    ("audit", "SELECT M.Usercode, M.Action, D.FieldName FROM PSGAuditStats.tblAuditLogMaster AS M JOIN PSGAuditStats.tblAuditLogDetail AS D ON M.LogId = D.LogId WHERE M.BatchNo = '0000513258';"),
+    ("transactions", "SELECT SUM(TotalTrans) AS TotalTransactions FROM PSGTMS.BATCHFILE WHERE ProcessDate BETWEEN '20000101' AND '20991231';"),
+]
+DEFAULT_SQL = "SELECT COUNT(*) AS BatchCount FROM PSGTMS.BATCHFILE WHERE ProcessDate = '20000101';"
+# Placeholder dates in the canned SQL, replaced by the dates in the question in order.
+PLACEHOLDER_DATES = ("20000101", "20991231")
+AUDIT_WORDS = ("audit", "log", "history", "track", "update", "change")
+
+# Question (lower-cased) -> SQL to answer with instead of the canned SQL, e.g.
+# the SQL the real model generated for it (see benchmarks/replay.py).
+scripted_sql: dict[str, str] = {}
+
+chat_latency_s = 0.2
+embedding_latency_s = 0.05
+call_counts = {"chat": 0, "embeddings": 0}
+
+app = FastAPI(title="Stub Azure OpenAI")
+
+
+def embed_text(text: str) -> list[float]:
+    """A deterministic hashed bag-of-words embedding, normalized to unit length."""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        bucket = int.from_bytes(hashlib.md5(token.encode()).digest()[:4], "little") % EMBEDDING_DIM
+        vector[bucket] += 1.0
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector.tolist()
+
+
+def canned_completion(messages: list[dict]) -> str:
+    """Chooses a canned answer based on which of the bot's prompts is being sent."""
+    system_prompt = messages[0]["content"] if messages else ""
+    question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "").lower()
+
+    if "Classify the user's final question" in system_prompt:
+        return "audit_history" if any(word in question for word in AUDIT_WORDS) else "data_retrieval"
+    if "T-SQL assistant" in system_prompt:
+        if question.strip() in scripted_sql:
+            return scripted_sql[question.strip()]
+        sql = next((sql for keyword, sql in CANNED_SQL if keyword in question), DEFAULT_SQL)
+        # Answer about the batch and dates the user asked about, like the real model would.
+        batch = re.search(r"\b\d{10}\b", question)
+        if batch:
+            sql = sql.replace("0000513258", batch.group(0))
+        for placeholder, found in zip(PLACEHOLDER_DATES, re.findall(r"\b(?:19|20)\d{6}\b", question)):
+            sql = sql.replace(placeholder, found)
+        return sql
+    return "Here is the answer to your question based on the data."
+
+
+def usage_for(prompt_text: str, completion_text: str = "") -> dict:
+    prompt_tokens = len(prompt_text) // 4
+    completion_tokens = len(completion_text) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+@app.post("/openai/deployments/{deployment}/chat/completions")
+async def chat_completions(deployment: str, request: Request):
+    body = await request.json()
+    call_counts["chat"] += 1
+    content = canned_completion(body.get("messages", []))
+    prompt_text = "".join(m.get("content") or "" for m in body.get("messages", []))
+    if body.get("stream"):
+        usage = usage_for(prompt_text, content) if (body.get("stream_options") or {}).get("include_usage") else None
+        return StreamingResponse(_stream_chunks(deployment, content, usage), media_type="text/event-stream")
+
+    await asyncio.sleep(chat_latency_s)
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": deployment,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": usage_for(prompt_text, content),
+    }
+
+
+async def _stream_chunks(deployment: str, content: str, usage: dict | None = None):
+    """
+    Server-sent events in the chat.completion.chunk format, one word per
+    chunk, then a chunk with no choices and the `usage` if it is given.
+    """
+    words = content.split(" ")
+    # Spread the latency: the first token arrives after a quarter of it.
+    await asyncio.sleep(chat_latency_s / 4)
+    for i, word in enumerate(words):
+        chunk = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": deployment,
+            "choices": [{
+                "index": 0,
+                "delta": {"content": word if i == 0 else " " + word},
+                "finish_reason": None,
+            }],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(chat_latency_s * 3 / 4 / len(words))
+    if usage is not None:
+        chunk = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": deployment,
+            "choices": [],
+            "usage": usage,
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/openai/deployments/{deployment}/embeddings")
+async def embeddings(deployment: str, request: Request):
+    body = await request.json()
+    call_counts["embeddings"] += 1
+    await asyncio.sleep(embedding_latency_s)
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    return {
+        "object": "list",
+        "model": deployment,
+        "data": [
+            {"object": "embedding", "index": i, "embedding": embed_text(text)}
+            for i, text in enumerate(inputs)
+        ],
+        "usage": usage_for("".join(inputs)),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_in_thread(asgi_app) -> tuple[str, uvicorn.Server]:
+    """
+    Serves an ASGI app with uvicorn on a free local port, on a background thread.
+
+    Returns:
+        tuple: (base_url, server) - set `server.should_exit = True` to stop it.
+    """
+    port = _free_port()
+    config = uvicorn.Config(asgi_app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}", server
+
+
+def start_stub_server(chat_latency_ms: float = 200, embedding_latency_ms: float = 50):
+    """
+    Starts the stub server on a background thread.
+
+    Returns:
+        tuple: (base_url, server) - the endpoint to use as AZURE_OPENAI_ENDPOINT
+               and the uvicorn server (set `server.should_exit = True` to stop it).
+    """
+    global chat_latency_s, embedding_latency_s
+    chat_latency_s = chat_latency_ms / 1000
+    embedding_latency_s = embedding_latency_ms / 1000
+    return serve_in_thread(app)
+
+
+if __name__ == "__main__":
+    base_url, _ = start_stub_server()
+    print(f"Stub Azure OpenAI server running at {base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
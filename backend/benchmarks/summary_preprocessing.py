@@ -0,0 +1,74 @@
+# backend/benchmarks/summary_preprocessing.py
+"""
+Microbenchmark for the result pre-processing done before summarization.
+
+Builds BatchNo/TranNo results of increasing size (items of consecutive
+transactions, with some rows missing) and a generic text/number result, and
+compares the original per-batch Python loop and whole-frame to_string()
+with `result_analyzer.preprocess_result`. Reports time and text size.
+
+Run from the backend folder:
+    python -m benchmarks.summary_preprocessing --rows 1000 100000 500000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import core.result_analyzer as result_analyzer
+
+
+def legacy_breakdown(df: pd.DataFrame) -> str:
+    """The original implementation, kept here as the baseline."""
+    grouped = df.groupby('BatchNo')['TranNo'].unique()
+    summary_lines = [
+        f"A total of {len(df)} items were found, belonging to {df['TranNo'].nunique()} unique transactions across {len(grouped)} batches.",
+        "Here is the breakdown:"
+    ]
+    for batch_no, tran_nos in grouped.items():
+        tran_list = ", ".join(map(str, sorted(tran_nos)))
+        summary_lines.append(
+            f"- For batch number {batch_no}, there were {len(tran_nos)} transactions with the numbers: {tran_list}."
+        )
+    return "\n".join(summary_lines)
+
+
+def breakdown_frame(rows: int, rng) -> pd.DataFrame:
+    items_per_batch = 400
+    batch_index = np.arange(rows) // items_per_batch
+    frame = pd.DataFrame({
+        "BatchNo": pd.Series(batch_index + 513258).map("{:010d}".format),
+        "TranNo": np.arange(rows) % items_per_batch // 2 + 1,
+    })
+    return frame[rng.random(rows) > 0.05].reset_index(drop=True)
+
+
+def generic_frame(rows: int, rng) -> pd.DataFrame:
+    return pd.DataFrame({
+        "RejDesc": rng.choice(["Invalid Amount", "Missing Signature", "Stale Date"], rows),
+        "Amount": rng.random(rows) * 5000,
+    })
+
+
+def timed(fn, frame) -> tuple[float, int]:
+    started = time.perf_counter()
+    text = fn(frame)
+    return (time.perf_counter() - started) * 1000, len(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark result pre-processing for summaries.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 100_000, 500_000])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'result':>9} | {'rows':>8} | {'original (ms)':>13} | {'chars':>10} | {'new (ms)':>9} | {'chars':>6}")
+    for rows in args.rows:
+        for name, frame, legacy in (
+            ("breakdown", breakdown_frame(rows, rng), legacy_breakdown),
+            ("generic", generic_frame(rows, rng), lambda df: df.to_string()),
+        ):
+            legacy_ms, legacy_chars = timed(legacy, frame)
+            new_ms, new_chars = timed(result_analyzer.preprocess_result, frame)
+            print(f"{name:>9} | {len(frame):>8} | {legacy_ms:>13.1f} | {legacy_chars:>10} | {new_ms:>9.1f} | {new_chars:>6}")
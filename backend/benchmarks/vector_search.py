@@ -0,0 +1,78 @@
+# backend/benchmarks/vector_search.py
+"""
+Microbenchmark for schema similarity search.
+
+Compares the original per-row cosine loop + full argsort, the exact
+normalized matrix search, and the approximate IVF index, at several catalog
+sizes.
+
+Run from the backend folder:
+    python -m benchmarks.vector_search --sizes 10 1000 100000 --dim 1536
+"""
+import argparse
+import time
+
+import numpy as np
+
+import core.vector_index as vector_index
+
+
+def cosine_similarity(vec1, vec2):
+    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+
+
+def loop_search(embeddings: list, query, k: int):
+    """The original implementation, kept here as the baseline."""
+    similarity_scores = [cosine_similarity(query, emb) for emb in embeddings]
+    return np.argsort(similarity_scores)[-k:][::-1]
+
+
+def time_per_call(fn, repeats: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def run(size: int, dim: int, k: int, queries: int, rng):
+    # Clustered synthetic data, so the IVF index sees realistic structure.
+    centers = rng.standard_normal((max(1, size // 50), dim)).astype(np.float32)
+    raw = centers[rng.integers(0, len(centers), size)] + 0.3 * rng.standard_normal((size, dim)).astype(np.float32)
+    matrix = vector_index.normalize_rows(raw)
+    raw_queries = raw[rng.integers(0, size, queries)] + 0.1 * rng.standard_normal((queries, dim)).astype(np.float32)
+    query_rows = vector_index.normalize_rows(raw_queries)
+
+    row_lists = [row.tolist() for row in raw] if size <= 10_000 else list(raw)
+    loop_repeats = max(1, min(queries, 50_000 // size))
+    loop_ms = time_per_call(lambda: loop_search(row_lists, raw_queries[0], k), loop_repeats)
+    exact_ms = time_per_call(lambda: vector_index.search_exact(matrix, query_rows[0], k), queries)
+
+    result = {"size": size, "loop_ms": loop_ms, "exact_ms": exact_ms, "ivf_ms": None, "ivf_recall": None}
+    if size >= 1000:
+        started = time.perf_counter()
+        index = vector_index.IVFIndex(matrix)
+        result["ivf_build_s"] = time.perf_counter() - started
+        result["ivf_ms"] = time_per_call(lambda: index.search(query_rows[0], k), queries)
+        hits = sum(
+            len(set(index.search(q, k)) & set(vector_index.search_exact(matrix, q, k)))
+            for q in query_rows
+        )
+        result["ivf_recall"] = hits / (k * len(query_rows))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark schema similarity search.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100_000])
+    parser.add_argument("--dim", type=int, default=1536, help="Embedding dimension (ada-002 is 1536).")
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'chunks':>8} | {'loop (ms)':>10} | {'exact (ms)':>10} | {'ivf (ms)':>9} | {'ivf recall':>10}")
+    for size in args.sizes:
+        r = run(size, args.dim, args.k, args.queries, rng)
+        ivf_ms = f"{r['ivf_ms']:.3f}" if r["ivf_ms"] is not None else "-"
+        recall = f"{r['ivf_recall']:.2f}" if r["ivf_recall"] is not None else "-"
+        print(f"{size:>8} | {r['loop_ms']:>10.3f} | {r['exact_ms']:>10.3f} | {ivf_ms:>9} | {recall:>10}")
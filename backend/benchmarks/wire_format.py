@@ -0,0 +1,123 @@
+# backend/benchmarks/wire_format.py
+"""
+Benchmark for the wire format of /query results.
+
+Serves a synthetic DetailFile1-like result through the real /query endpoint
+(with the pipeline replaced by one that yields the result directly) and
+through the original endpoint, which returned the rows as records via the
+response_model. Reports server time per request, bytes on the wire and the
+time to decode the body back into a DataFrame, for records and columnar
+rows, uncompressed and compressed.
+
+Run from the backend folder:
+    python -m benchmarks.wire_format --rows 1000 10000 50000
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+from fastapi import FastAPI
+
+import core.response_format as response_format
+import main
+
+SUMMARY = "Here is the answer to your question based on the data."
+SQL = "SELECT TOP (50000) * FROM PSGTMS.DetailFile1 WHERE BatchNo = '0000513258'"
+
+
+def result_frame(rows: int, rng) -> pd.DataFrame:
+    amounts = rng.random(rows) * 5000
+    amounts[rng.random(rows) < 0.05] = np.nan
+    return pd.DataFrame({
+        "DetailKey": np.arange(rows) + 1,
+        "BatchNo": pd.Series(np.arange(rows) // 400 + 513258).map("{:010d}".format),
+        "TranNo": np.arange(rows) % 400 // 2 + 1,
+        "Amount": amounts.round(2),
+        "Reject": rng.random(rows) < 0.1,
+        "RejDesc": rng.choice(["Invalid Amount", "Missing Signature", None], rows),
+        "ProcessDate": pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(rows) % 30, unit="D"),
+    })
+
+
+def baseline_app(frame: pd.DataFrame) -> FastAPI:
+    """The original endpoint, kept here as the baseline."""
+    app = FastAPI()
+
+    @app.post("/query", response_model=main.QueryResponse)
+    async def process_query(request: main.QueryRequest):
+        query_result = []
+        for start in range(0, max(len(frame), 1), main.ROW_BATCH_SIZE):
+            query_result.extend(frame.iloc[start:start + main.ROW_BATCH_SIZE].to_dict(orient='records'))
+        return main.QueryResponse(summary=SUMMARY, sql_query=SQL, query_result=query_result, total_rows=len(frame))
+
+    return app
+
+
+def use_frame(frame: pd.DataFrame):
+    """Replaces the pipeline of `main` with one that answers with `frame`."""
+    async def pipeline(history, timings, stream_summary=False, row_format="records", row_batch_size=None):
+        yield "sql", {"sql_query": SQL}
+        for event in main.row_events(frame, row_format, row_batch_size):
+            yield event
+        yield "summary", {"summary": SUMMARY}
+
+    main.run_query_pipeline = pipeline
+    # Nothing else needs starting up for this pipeline.
+    main.startup_status["status"] = "ready"
+
+
+def decode(body: dict) -> pd.DataFrame:
+    """Rebuilds the result like the frontend does."""
+    if "data" in body:
+        frame = pd.DataFrame(dict(enumerate(body["data"])))
+        frame.columns = body["columns"]
+        return frame
+    return pd.DataFrame(body["query_result"])
+
+
+async def measure(app, params: dict, accept_encoding: str, repeats: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    headers = {"Accept-Encoding": accept_encoding}
+    payload = {"history": [{"role": "user", "content": "show the items of batch 0000513258"}]}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+        server_ms, decode_ms = [], []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            response = await client.post("/query", params=params, json=payload)
+            await response.aread()
+            server_ms.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            decode(response.json())
+            decode_ms.append((time.perf_counter() - started) * 1000)
+    response.raise_for_status()
+    return {
+        "server_ms": min(server_ms),
+        "wire_kb": response.num_bytes_downloaded / 1024,
+        "decode_ms": min(decode_ms),
+    }
+
+
+async def main_async(args):
+    rng = np.random.default_rng(0)
+    encodings = ["identity", "gzip"] + (["zstd"] if response_format.zstandard is not None else [])
+    print(f"{'rows':>8} | {'format':>8} | {'encoding':>8} | {'server (ms)':>11} | {'wire (KB)':>9} | {'decode (ms)':>11}")
+    for rows in args.rows:
+        frame = result_frame(rows, rng)
+        use_frame(frame)
+        cases = [("original", "identity", baseline_app(frame), {})]
+        cases += [(row_format, encoding, main.app, {"format": row_format})
+                  for row_format in ("records", "columnar") for encoding in encodings]
+        for label, encoding, app, params in cases:
+            result = await measure(app, params, encoding, args.repeats)
+            print(f"{rows:>8} | {label:>8} | {encoding:>8} | {result['server_ms']:>11.1f} | "
+                  f"{result['wire_kb']:>9.1f} | {result['decode_ms']:>11.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the wire formats of /query results.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 50000], help="Result sizes to try.")
+    parser.add_argument("--repeats", type=int, default=3, help="Requests per case; the fastest is reported.")
+    asyncio.run(main_async(parser.parse_args()))
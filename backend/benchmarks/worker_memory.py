@@ -0,0 +1,174 @@
+# backend/benchmarks/worker_memory.py
+"""
+Memory and startup cost of the schema index with several uvicorn workers.
+
+Starts `uvicorn main:app --workers N` against the stub Azure OpenAI server,
+with a synthetic schema catalog, in three modes:
+    - per-worker: no usable embedding store, so every worker embeds the
+      catalog itself and keeps its own in-memory copy of the index (how the
+      bot started before the shared store),
+    - shared:     the workers start with an empty store; the first one
+      embeds and saves it while the others wait, then all memory-map it,
+    - preloaded:  the store is built beforehand with
+      `python -m core.schema_retriever`; no worker calls the embeddings API.
+
+For each mode it reports the embeddings API calls, the time until every
+worker finished starting, and each worker's RSS and PSS. PSS (proportional
+set size) splits shared pages between the processes that map them, so it is
+the fair per-worker share. Reads /proc, so it only runs on Linux.
+
+Run from the backend folder:
+    python -m benchmarks.worker_memory --workers 4 --chunks 5000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks import stub_llm
+from benchmarks.stub_llm import _free_port, start_stub_server
+
+BACKEND_DIR = Path(__file__).parent.parent
+MODES = ("per-worker", "shared", "preloaded")
+
+
+def write_schema_file(path: Path, chunks: int):
+    """A synthetic catalog of `chunks` table descriptions."""
+    parts = [
+        f"Table: SYNTH.Table{i}\nDescription: Synthetic table {i} with batch, item and amount columns "
+        f"for reconciliation report {i % 97}.\nColumns: BatchNo, ItemNo{i % 13}, Amount, ProcessDate"
+        for i in range(chunks)
+    ]
+    path.write_text("\n---\n".join(parts), encoding="utf-8")
+
+
+def worker_env(endpoint: str, schema_file: Path, store_dir: str) -> dict:
+    return {
+        **os.environ,
+        "AZURE_OPENAI_ENDPOINT": endpoint,
+        "AZURE_OPENAI_API_KEY": "stub-key",
+        "AZURE_API_VERSION": "2024-02-01",
+        "AZURE_OPENAI_MODEL_NAME": "stub-chat",
+        "AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME": "stub-embedding",
+        "DATABASE_URL_TMS": "sqlite://",
+        "DATABASE_URL_AUDIT": "sqlite://",
+        "SCHEMA_DESCRIPTION_FILE": str(schema_file),
+        "SCHEMA_EMBEDDING_CACHE_DIR": store_dir,
+        "EMBEDDING_BATCH_SIZE": "256",
+        "ANN_INDEX_THRESHOLD": "1000000000",  # measure the embedding matrix alone
+        "LOCAL_INTENT_ENABLED": "false",  # its training examples are embedded by every worker
+        "PYTHONPATH": str(BACKEND_DIR),
+    }
+
+
+def memory_kb(pid: int) -> dict:
+    """Rss and Pss of a process, in kB, from /proc/<pid>/smaps_rollup."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key] = int(rest.split()[0])
+    return values
+
+
+def worker_pids(master_pid: int) -> list[int]:
+    """The uvicorn worker processes (not multiprocessing's helper processes)."""
+    pids = []
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        for pid in map(int, f.read().split()):
+            with open(f"/proc/{pid}/cmdline", "rb") as cmdline:
+                if b"resource_tracker" not in cmdline.read():
+                    pids.append(pid)
+    return pids
+
+
+def run_mode(mode: str, workers: int, endpoint: str, schema_file: Path, scratch: Path) -> dict:
+    # A path under a regular file can never be created, so the store is unusable.
+    store_dir = str(scratch / "not-a-dir" / "store") if mode == "per-worker" else str(scratch / f"store-{mode}")
+    (scratch / "not-a-dir").touch()
+    env = worker_env(endpoint, schema_file, store_dir)
+    calls_before = stub_llm.call_counts["embeddings"]
+
+    if mode == "preloaded":
+        subprocess.run([sys.executable, "-m", "core.schema_retriever"], cwd=scratch, env=env,
+                       check=True, stdout=subprocess.DEVNULL)
+    preload_calls = stub_llm.call_counts["embeddings"] - calls_before
+
+    port = _free_port()
+    started = time.perf_counter()
+    # The workers' logs go to the scratch folder (the working directory).
+    master = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", str(BACKEND_DIR),
+         "--workers", str(workers), "--port", str(port), "--log-level", "info"],
+        cwd=scratch, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    ready = threading.Event()
+    startups = 0
+
+    def watch_output():
+        nonlocal startups
+        for line in master.stderr:
+            if "Application startup complete" in line:
+                startups += 1
+                if startups == workers:
+                    ready.set()
+
+    threading.Thread(target=watch_output, daemon=True).start()
+    try:
+        if not ready.wait(timeout=600):
+            raise RuntimeError(f"Only {startups} of {workers} workers started.")
+        ready_s = time.perf_counter() - started
+        time.sleep(1)  # let the workers settle after startup
+        memory = [memory_kb(pid) for pid in worker_pids(master.pid)]
+    finally:
+        master.terminate()
+        master.wait(timeout=60)
+
+    return {
+        "mode": mode,
+        "embedding_calls": stub_llm.call_counts["embeddings"] - calls_before - preload_calls,
+        "preload_calls": preload_calls,
+        "ready_s": round(ready_s, 2),
+        "rss_mb": [round(m["Rss"] / 1024, 1) for m in memory],
+        "pss_mb": [round(m["Pss"] / 1024, 1) for m in memory],
+    }
+
+
+def main(args):
+    if not Path("/proc/self/smaps_rollup").exists():
+        print("This benchmark reads /proc/<pid>/smaps_rollup and only runs on Linux.")
+        return
+
+    stub_llm.EMBEDDING_DIM = args.dim
+    endpoint, server = start_stub_server(chat_latency_ms=0, embedding_latency_ms=args.embedding_latency_ms)
+    matrix_mb = args.chunks * args.dim * 4 / 1024 / 1024
+    print(f"{args.workers} workers, {args.chunks} chunks x {args.dim} dims "
+          f"({matrix_mb:.1f} MB of float32 embeddings)\n")
+    print(f"{'mode':>11} | {'embed calls':>11} | {'preload':>7} | {'ready s':>7} | {'RSS MB per worker':>28} | {'PSS MB per worker':>28}")
+    try:
+        with tempfile.TemporaryDirectory() as scratch:
+            scratch = Path(scratch)
+            schema_file = scratch / "schema_description.txt"
+            write_schema_file(schema_file, args.chunks)
+            for mode in args.modes:
+                r = run_mode(mode, args.workers, endpoint, schema_file, scratch)
+                rss = ", ".join(f"{v:g}" for v in r["rss_mb"])
+                pss = ", ".join(f"{v:g}" for v in r["pss_mb"])
+                print(f"{r['mode']:>11} | {r['embedding_calls']:>11} | {r['preload_calls']:>7} | {r['ready_s']:>7} | {rss:>28} | {pss:>28}")
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-worker memory of the schema index with several workers.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunks", type=int, default=5000, help="Schema chunks in the synthetic catalog.")
+    parser.add_argument("--dim", type=int, default=1536, help="Embedding dimensions.")
+    parser.add_argument("--embedding-latency-ms", type=float, default=50, help="Stub embedding latency.")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    main(parser.parse_args())
@@ -0,0 +1,139 @@
+# backend/core/cache.py
+"""
+Small in-process caches with hit/miss counters.
+
+- `LRUCache`: a bounded, thread-safe least-recently-used mapping.
+- `SemanticCache`: maps an embedding to a value stored for any previous
+  embedding whose cosine similarity is above a threshold.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+_MISSING = object()
+
+
+class LRUCache:
+    """A bounded least-recently-used cache that counts hits and misses."""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        """Membership test that neither counts as a lookup nor refreshes the entry."""
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SemanticCache:
+    """
+    A bounded cache keyed on normalized embeddings instead of exact keys.
+
+    A lookup returns the value of the most similar stored embedding if its
+    cosine similarity is at least `threshold`. When full, the oldest entry is
+    overwritten.
+    """
+
+    def __init__(self, threshold: float = 0.97, max_size: int = 512):
+        self.threshold = threshold
+        self.max_size = max_size
+        self._vectors = None
+        self._values = [None] * max_size
+        self._count = 0
+        self._next_slot = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, embedding: np.ndarray, default=None):
+        with self._lock:
+            if self._count:
+                scores = self._vectors[:self._count] @ embedding
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    return self._values[best]
+            self.misses += 1
+            return default
+
+    def set(self, embedding: np.ndarray, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, len(embedding)), dtype=np.float32)
+            slot = self._next_slot
+            self._vectors[slot] = embedding
+            self._values[slot] = value
+            self._next_slot = (slot + 1) % self.max_size
+            self._count = min(self._count + 1, self.max_size)
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._values = [None] * self.max_size
+            self._count = 0
+            self._next_slot = 0
+
+    def __len__(self):
+        return self._count
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": self._count,
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,333 @@
+# backend/core/date_resolver.py
+"""
+Resolves the date expressions in a question to explicit dates.
+
+Every date expression in the question is replaced, in one pass of a single
+compiled pattern, with "on the date YYYYMMDD" or "between the dates YYYYMMDD
+and YYYYMMDD". Those are the formats of the char(8) ProcessDate and WorkDate
+columns, so the model can compare the columns with plain string literals
+(`ProcessDate BETWEEN '20251001' AND '20251031'`), and the SQL template
+cache binds them as string parameters. Comparing the columns with an int or
+a date expression (`ProcessDate = CONVERT(int, ...)`) makes SQL Server
+convert every row's ProcessDate first, which turns the index seek into a
+scan.
+
+Understood expressions (case-insensitive, an optional leading "on", "in",
+"for", "during", "over", "within" and/or "the" is replaced as well):
+    - today, yesterday, the day before yesterday, N days/weeks ago
+    - this/current/last/previous week, month, quarter or year; year/month to date
+    - last/past N days, weeks or months (ending today), past week/month;
+      without a count, last/previous/past day is yesterday
+    - last <weekday>
+    - Q3, Q3 2025, 2025 Q3, third quarter (of) 2025
+    - 2025-10-17, 10/17/2025, October 17(, 2025), 17 October 2025, 20251017
+    - October 2025; "in October" (only after a preposition); "in 2025" or
+      "during 2025" (a bare year only after "in"/"during", and not when a
+      decimal point, digits or a counted noun follow: "over 2000
+      transactions", "in 2024.50" and "for 2021 batches" are numbers);
+      "in 2024 and 2025" or "in 2023, 2024 or 2025" (each year on its own)
+    - between/from <expression> and/to/until/through <expression>, since <expression>
+
+Dates without a year are the latest such date that is not in the future.
+"""
+import re
+from calendar import monthrange
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+# The format of the char(8) date columns (ProcessDate, WorkDate).
+DATE_FORMAT = "%Y%m%d"
+
+
+@dataclass(frozen=True)
+class DateRange:
+    """The first and last day (inclusive) an expression in the question refers to."""
+    start: date
+    end: date
+    phrase: str
+
+    @property
+    def bounds(self) -> tuple[str, str]:
+        """The start and end as YYYYMMDD strings, comparable with the char(8) date columns."""
+        return self.start.strftime(DATE_FORMAT), self.end.strftime(DATE_FORMAT)
+
+    def describe(self) -> str:
+        start, end = self.bounds
+        return f"on the date {start}" if start == end else f"between the dates {start} and {end}"
+
+
+@dataclass(frozen=True)
+class ResolvedQuestion:
+    text: str
+    ranges: tuple[DateRange, ...]
+
+
+# --- Vocabulary ---
+
+MONTHS = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "mar": 3, "april": 4, "apr": 4,
+    "may": 5, "june": 6, "jun": 6, "july": 7, "jul": 7, "august": 8, "aug": 8,
+    "september": 9, "sept": 9, "sep": 9, "october": 10, "oct": 10, "november": 11, "nov": 11,
+    "december": 12, "dec": 12,
+}
+WEEKDAYS = {"monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6}
+NUMBER_WORDS = {
+    "a": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fourteen": 14, "thirty": 30,
+}
+QUARTER_WORDS = {"first": 1, "1st": 1, "second": 2, "2nd": 2, "third": 3, "3rd": 3, "fourth": 4, "4th": 4}
+
+
+def _alternatives(words) -> str:
+    # Longest first, so "sept" wins over "sep" and "september" over both.
+    return "|".join(sorted(map(re.escape, words), key=len, reverse=True))
+
+
+_MONTH = _alternatives(MONTHS)
+_NUMBER = rf"\d{{1,3}}|{_alternatives(NUMBER_WORDS)}"
+_YEAR = r"(?:19|20)\d{2}"
+
+
+def _expression(s: str) -> str:
+    """
+    The pattern of a single date expression. Its group names end in `s`, so
+    the same expression can appear several times in one pattern (the two
+    ends of a range).
+    """
+    return rf"""(?:
+        (?P<day_before{s}>day\s+before\s+yesterday)
+      | (?P<yesterday{s}>yesterday)
+      | (?P<today{s}>today)
+      | (?P<to_date{s}>(?P<to_date_unit{s}>year|month)[\s-]+to[\s-]+date|(?P<to_date_short{s}>ytd|mtd))
+      | (?P<period{s}>(?P<period_which{s}>this|current|last|previous|prior)\s+(?P<period_unit{s}>week|month|quarter|year))
+      | (?P<rolling{s}>(?:last|past|previous|prior)\s+(?:(?P<rolling_n{s}>{_NUMBER})\s+)?(?P<rolling_unit{s}>days?|weeks?|months?))
+      | (?P<ago{s}>(?P<ago_n{s}>{_NUMBER})\s+(?P<ago_unit{s}>days?|weeks?)\s+ago)
+      | (?P<weekday{s}>(?:last|previous|past)\s+(?P<weekday_name{s}>{_alternatives(WEEKDAYS)}))
+      | (?P<quarter{s}>
+            q(?P<quarter_n{s}>[1-4])(?:\s*(?:of\s+)?(?P<quarter_year{s}>{_YEAR}))?
+          | (?P<quarter_year_first{s}>{_YEAR})\s*q(?P<quarter_n_last{s}>[1-4])
+          | (?P<quarter_word{s}>{_alternatives(QUARTER_WORDS)})\s+quarter(?:\s+(?:of\s+)?(?P<quarter_word_year{s}>{_YEAR}))?)
+      | (?P<iso{s}>(?P<iso_y{s}>{_YEAR})[-/](?P<iso_m{s}>\d{{1,2}})[-/](?P<iso_d{s}>\d{{1,2}}))
+      | (?P<us{s}>(?P<us_m{s}>\d{{1,2}})/(?P<us_d{s}>\d{{1,2}})/(?P<us_y{s}>{_YEAR}))
+      | (?P<compact{s}>(?P<compact_y{s}>{_YEAR})(?P<compact_m{s}>0[1-9]|1[0-2])(?P<compact_d{s}>0[1-9]|[12]\d|3[01]))
+      | (?P<month_day{s}>(?P<md_month{s}>{_MONTH})\.?\s+(?P<md_d{s}>\d{{1,2}})(?:st|nd|rd|th)?\b(?:,?\s+(?P<md_y{s}>{_YEAR}))?)
+      | (?P<day_month{s}>(?P<dm_d{s}>\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<dm_month{s}>{_MONTH})\b(?!\s+(?:be|have|not)\b)\.?(?:,?\s+(?P<dm_y{s}>{_YEAR}))?)
+      | (?P<month_year{s}>(?P<my_month{s}>{_MONTH})\.?,?\s+(?P<my_y{s}>{_YEAR}))
+      | (?P<month{s}>{_MONTH})
+      | (?P<year{s}>(?:(?P<year_word{s}>the\s+year)\s+)?(?P<year_y{s}>{_YEAR}))
+    )"""
+
+
+# Prepositions after which a bare year is a date ("in 2025"); after "over" or
+# "for" it is usually a count or an amount ("over 2000 transactions").
+YEAR_PREPOSITIONS = {"in", "during"}
+# What follows a number rather than a year: a decimal part, more digits or
+# something counted ("in 2024 transactions", "in 2024.50").
+_NOT_A_YEAR = re.compile(
+    r"(?:[.,]\d|\s*(?:transactions?|trans|batch(?:es)?|rows?|items?|records?|checks?|cheques?|rejects?|"
+    r"rejections?|entries|documents?|users?|times|dollars?|usd)\b)",
+    re.IGNORECASE,
+)
+# The years before a later year of a list ("in 2024 and 2025"), which makes
+# that one a date too. Searched up to the later year only.
+_YEAR_LIST = re.compile(
+    rf"(?<!\w)(?:(?:in|during)\s+(?:the\s+year\s+)?|the\s+year\s+){_YEAR}(?:\s*,\s*{_YEAR})*"
+    r"\s*(?:,|,?\s*(?:and|or))\s*$",
+    re.IGNORECASE,
+)
+
+# Only tried at the start of a word, which halves the positions the engine
+# tries all the alternatives at (a plain \b also matches at word ends).
+DATE_PATTERN = re.compile(
+    rf"""(?<!\w)(?=\w)(?:(?P<preposition>on|in|for|during|over|within)\s+)?(?:the\s+)?(?:
+        (?P<between>(?:between|from)\s+{_expression("_a")}\s+(?:and|to|until|through|thru|-)\s+{_expression("_b")})
+      | (?P<since>since\s+{_expression("_s")})
+      | {_expression("")}
+    )\b""",
+    re.IGNORECASE | re.VERBOSE,
+)
+_KINDS = (
+    "day_before", "yesterday", "today", "to_date", "period", "rolling", "ago", "weekday", "quarter",
+    "iso", "us", "compact", "month_day", "day_month", "month_year", "month", "year",
+)
+
+
+# --- Calendar arithmetic ---
+
+def _add_months(day: date, months: int) -> date:
+    year, month = divmod(day.year * 12 + day.month - 1 + months, 12)
+    month += 1
+    return date(year, month, min(day.day, monthrange(year, month)[1]))
+
+
+def _month_range(year: int, month: int) -> tuple[date, date]:
+    return date(year, month, 1), date(year, month, monthrange(year, month)[1])
+
+
+def _quarter_range(year: int, quarter: int) -> tuple[date, date]:
+    return date(year, 3 * quarter - 2, 1), _month_range(year, 3 * quarter)[1]
+
+
+def _week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _number(text: str) -> int:
+    return int(text) if text.isdigit() else NUMBER_WORDS[text.lower()]
+
+
+def _latest(year: str | None, make, today: date) -> tuple[date, date]:
+    """make(year) for the given year, or for the latest year that does not put it in the future."""
+    if year:
+        return make(int(year))
+    start, end = make(today.year)
+    return (start, end) if start <= today else make(today.year - 1)
+
+
+def _resolve(match: re.Match, s: str, today: date) -> tuple[date, date] | None:
+    """(start, end) of the expression whose group names end in `s`, or None if it is not one."""
+    group = lambda name: match.group(name + s)
+    kind = next(kind for kind in _KINDS if group(kind) is not None)
+
+    if kind == "today":
+        return today, today
+    if kind == "yesterday":
+        return today - timedelta(days=1), today - timedelta(days=1)
+    if kind == "day_before":
+        return today - timedelta(days=2), today - timedelta(days=2)
+    if kind == "to_date":
+        unit = (group("to_date_unit") or group("to_date_short")[0]).lower()
+        return (today.replace(month=1, day=1) if unit.startswith("y") else today.replace(day=1)), today
+    if kind == "period":
+        unit = group("period_unit").lower()
+        if unit == "week":
+            start, length = _week_start(today), timedelta(days=6)
+            if group("period_which").lower() in ("this", "current"):
+                return start, today
+            return start - timedelta(days=7), start - timedelta(days=7) + length
+        if unit == "month":
+            current = _month_range(today.year, today.month)
+            previous = _add_months(current[0], -1)
+            previous = _month_range(previous.year, previous.month)
+        elif unit == "quarter":
+            quarter = (today.month - 1) // 3 + 1
+            current = _quarter_range(today.year, quarter)
+            previous = _quarter_range(today.year, quarter - 1) if quarter > 1 else _quarter_range(today.year - 1, 4)
+        else:
+            current = date(today.year, 1, 1), date(today.year, 12, 31)
+            previous = date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
+        return (current[0], today) if group("period_which").lower() in ("this", "current") else previous
+    if kind == "rolling":
+        unit = group("rolling_unit").lower()
+        if not group("rolling_n") and unit == "day":
+            # "the previous day" is the last full day, not today.
+            return today - timedelta(days=1), today - timedelta(days=1)
+        count = _number(group("rolling_n")) if group("rolling_n") else 1
+        if unit.startswith("month"):
+            return _add_months(today, -count) + timedelta(days=1), today
+        days = count * 7 if unit.startswith("week") else count
+        return today - timedelta(days=days - 1), today
+    if kind == "ago":
+        count = _number(group("ago_n"))
+        if group("ago_unit").lower().startswith("week"):
+            start = _week_start(today) - timedelta(weeks=count)
+            return start, start + timedelta(days=6)
+        return today - timedelta(days=count), today - timedelta(days=count)
+    if kind == "weekday":
+        days_ago = (today.weekday() - WEEKDAYS[group("weekday_name").lower()]) % 7 or 7
+        return today - timedelta(days=days_ago), today - timedelta(days=days_ago)
+    if kind == "quarter":
+        quarter = group("quarter_n") or group("quarter_n_last")
+        quarter = int(quarter) if quarter else QUARTER_WORDS[group("quarter_word").lower()]
+        year = group("quarter_year") or group("quarter_year_first") or group("quarter_word_year")
+        return _latest(year, lambda y: _quarter_range(y, quarter), today)
+    if kind in ("iso", "us", "compact"):
+        day = date(int(group(f"{kind}_y")), int(group(f"{kind}_m")), int(group(f"{kind}_d")))
+        return day, day
+    if kind in ("month_day", "day_month"):
+        prefix = "md" if kind == "month_day" else "dm"
+        month, day = MONTHS[group(f"{prefix}_month").lower()], int(group(f"{prefix}_d"))
+        return _latest(group(f"{prefix}_y"), lambda y: (date(y, month, day),) * 2, today)
+    if kind == "month_year":
+        return _month_range(int(group("my_y")), MONTHS[group("my_month").lower()])
+    if kind == "month":
+        if not s and match.group("preposition"):
+            return _latest(None, lambda y: _month_range(y, MONTHS[group("month").lower()]), today)
+        return None
+    if kind == "year":
+        preposition = (match.group("preposition") or "").lower()
+        if s:
+            return None
+        if not (group("year_word") or preposition in YEAR_PREPOSITIONS
+                or not preposition and _YEAR_LIST.search(match.string, 0, match.start())):
+            return None
+        if _NOT_A_YEAR.match(match.string, match.end()):
+            return None
+        year = int(group("year_y"))
+        return date(year, 1, 1), date(year, 12, 31)
+    return None
+
+
+def _bounds(match: re.Match, today: date) -> tuple[date, date] | None:
+    """(start, end) of a DATE_PATTERN match, or None if it is not a date after all."""
+    try:
+        if match.group("between") is not None:
+            start, end = _resolve(match, "_a", today), _resolve(match, "_b", today)
+            if start is None or end is None:
+                return None
+            return (start[0], end[1]) if start[0] <= end[1] else (end[0], start[1])
+        if match.group("since") is not None:
+            start = _resolve(match, "_s", today)
+            return (start[0], today) if start is not None else None
+        return _resolve(match, "", today)
+    except ValueError:  # e.g. 2025-02-30
+        return None
+
+
+# --- Public API ---
+
+def resolve_dates(question: str, today: date | None = None) -> ResolvedQuestion:
+    """
+    Replaces each date expression in `question` with the explicit date(s) it
+    refers to, relative to `today` (default: the current date).
+
+    Returns:
+        ResolvedQuestion: the rewritten text, and the range of every expression replaced.
+    """
+    today = today or date.today()
+    ranges = []
+
+    def replace(match: re.Match) -> str:
+        bounds = _bounds(match, today)
+        if bounds is None:
+            return match.group(0)
+        date_range = DateRange(bounds[0], bounds[1], match.group(0))
+        ranges.append(date_range)
+        return date_range.describe()
+
+    text = DATE_PATTERN.sub(replace, question)
+    return ResolvedQuestion(text, tuple(ranges))
+
+
+def rewrite_question(question: str, today: date | None = None) -> str:
+    """`question` with its date expressions replaced by explicit YYYYMMDD dates."""
+    return resolve_dates(question, today).text
+
+
+def mentions_date(text: str) -> bool:
+    """Whether `text` contains a date expression."""
+    today = date.today()
+    return any(_bounds(match, today) is not None for match in DATE_PATTERN.finditer(text))
+
+
+if __name__ == "__main__":
+    for question in [
+        "How many batches were processed yesterday?",
+        "Total transactions in the last 7 days",
+        "rejected items between 2025-10-01 and Oct 5, 2025",
+        "batches for Q3 2025 compared with last quarter",
+        "what changed since last monday?",
+        "May I see the status of batch 0000513258?",
+    ]:
+        resolved = resolve_dates(question, today=date(2025, 10, 17))
+        print(f"{question!r}\n  -> {resolved.text!r}\n     {[r.bounds for r in resolved.ranges]}")
@@ -0,0 +1,160 @@
+# backend/core/embedding_store.py
+"""
+Persistent, content-hash-keyed store for schema chunk embeddings.
+
+The vectors live in a single float32 `.npy` file next to a small JSON manifest
+that lists the content hash of each row. Unchanged chunks are served straight
+from the memory-mapped file, so every worker shares the same read-only pages
+and only edited chunks need to be re-embedded. Workers that start together
+take turns (`build_lock`), so only the first one calls the embeddings API.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+STORE_DIR = Path(os.getenv(
+    "SCHEMA_EMBEDDING_CACHE_DIR",
+    Path(__file__).parent.parent / "models" / "embedding_cache",
+))
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".build.lock"
+
+
+def content_hash(text: str, model_name: str) -> str:
+    """The cache key for a chunk: the embedding model plus the exact chunk text."""
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+def load() -> tuple[list[str], np.ndarray | None]:
+    """
+    Opens the stored embeddings read-only.
+
+    Returns:
+        tuple: (keys, vectors) - the content hash of each row and a memory-mapped
+               (n, dim) float32 array, or ([], None) if there is no usable store.
+    """
+    manifest_path = STORE_DIR / MANIFEST_FILE
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        vectors = np.load(STORE_DIR / manifest["vectors_file"], mmap_mode="r")
+    except (FileNotFoundError, KeyError, ValueError, OSError):
+        return [], None
+
+    keys = manifest.get("keys", [])
+    if vectors.ndim != 2 or vectors.shape[0] != len(keys):
+        print("Embedding store manifest does not match its vectors file. Ignoring it.")
+        return [], None
+    return keys, vectors
+
+
+def save(keys: list[str], vectors: np.ndarray) -> bool:
+    """
+    Atomically replaces the store with the given rows.
+
+    The vectors file name is derived from its contents, and the manifest is
+    swapped in last, so a reader never sees a half-written store.
+
+    Returns:
+        bool: True if the store was written, False if it could not be.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    digest = hashlib.sha256("".join(keys).encode("utf-8") + vectors.tobytes()).hexdigest()[:16]
+    vectors_file = f"schema_embeddings-{digest}.npy"
+
+    try:
+        STORE_DIR.mkdir(parents=True, exist_ok=True)
+        if not (STORE_DIR / vectors_file).exists():
+            _atomic_write(vectors_file, lambda f: np.save(f, vectors))
+        manifest = {"vectors_file": vectors_file, "dim": int(vectors.shape[1]), "keys": keys}
+        _atomic_write(MANIFEST_FILE, lambda f: f.write(json.dumps(manifest, indent=1).encode("utf-8")))
+    except OSError as e:
+        print(f"Could not write the embedding store at {STORE_DIR}: {e}")
+        return False
+
+    _remove_stale_vector_files(keep=vectors_file)
+    return True
+
+
+@asynccontextmanager
+async def build_lock():
+    """
+    Held by the worker that embeds and saves the store. Workers starting at
+    the same time wait for it and then find the store built, so the schemas
+    are embedded once rather than once per worker. Without a writable store
+    directory there is nothing to share and no lock is taken.
+    """
+    try:
+        STORE_DIR.mkdir(parents=True, exist_ok=True)
+        lock_file = open(STORE_DIR / LOCK_FILE, "a+b")
+    except OSError:
+        yield
+        return
+    try:
+        # Waiting for the lock blocks, so it is done off the event loop.
+        await asyncio.to_thread(_lock, lock_file)
+        try:
+            yield
+        finally:
+            _unlock(lock_file)
+    finally:
+        lock_file.close()
+
+
+def _lock(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        return
+    while True:
+        try:
+            # Locks the first byte; gives up after ~10 s, so keep trying.
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+
+def _unlock(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _atomic_write(file_name: str, write):
+    fd, tmp_path = tempfile.mkstemp(dir=STORE_DIR, prefix=f".{file_name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, STORE_DIR / file_name)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _remove_stale_vector_files(keep: str):
+    for path in STORE_DIR.glob("schema_embeddings-*.npy"):
+        if path.name != keep:
+            try:
+                path.unlink()
+            except OSError:
+                # Another worker may still have it memory-mapped; it will be
+                # cleaned up on a later save.
+                pass
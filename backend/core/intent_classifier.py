@@ -0,0 +1,210 @@
+# backend/core/intent_classifier.py
+"""
+Local intent classifier: "audit_history" or "data_retrieval" from the
+question's embedding, without a chat completion.
+
+A logistic regression over the (L2-normalized) question embedding - the same
+one schema retrieval computes and caches, so classifying costs no extra API
+call - is trained at startup from the labeled examples in
+models/intent_examples.jsonl (one {"question": ..., "intent": ...} per line).
+When its confidence is below INTENT_CONFIDENCE_THRESHOLD, `classify` returns
+None and main.py asks the LLM as before. It only decides the first question
+of a conversation (`decides`): a follow-up such as "and who changed them?"
+takes its intent from the earlier turns, which only the LLM is shown.
+
+More examples can be bootstrapped from the LLM's past decisions in the logs
+(review them before training on them):
+    python -m core.intent_classifier --bootstrap "logs/*.log"
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+import core.schema_retriever as schema_retriever
+import core.vector_index as vector_index
+from core.lazy_import import lazy_import
+from core.logger import setup_logger
+
+np = lazy_import("numpy")
+logger = setup_logger(__name__)
+
+INTENTS = ("audit_history", "data_retrieval")
+# "false" always asks the LLM, as before.
+LOCAL_INTENT_ENABLED = os.getenv("LOCAL_INTENT_ENABLED", "true").lower() == "true"
+# Lowest probability of its intent at which the local model's answer is used.
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.8"))
+INTENT_EXAMPLES_FILE = Path(os.getenv(
+    "INTENT_EXAMPLES_FILE",
+    Path(__file__).parent.parent / "models" / "intent_examples.jsonl",
+))
+# L2 penalty of the logistic regression; larger values give less confident models.
+INTENT_L2 = float(os.getenv("INTENT_L2", "0.001"))
+
+
+@dataclass(frozen=True)
+class IntentModel:
+    weights: np.ndarray
+    bias: float
+
+    def audit_probability(self, embeddings: np.ndarray) -> np.ndarray:
+        """P(audit_history) for one embedding or a matrix with a row per question."""
+        return 1 / (1 + np.exp(-(embeddings @ self.weights + self.bias)))
+
+    def predict(self, embedding: np.ndarray) -> tuple[str, float]:
+        """(intent, probability of that intent)."""
+        p = float(self.audit_probability(embedding))
+        return ("audit_history", p) if p >= 0.5 else ("data_retrieval", 1 - p)
+
+
+model: IntentModel | None = None
+decisions = {"local": 0, "not_confident": 0, "follow_up": 0}
+
+
+def load_examples(path: Path = INTENT_EXAMPLES_FILE) -> list[tuple[str, str]]:
+    """(question, intent) pairs from a JSON-lines file."""
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record["intent"] not in INTENTS:
+                    raise ValueError(f"Unknown intent {record['intent']!r} in {path}")
+                examples.append((record["question"], record["intent"]))
+    return examples
+
+
+def train(embeddings: np.ndarray, intents: list[str], l2: float = INTENT_L2, iterations: int = 500) -> IntentModel:
+    """
+    Fits the logistic regression by gradient descent. Both intents weigh the
+    same in total, however many examples each has.
+    """
+    x = np.asarray(embeddings, dtype=np.float64)
+    y = np.array([intent == "audit_history" for intent in intents], dtype=np.float64)
+    positives = y.sum()
+    if positives == 0 or positives == len(y):
+        raise ValueError("Training needs examples of both intents.")
+    sample_weights = np.where(y == 1, 0.5 / positives, 0.5 / (len(y) - positives))
+
+    weights, bias = np.zeros(x.shape[1]), 0.0
+    learning_rate = 2.0
+    for _ in range(iterations):
+        error = (1 / (1 + np.exp(-(x @ weights + bias))) - y) * sample_weights
+        weights -= learning_rate * (x.T @ error + l2 * weights)
+        bias -= learning_rate * error.sum()
+    return IntentModel(weights.astype(np.float32), float(bias))
+
+
+async def embed(questions: list[str]) -> np.ndarray:
+    """Normalized embeddings of the questions, in one embeddings call."""
+    return vector_index.normalize_rows(await schema_retriever.get_embeddings(questions, batch_size=len(questions)))
+
+
+async def build():
+    """Trains the model on the labeled examples (needs schema_retriever's client)."""
+    global model
+    examples = load_examples()
+    embeddings = await embed([question for question, _ in examples])
+    model = train(embeddings, [intent for _, intent in examples])
+    print(f"Trained the intent classifier on {len(examples)} examples.")
+
+
+def ready() -> bool:
+    return LOCAL_INTENT_ENABLED and model is not None
+
+
+def decides(history: list[dict[str, str]]) -> bool:
+    """Whether the local model may decide the intent of this conversation's last question."""
+    if not ready():
+        return False
+    if len(history) > 1:
+        decisions["follow_up"] += 1
+        return False
+    return True
+
+
+def classify(question_embedding: np.ndarray) -> str | None:
+    """
+    The intent of a question, from its normalized embedding, or None if the
+    model is not trained or not confident enough (then ask the LLM).
+    """
+    if not ready():
+        return None
+    intent, confidence = model.predict(question_embedding)
+    if confidence < INTENT_CONFIDENCE_THRESHOLD:
+        decisions["not_confident"] += 1
+        logger.info(f"Local intent '{intent}' not confident enough ({confidence:.2f}); asking the LLM.")
+        return None
+    decisions["local"] += 1
+    logger.info(f"Classified intent locally as: '{intent}' (confidence {confidence:.2f})")
+    return intent
+
+
+def stats() -> dict:
+    """How often the local model decided, and how often the LLM was asked instead (not confident, or a follow-up)."""
+    return {"enabled": LOCAL_INTENT_ENABLED, "trained": model is not None,
+            "threshold": INTENT_CONFIDENCE_THRESHOLD, **decisions}
+
+
+# --- Bootstrapping examples from the logs ---
+
+_QUESTION = re.compile(r"Received question: '(.*)'$", re.DOTALL)
+_LLM_INTENT = re.compile(r"Classified intent as: '(\w+)'$")
+
+
+def _log_messages(path: str):
+    """The messages of a log file, in text (LEVEL | time | name | line | message) or JSON-lines format."""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("{"):
+                try:
+                    yield json.loads(line).get("message", "")
+                    continue
+                except ValueError:
+                    pass
+            parts = line.split(" | ", 4)
+            if len(parts) == 5:
+                yield parts[4]
+
+
+def bootstrap_examples(paths: list[str]) -> list[tuple[str, str]]:
+    """
+    (question, intent) pairs the LLM decided, from the logs: each "Received
+    question" followed by a valid "Classified intent as" line. Follow-up
+    questions are labeled from their whole conversation, so review the output.
+    """
+    examples = {}
+    for path in paths:
+        question = None
+        for message in _log_messages(path):
+            if (match := _QUESTION.match(message)) is not None:
+                question = match.group(1)
+            elif (match := _LLM_INTENT.match(message)) is not None and question is not None:
+                if match.group(1) in INTENTS:
+                    examples[schema_retriever.normalize_question(question)] = (question, match.group(1))
+                question = None
+    return list(examples.values())
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description="Add the LLM's logged intent decisions to the labeled examples.")
+    parser.add_argument("--bootstrap", required=True, help='Glob of the log files, e.g. "logs/*.log".')
+    parser.add_argument("--output", default=str(INTENT_EXAMPLES_FILE), help="Examples file to append to.")
+    args = parser.parse_args()
+
+    known = set()
+    if Path(args.output).exists():
+        known = {schema_retriever.normalize_question(q) for q, _ in load_examples(Path(args.output))}
+    new = [(q, intent) for q, intent in bootstrap_examples(sorted(glob.glob(args.bootstrap)))
+           if schema_retriever.normalize_question(q) not in known]
+    with open(args.output, "a", encoding="utf-8") as f:
+        for question, intent in new:
+            f.write(json.dumps({"question": question, "intent": intent}) + "\n")
+    print(f"Added {len(new)} examples to {args.output}.")
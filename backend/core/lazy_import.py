@@ -0,0 +1,54 @@
+# backend/core/lazy_import.py
+"""
+Deferred imports for the heavy libraries (pandas, numpy, sqlalchemy).
+
+`np = lazy_import("numpy")` binds a stand-in module that imports numpy on
+the first attribute access (`np.zeros`, ...), so importing `main` - and with
+it every core module - does not pay for these libraries up front. The app
+loads them on a background thread at startup (see `main.load_libraries`),
+before any request needs them.
+
+The first access is serialized by a lock: threads that reach it together
+wait for one regular import instead of seeing a half-initialized module,
+which is what importlib.util.LazyLoader gives them before Python 3.12.
+
+Annotations that name a lazy module (`-> pd.DataFrame`) are only strings
+with `from __future__ import annotations`, which the modules using this add.
+"""
+import importlib
+import importlib.util
+import sys
+import threading
+import types
+
+
+class _LazyModule(types.ModuleType):
+    """Stands in for a module until one of its attributes is used, then mirrors it."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lazy_lock = threading.Lock()
+        self._lazy_module = None
+
+    def __getattr__(self, attr: str):
+        # Only called for attributes missing from __dict__: before the import,
+        # or for ones the module gains later (e.g. submodules).
+        module = self._lazy_module
+        if module is None:
+            with self._lazy_lock:
+                module = self._lazy_module
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__.update(module.__dict__)
+                    self._lazy_module = module
+        return getattr(module, attr)
+
+
+def lazy_import(name: str):
+    """The module `name`, imported when one of its attributes is first used."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    return _LazyModule(name)
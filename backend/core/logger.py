@@ -1,60 +1,209 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
-from datetime import datetime
+import queue
+from datetime import date, datetime, timedelta
+
+import core.tracing as tracing
 
 # --- Configuration Constants ---
 LOG_DIR = "logs"
-LOG_FILE_NAME = f"{datetime.now().strftime('%Y-%m-%d')}.log"
-LOG_PATH = os.path.join(LOG_DIR, LOG_FILE_NAME)
-LOG_LEVEL = logging.INFO
+LOG_LEVEL = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
 LOG_FORMAT = "%(levelname)s | %(asctime)s | %(name)s | %(lineno)d | %(message)s"
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Write the log file as JSON lines (one object per record) instead of LOG_FORMAT.
+LOG_JSON = os.getenv("LOG_JSON", "0").lower() in ("1", "true", "yes")
+# A day's file is continued in <date>.1.log, <date>.2.log, ... past this size.
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+# Log files older than this many days are deleted at midnight. 0 (the
+# default) keeps them all: the logs are the replay corpus
+# (benchmarks/replay.py) and the source of the intent examples.
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "0"))
+# Longer messages (whole schemas, long SQL, summaries) are cut to this length.
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+# Records waiting to be written; when the queue is full new records are dropped
+# (and counted) rather than making the request wait.
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+
+def log_file_path(day: date, part: int = 0) -> str:
+    """logs/2024-05-01.log, then logs/2024-05-01.1.log, ... once a file is full."""
+    suffix = f".{part}" if part else ""
+    return os.path.join(LOG_DIR, f"{day:%Y-%m-%d}{suffix}.log")
+
+
+class DailyFileHandler(logging.FileHandler):
+    """
+    Writes to the file of the current day, switching to a new one at
+    midnight or when the file reaches LOG_MAX_BYTES, and deletes files older
+    than LOG_RETENTION_DAYS if that is set.
+    """
+
+    def __init__(self):
+        self.day = date.today()
+        self.part = self._last_part(self.day)
+        self.next_midnight = self._midnight_after(self.day)
+        super().__init__(log_file_path(self.day, self.part), mode='a', encoding='utf-8')
+
+    @staticmethod
+    def _midnight_after(day: date) -> float:
+        return datetime.combine(day + timedelta(days=1), datetime.min.time()).timestamp()
+
+    @staticmethod
+    def _last_part(day: date) -> int:
+        part = 0
+        while os.path.exists(log_file_path(day, part + 1)):
+            part += 1
+        return part
+
+    def emit(self, record):
+        if record.created >= self.next_midnight:
+            self.day = date.fromtimestamp(record.created)
+            self.part = self._last_part(self.day)
+            self.next_midnight = self._midnight_after(self.day)
+            self._switch_file()
+            self._delete_old_files()
+        elif LOG_MAX_BYTES and self.stream is not None and self.stream.tell() >= LOG_MAX_BYTES:
+            self.part += 1
+            self._switch_file()
+        super().emit(record)
+
+    def _switch_file(self):
+        self.close()
+        self.baseFilename = os.path.abspath(log_file_path(self.day, self.part))
+        self.stream = None  # reopened by FileHandler.emit
+
+    def _delete_old_files(self):
+        if LOG_RETENTION_DAYS <= 0:
+            return
+        cutoff = f"{self.day - timedelta(days=LOG_RETENTION_DAYS):%Y-%m-%d}"
+        for name in os.listdir(LOG_DIR):
+            # File names start with the date, so they sort by age.
+            if name.endswith(".log") and name[:10] < cutoff:
+                try:
+                    os.remove(os.path.join(LOG_DIR, name))
+                except OSError:
+                    pass
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, for log shippers and the replay tools."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, DATE_FORMAT),
+            "level": record.levelname,
+            "logger": record.name,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Runs on the caller's thread, before the record is queued: attaches the
+    current request ID (see core/tracing.py) and truncates long messages.
+    """
+
+    def filter(self, record):
+        trace = tracing.current_trace()
+        record.request_id = trace.request_id if trace is not None else None
+        message = record.getMessage()
+        if LOG_MAX_MESSAGE_CHARS and len(message) > LOG_MAX_MESSAGE_CHARS:
+            record.msg = f"{message[:LOG_MAX_MESSAGE_CHARS]} ...[truncated {len(message) - LOG_MAX_MESSAGE_CHARS} chars]"
+            record.args = None
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler that drops records when the queue is full instead of
+    blocking, and logs how many it dropped once there is room again.
+    """
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": f"{self.dropped} log records were dropped because the log queue was full.",
+                }))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_queue_handler = None
+_listener = None
+
+
+def _start_listener():
+    """Starts the one background thread that writes every logger's records to the console and the file."""
+    global _queue_handler, _listener
+    # 1. Ensure the log directory exists
+    os.makedirs(LOG_DIR, exist_ok=True)
+
+    # 2. Console Handler (for real-time feedback)
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO) # Only INFO and higher on console
+    console_handler.setFormatter(logging.Formatter(fmt=LOG_FORMAT, datefmt=DATE_FORMAT))
+
+    # 3. File Handler (for persistent storage), one file per day
+    file_handler = DailyFileHandler()
+    file_handler.setLevel(logging.DEBUG) # All messages (DEBUG and higher) to file
+    file_handler.setFormatter(JsonFormatter() if LOG_JSON else logging.Formatter(fmt=LOG_FORMAT, datefmt=DATE_FORMAT))
+
+    # 4. Loggers only put records on the queue; the listener thread does the I/O.
+    _queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _queue_handler.addFilter(RequestContextFilter())
+    _listener = logging.handlers.QueueListener(
+        _queue_handler.queue, console_handler, file_handler, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(_listener.stop)  # flushes the records still queued
+
 
 def setup_logger(name: str):
     """
     Initializes and configures a logger instance.
-    
-    The logger outputs messages to both the console (INFO level) 
-    and a daily log file (DEBUG level).
-    
+
+    The logger outputs messages to both the console (INFO level)
+    and a daily log file (DEBUG level). Records are handed to a background
+    thread through a queue, so logging never waits for disk or console I/O.
+
     Args:
         name: The name of the logger (usually __name__ of the module).
-    
+
     Returns:
         A configured logging.Logger object.
     """
-    # 1. Ensure the log directory exists
-    if not os.path.exists(LOG_DIR):
-        os.makedirs(LOG_DIR)
-        
-    # 2. Create the logger
+    if _listener is None:
+        _start_listener()
+
+    # Create the logger
     logger = logging.getLogger(name)
     logger.setLevel(LOG_LEVEL)
     logger.propagate = False  # Prevents messages from going to the root logger twice
 
     # Check if handlers already exist to prevent duplicate logging
     if not logger.handlers:
-        # 3. Define the formatter
-        formatter = logging.Formatter(fmt=LOG_FORMAT, datefmt=DATE_FORMAT)
-
-        # 4. Console Handler (for real-time feedback)
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO) # Only INFO and higher on console
-        console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
-
-        # 5. File Handler (for persistent storage)
-        file_handler = logging.FileHandler(LOG_PATH, mode='a', encoding='utf-8')
-        file_handler.setLevel(logging.DEBUG) # All messages (DEBUG and higher) to file
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        logger.addHandler(_queue_handler)
 
     return logger
 
+
 # Example usage (can be removed, but helpful for testing)
 if __name__ == "__main__":
     test_logger = setup_logger("test_module")
     test_logger.debug("This is a debug message - only in file.")
     test_logger.info("This is an info message - in console and file.")
     test_logger.warning("A warning occurred.")
-    test_logger.error("An error happened!")
\ No newline at end of file
+    test_logger.error("An error happened!")
+    test_logger.info("A long payload: " + "x" * (LOG_MAX_MESSAGE_CHARS + 100))
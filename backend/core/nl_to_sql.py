@@ -1,7 +1,17 @@
+from __future__ import annotations
+
 import os
-from openai import AzureOpenAI
+import asyncio
 from dotenv import load_dotenv
 from datetime import date
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+import core.prompt_builder as prompt_builder
+import core.tracing as tracing
+
+if TYPE_CHECKING:
+    from openai import AsyncAzureOpenAI
 
 # --- Azure OpenAI Client Setup ---
 # Load environment variables from the .env file
@@ -17,7 +27,7 @@ client = AzureOpenAI(
 AZURE_MODEL_NAME = os.getenv("AZURE_OPENAI_MODEL_NAME")
 '''
 
-client: AzureOpenAI = None
+client: AsyncAzureOpenAI = None
 AZURE_MODEL_NAME: str = None
 
 '''def get_schema_description():
@@ -29,25 +39,10 @@ AZURE_MODEL_NAME: str = None
     except FileNotFoundError:
         return "Error: Schema description file not found."
 '''
-"""
-    Generates a SQL query from a natural language user question.
-
-    Args:
-        user_question (str): The user's question in plain English.
-
-    Returns:
-        str: The generated T-SQL query string or an error message.
-"""
-def generate_sql_query(history: list[dict[str, str]], retrieved_schemas: str):
-   
-    # This is the "System Prompt". It gives the AI its instructions and context.
-    # Good prompt engineering is key to getting good results.
-
-    today_date = date.today().strftime("%Y-%m-%d")
-
-    print(today_date)
-      
-    system_prompt = f"""You are an expert T-SQL assistant. Your another task is to convert a user's question into a valid T-SQL query based on the business rules and schema below.
+# --- Prompt ---
+# The system prompt is split once, at import, around the parts that change
+# (today's date and the retrieved schemas), so each request only joins strings.
+SQL_SYSTEM_PROMPT = """You are an expert T-SQL assistant. Your another task is to convert a user's question into a valid T-SQL query based on the business rules and schema below.
     ---
      BUSINESS RULES (in order of importance):
         1.  **CRITICAL 3-TABLE JOIN RULE for Rejection Reasons**: To find the correct rejection description (`RejDesc`), you MUST perform a three-table join as shown in the examples below. This requires joining `DetailFile1`, `WorkSrcDesc`, and `REJREASON` and includes a fallback to a generic reason.
@@ -61,7 +56,9 @@ def generate_sql_query(history: list[dict[str, str]], retrieved_schemas: str):
 
         5.  **CRITICAL RULE for Audit History**: To answer questions about 'audit history' or 'what changed', you MUST JOIN `tblAuditLogMaster` and `tblAuditLogDetail` on the `LogId` column. The Master table tells you WHO performed an action and WHEN, and the Detail table tells you WHAT field was changed.
         
-        6.The current date is {today_date}
+        6.  **CRITICAL RULE for Dates**: `ProcessDate` and `WorkDate` are char(8) strings in 'YYYYMMDD' format, and the question already gives its dates in that format. Compare these columns with quoted string literals (`ProcessDate = '20251016'`, `ProcessDate BETWEEN '20251001' AND '20251031'`). NEVER wrap them in CONVERT, CAST or any other function, and NEVER compare them with numbers or GETDATE(); that stops the database from using the index on `ProcessDate`.
+
+        7.The current date is {today_date}
 
     ---
 
@@ -69,8 +66,11 @@ def generate_sql_query(history: list[dict[str, str]], retrieved_schemas: str):
         - User Question: "Why were the transactions in batch 0000578130 rejected?"
         - SQL Query: SELECT T3.RejDesc FROM PSGTMS.DetailFile1 AS T1 JOIN PSGTMS.WorkSrcDesc AS T2 ON T1.WorkSrc = T2.WorkSource JOIN PSGTMS.REJREASON AS T3 ON T1.RejectPgm = T3.PgmID AND T1.RejectReason = T3.RejID WHERE T1.BatchNo = '0000578130' AND T1.Reject = 1 AND (T3.WSIdx = T2.WSIdx OR T3.WSIdx = 0) ORDER BY T3.WSIdx DESC;
         
-        - User Question: "how many transactions were processed yesterday?"
-        - SQL Query: SELECT SUM(TotalTrans) FROM PSGTMS.BATCHFILE WHERE ProcessDate = CONVERT(int, CONVERT(varchar, GETDATE()-1, 112));
+        - User Question: "how many transactions were processed on the date 20251016?"
+        - SQL Query: SELECT SUM(TotalTrans) FROM PSGTMS.BATCHFILE WHERE ProcessDate = '20251016';
+
+        - User Question: "how many items were rejected between the dates 20251001 and 20251031?"
+        - SQL Query: SELECT COUNT(*) FROM PSGTMS.DetailFile1 WHERE ProcessDate BETWEEN '20251001' AND '20251031' AND Reject = 1;
         ---
     Here is the database schema you must use:
         ---
@@ -81,26 +81,48 @@ def generate_sql_query(history: list[dict[str, str]], retrieved_schemas: str):
         - Using the full conversation history for context, generate the correct T-SQL query for the user's latest question.
         - Strictly output only a single T-SQL `SELECT` statement. Do not answer the question directly or add any explanations.
     """
+_PROMPT_BEFORE_DATE, _rest = SQL_SYSTEM_PROMPT.split("{today_date}")
+_PROMPT_BEFORE_SCHEMAS, _PROMPT_AFTER_SCHEMAS = _rest.split("{retrieved_schemas}")
+
+@lru_cache(maxsize=2)
+def _prompt_prefix(today_date: str) -> str:
+    return _PROMPT_BEFORE_DATE + today_date + _PROMPT_BEFORE_SCHEMAS
+
+def build_system_prompt(retrieved_schemas: str) -> str:
+    """The SQL system prompt for today, with the retrieved schemas filled in."""
+    today_date = date.today().strftime("%Y-%m-%d")
+    return _prompt_prefix(today_date) + retrieved_schemas + _PROMPT_AFTER_SCHEMAS
+
+async def generate_sql_query(history: list[dict[str, str]], retrieved_schemas: str):
+    """
+    Generates a SQL query from the conversation's latest question.
 
-    
+    Args:
+        history: The user/assistant conversation; the last message is the question.
+            Older turns are trimmed to SQL_HISTORY_TOKEN_BUDGET tokens.
+        retrieved_schemas: The schema chunks relevant to the question.
+
+    Returns:
+        str: The generated T-SQL query string or an error message.
+    """
+    messages_for_api = [{"role": "system", "content": build_system_prompt(retrieved_schemas)}]
 
-   
-    messages_for_api = [{"role": "system", "content": system_prompt}]
-    
-    # 2. Add the entire user/assistant conversation history.
-    messages_for_api.extend(history)
+    # 2. Add the conversation history, newest turns first within the token budget.
+    messages_for_api.extend(prompt_builder.trim_history(history, prompt_builder.SQL_HISTORY_TOKEN_BUDGET))
 
     # This is the new, updated system_prompt
 
     print("--- Sending request to Azure OpenAI ---")
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=AZURE_MODEL_NAME, # Your model deployment name
             messages=messages_for_api,
             temperature=0, # Lower temperature for more deterministic, factual results
             max_tokens=500
         )
 
+        prompt_builder.log_prompt_tokens("sql_generation", messages_for_api, response.usage)
+        tracing.record_usage("sql_generation", response.usage)
         sql_query = response.choices[0].message.content.strip() 
         #print(f"Generated SQL Query: {sql_query}")
 
@@ -122,6 +144,6 @@ if __name__ == '__main__':
     test_question = "How many records are in the tblItemStatistics table?"
 
     print(f"User Question: \"{test_question}\"")
-    generated_query = generate_sql_query(test_question)
+    generated_query = asyncio.run(generate_sql_query(test_question))
     print("\n--- Generated SQL Query ---")
     print(generated_query)
\ No newline at end of file
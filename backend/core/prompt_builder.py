@@ -0,0 +1,121 @@
+# backend/core/prompt_builder.py
+"""
+Helpers for keeping LLM prompts small.
+
+- `count_tokens`: exact with `tiktoken` if it is installed, otherwise an
+  estimate of four characters per token.
+- `trim_history`: keeps the newest conversation turns that fit a token
+  budget. The newest turn carrying a filter (a batch number or a date) is
+  always kept, because the SQL prompt tells the model to carry such filters
+  forward (business rule #3).
+- `cap_text`: shortens long text (e.g. a result rendered for the summary).
+- `log_prompt_tokens`: logs the size of each prompt that is sent.
+
+The static parts of the prompts themselves are built once, at import, by the
+modules that own them (nl_to_sql, result_analyzer, main).
+"""
+import os
+from functools import lru_cache
+
+import core.date_resolver as date_resolver
+from core.logger import setup_logger
+from core.sql_templates import LITERAL_PATTERNS
+
+logger = setup_logger(__name__)
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    """The tokenizer, loaded on first use (it takes a while); None without tiktoken."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # not installed, or the encoding could not be loaded
+        return None
+
+# --- Budgets (in tokens) ---
+SQL_HISTORY_TOKEN_BUDGET = int(os.getenv("SQL_HISTORY_TOKEN_BUDGET", "1500"))
+INTENT_HISTORY_TOKEN_BUDGET = int(os.getenv("INTENT_HISTORY_TOKEN_BUDGET", "600"))
+SUMMARY_HISTORY_TOKEN_BUDGET = int(os.getenv("SUMMARY_HISTORY_TOKEN_BUDGET", "400"))
+# Longest a single earlier turn (usually a previous answer) may be.
+HISTORY_MESSAGE_MAX_TOKENS = int(os.getenv("HISTORY_MESSAGE_MAX_TOKENS", "300"))
+# Per-message overhead of the chat format (role, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+TRUNCATION_MARKER = " ...[truncated]"
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def message_tokens(messages: list[dict[str, str]]) -> int:
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def cap_text(text: str, max_tokens: int) -> str:
+    """`text`, cut to at most `max_tokens` tokens (plus a truncation marker)."""
+    if max_tokens <= 0 or count_tokens(text) <= max_tokens:
+        return text
+    encoding = get_encoding()
+    if encoding is not None:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    else:
+        cut = text[:max_tokens * 4]
+    return cut.rstrip() + TRUNCATION_MARKER
+
+
+def has_filter(text: str) -> bool:
+    """Whether a turn mentions a batch number or a date."""
+    # Any date expression counts; main.py only resolves them in the newest turn.
+    return date_resolver.mentions_date(text) or any(
+        pattern.search(text) for kind, pattern, _ in LITERAL_PATTERNS if kind == "batch"
+    )
+
+
+def trim_history(history: list[dict[str, str]], budget: int) -> list[dict[str, str]]:
+    """
+    The newest turns of `history` that fit in `budget` tokens, in their
+    original order. The last turn (the question) is always kept, and so is the
+    newest earlier user turn with a filter if it fits. Earlier turns are
+    capped at HISTORY_MESSAGE_MAX_TOKENS first.
+    """
+    if len(history) <= 1:
+        return list(history)
+
+    messages = [
+        {**m, "content": cap_text(m["content"], HISTORY_MESSAGE_MAX_TOKENS)} for m in history[:-1]
+    ] + [history[-1]]
+    costs = [count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages]
+
+    keep = {len(messages) - 1}
+    used = costs[-1]
+    for i in range(len(messages) - 2, -1, -1):
+        if messages[i]["role"] == "user" and has_filter(messages[i]["content"]):
+            if used + costs[i] <= budget:
+                keep.add(i)
+                used += costs[i]
+            break
+    for i in range(len(messages) - 2, -1, -1):
+        if i in keep:
+            continue
+        if used + costs[i] > budget:
+            break
+        keep.add(i)
+        used += costs[i]
+    if len(keep) < len(messages):
+        logger.info(f"Trimmed history from {len(messages)} to {len(keep)} messages to fit {budget} tokens.")
+    return [messages[i] for i in sorted(keep)]
+
+
+def format_history(history: list[dict[str, str]]) -> str:
+    """The conversation as 'role: content' lines, for embedding in a prompt."""
+    return "\n".join(f"{m['role']}: {m['content']}" for m in history)
+
+
+def log_prompt_tokens(stage: str, messages: list[dict[str, str]], usage=None):
+    """Logs a prompt's size; `usage` is the API's token usage when it reports one."""
+    reported = f", {usage.prompt_tokens} reported by the API" if getattr(usage, "prompt_tokens", None) else ""
+    logger.info(f"Prompt tokens for {stage}: ~{message_tokens(messages)} estimated{reported}")
@@ -1,54 +1,352 @@
+from __future__ import annotations
+
 import os
-import pandas as pd
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import SQLAlchemyError
+import re
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+import core.query_router as query_router
+from core.lazy_import import lazy_import
+from core.result_stats import ResultAggregator, ResultInfo
+
+pd = lazy_import("pandas")
+sqlalchemy = lazy_import("sqlalchemy")
+
 # Load environment variables from the .env file in the config folder
 # The path is relative to where this script is run from.
 # We assume the main script runs from the 'backend' directory.
 #config_file = load_dotenv(dotenv_path='backend/config/.env')
 
 #DATABASE_URL = os.getenv("DATABASE_URL")
-tms_engine = None
-audit_engine = None
+# Engine name -> SQLAlchemy engine, e.g. "tms" and "audit". Queries are routed
+# to them by the tables they read (see core/query_router.py).
+engines: dict = {}
+
+# --- Connection pool settings (per engine) ---
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))      # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))    # reconnect connections older than this
+# Statements running longer than this are cancelled on the server.
+QUERY_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", "30"))
+
+# --- Concurrency limits ---
+# At most DB_MAX_CONCURRENCY_PER_ENGINE queries run per engine; further
+# requests wait their turn (and the wait is measured) instead of piling up on
+# the connection pool.
+DB_MAX_CONCURRENCY_PER_ENGINE = int(os.getenv("DB_MAX_CONCURRENCY_PER_ENGINE", str(DB_POOL_SIZE)))
+_engine_limits: dict[str, asyncio.Semaphore] = {}
+engine_metrics: dict[str, dict] = {}
+_metrics_lock = threading.Lock()
+
+# --- Bounded executor for blocking database work ---
+# The DB drivers (pyodbc / sqlite3) are synchronous, so queries run on a small
+# dedicated thread pool instead of the event loop. It is sized to fit the
+# concurrency limit of both engines.
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", str(2 * DB_MAX_CONCURRENCY_PER_ENGINE)))
+_db_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="db-query")
+
+# --- Result size limits ---
+# Rows are fetched FETCH_CHUNK_SIZE at a time. Only the first MAX_RESULT_ROWS
+# rows (and at most MAX_RESULT_BYTES of them) are kept; the rest are still
+# counted and aggregated, up to MAX_SCAN_ROWS, then the cursor is closed.
+FETCH_CHUNK_SIZE = int(os.getenv("FETCH_CHUNK_SIZE", "2000"))
+MAX_RESULT_ROWS = int(os.getenv("MAX_RESULT_ROWS", "10000"))
+MAX_RESULT_BYTES = int(os.getenv("MAX_RESULT_BYTES", str(50 * 1024 * 1024)))
+MAX_SCAN_ROWS = int(os.getenv("MAX_SCAN_ROWS", "1000000"))
 
+_PLAN_COST_PATTERN = re.compile(r'StatementSubTreeCost="([0-9.Ee+-]+)"')
+# Row counts SQL Server keeps per table (heap or clustered index), without scanning it.
+_MSSQL_ROW_COUNTS = """
+SELECT s.name + '.' + t.name, SUM(p.row_count)
+FROM sys.dm_db_partition_stats AS p
+JOIN sys.tables AS t ON t.object_id = p.object_id
+JOIN sys.schemas AS s ON s.schema_id = t.schema_id
+WHERE p.index_id IN (0, 1)
+GROUP BY s.name, t.name
+"""
 
-def execute_query(sql_query: str):
+
+def create_tuned_engine(database_url: str):
     """
-    Executes a SQL query, intelligently choosing the correct database engine
-    based on the schema name in the query.
-    
+    Creates an engine with the pool settings above, pre-ping (so dead
+    connections are replaced instead of failing a query) and, for pyodbc, a
+    per-statement timeout enforced by the driver.
     """
-    print(f"Executing query: {sql_query}")
-    engine_to_use = None
+    url = sqlalchemy.make_url(database_url)
+    options = {"pool_pre_ping": True, "pool_recycle": DB_POOL_RECYCLE}
+    if url.get_backend_name() != "sqlite":
+        # SQLite uses its own single-connection pools without these settings.
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    engine = sqlalchemy.create_engine(url, **options)
 
-    if "PSGAuditStats" in sql_query:
-        engine_to_use = audit_engine
-        print("Using AUDIT database engine.")
-    else:
-        engine_to_use = tms_engine
-        print("Using TMS database engine.")
+    if url.get_driver_name() == "pyodbc":
+        @sqlalchemy.event.listens_for(engine, "connect")
+        def _set_query_timeout(dbapi_connection, connection_record):
+            # pyodbc sends this with every statement. When it expires the driver
+            # cancels the statement on the server and raises HYT00.
+            dbapi_connection.timeout = max(1, int(QUERY_TIMEOUT_SECONDS))
+
+    return engine
+
+def database_urls() -> dict[str, str]:
+    """Engine name -> URL for every DATABASE_URL_<NAME> environment variable (e.g. DATABASE_URL_TMS -> "tms")."""
+    prefix = "DATABASE_URL_"
+    return {
+        name[len(prefix):].lower(): url
+        for name, url in sorted(os.environ.items())
+        if name.startswith(prefix) and url
+    }
+
+def _metrics_for(engine_name: str) -> dict:
+    with _metrics_lock:
+        return engine_metrics.setdefault(engine_name, {
+            "queries": 0, "waiting": 0, "in_flight": 0, "timeouts": 0,
+            "wait_seconds_total": 0.0, "wait_seconds_max": 0.0,
+        })
+
+def engine_stats() -> dict:
+    """Queue-wait and timeout metrics plus pool status for each engine."""
+    stats = {}
+    for engine_name, metrics in engine_metrics.items():
+        queries = metrics["queries"]
+        engine = engines.get(engine_name)
+        stats[engine_name] = {
+            **metrics,
+            "wait_seconds_avg": metrics["wait_seconds_total"] / queries if queries else 0.0,
+            "pool": engine.pool.status() if engine is not None else None,
+        }
+    return stats
+
+@contextmanager
+def _statement_timeout(connection):
+    """
+    Cancels the running statement after QUERY_TIMEOUT_SECONDS for drivers that
+    support interrupting a connection from another thread (sqlite3). pyodbc
+    connections enforce the timeout themselves (see create_tuned_engine).
+
+    Yields an Event that is set if the statement was cancelled.
+    """
+    timed_out = threading.Event()
+    dbapi_connection = connection.connection.dbapi_connection
+    timer = None
+    if hasattr(dbapi_connection, "interrupt"):
+        def cancel():
+            timed_out.set()
+            dbapi_connection.interrupt()
+        timer = threading.Timer(QUERY_TIMEOUT_SECONDS, cancel)
+        timer.daemon = True
+        timer.start()
+    try:
+        yield timed_out
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+def resolve_engine_name(sql_query: str) -> str:
+    """Returns which database a query targets (e.g. "tms" or "audit"), from the tables it reads."""
+    return query_router.route(sql_query).engine_name
+
+def _engine_for(engine_name: str):
+    return engines.get(engine_name)
+
+def dialect_for(sql_query: str) -> str:
+    """The SQLAlchemy dialect name ("mssql", "sqlite", ...) of the engine a query runs on."""
+    engine = _engine_for(resolve_engine_name(sql_query))
+    return engine.dialect.name if engine is not None else "mssql"
+
+def bound_statement(sql_query: str, params: dict | None = None):
+    """
+    The query as a SQLAlchemy text clause, with its string parameters typed as
+    (non-Unicode) strings of their length. Untyped, pyodbc sends a str as
+    nvarchar, and SQL Server then converts the char/varchar column (e.g. the
+    char(8) ProcessDate) of every row to compare it, instead of seeking its
+    index; typed, they are sent as varchar.
+    """
+    statement = sqlalchemy.text(sql_query)
+    typed = [
+        sqlalchemy.bindparam(name, type_=sqlalchemy.String(len(value) or None))
+        for name, value in (params or {}).items() if isinstance(value, str)
+    ]
+    return statement.bindparams(*typed) if typed else statement
+
+def estimate_cost(sql_query: str, params: dict | None = None):
+    """
+    The optimizer's estimated cost of a query, without running it. Only SQL
+    Server reports one (the StatementSubTreeCost of its SHOWPLAN_XML plan);
+    returns None for other databases or if no plan could be produced.
+    """
+    engine = _engine_for(resolve_engine_name(sql_query))
+    if engine is None or engine.dialect.name != "mssql":
+        return None
+    try:
+        with engine.connect() as connection:
+            connection.exec_driver_sql("SET SHOWPLAN_XML ON")
+            try:
+                plan = connection.execute(bound_statement(sql_query, params), params or {}).scalar()
+            finally:
+                connection.exec_driver_sql("SET SHOWPLAN_XML OFF")
+    except sqlalchemy.exc.SQLAlchemyError as e:
+        print(f"Could not estimate the query cost: {e}")
+        return None
+    costs = [float(cost) for cost in _PLAN_COST_PATTERN.findall(plan or "")]
+    return max(costs) if costs else None
+
+def table_row_counts(tables) -> dict[str, int]:
+    """
+    The current row count of each qualified table ("SCHEMA.TABLE", upper
+    case) on the engine it is routed to. SQL Server reports them from its
+    partition statistics; SQLite counts the rows. Tables on other databases,
+    or that cannot be read, are left out.
+    """
+    by_engine = {}
+    for table in tables:
+        by_engine.setdefault(query_router.engine_for_table(table), []).append(table.upper())
+    counts = {}
+    for engine_name, names in by_engine.items():
+        engine = _engine_for(engine_name)
+        if engine is None:
+            continue
+        if engine.dialect.name == "mssql":
+            statements = [(None, _MSSQL_ROW_COUNTS)]
+        elif engine.dialect.name == "sqlite":
+            statements = [(name, f"SELECT COUNT(*) FROM {name}") for name in names]
+        else:
+            continue
+        with engine.connect() as connection:
+            for name, statement in statements:
+                try:
+                    rows = connection.exec_driver_sql(statement).all()
+                except sqlalchemy.exc.SQLAlchemyError as e:
+                    print(f"Could not count the rows of {name or 'the tables'} on '{engine_name}': {e}")
+                    continue
+                if name is not None:
+                    counts[name] = int(rows[0][0])
+                else:
+                    counts.update((table.upper(), int(count)) for table, count in rows if table.upper() in names)
+    return counts
+
+async def estimate_cost_async(sql_query: str, params: dict | None = None):
+    """Runs `estimate_cost` on the DB thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, estimate_cost, sql_query, params)
+
+def execute_query(sql_query: str, params: dict | None = None):
+    """
+    Executes a SQL query on the database engine that holds the tables it
+    reads (see core/query_router.py). Queries that read tables from more
+    than one database are refused.
+
+    `params` holds values for named bind parameters (e.g. `:batch_0`) in the query.
+
+    The result is fetched in chunks and capped (see MAX_RESULT_ROWS and
+    MAX_RESULT_BYTES). `result_df.attrs["result_info"]` holds a ResultInfo
+    describing the full result: whether it was truncated, the total row count
+    and aggregates over every scanned row.
+    """
+    print(f"Executing query: {sql_query}")
+    route = query_router.route(sql_query)
+    if route.cross_database:
+        return None, f"Error: {route.message}"
+    engine_name = route.engine_name
+    engine_to_use = _engine_for(engine_name)
+    print(f"Using {engine_name.upper()} database engine.")
 
     if engine_to_use is None:
-        return None, "Error: Database engine not configured."
+        return None, f"Error: Database engine '{engine_name}' not configured."
 
+    timed_out = threading.Event()
     try:
         # Use a 'with' statement to ensure the connection is properly closed
-        with engine_to_use.connect() as connection:
-            # Use pandas to directly read the SQL query into a DataFrame
-            # This is efficient and handles the data types well.
-            result_df = pd.read_sql_query(text(sql_query), connection)
+        with engine_to_use.connect() as connection, _statement_timeout(connection) as timed_out:
+            # Ask for a server-side cursor so rows arrive as we fetch them.
+            connection = connection.execution_options(stream_results=True, max_row_buffer=FETCH_CHUNK_SIZE)
+            chunks = pd.read_sql_query(bound_statement(sql_query, params), connection, params=params, chunksize=FETCH_CHUNK_SIZE)
+            result_df = _read_bounded(chunks)
             return result_df, None
-    except SQLAlchemyError as e:
-        error_message = f"Database Error: {e}"
-        print(error_message)
-        return None, error_message
     except Exception as e:
-        error_message = f"An unexpected error occurred: {e}"
+        if timed_out.is_set() or "HYT00" in str(e):
+            metrics = _metrics_for(engine_name)
+            with _metrics_lock:
+                metrics["timeouts"] += 1
+            error_message = f"Database Error: The query ran longer than {QUERY_TIMEOUT_SECONDS:g} seconds and was cancelled."
+        elif isinstance(e, sqlalchemy.exc.SQLAlchemyError):
+            error_message = f"Database Error: {e}"
+        else:
+            error_message = f"An unexpected error occurred: {e}"
         print(error_message)
         return None, error_message
 
+def _read_bounded(chunks) -> pd.DataFrame:
+    """Keeps chunks until the row/byte caps are hit, aggregating every chunk scanned."""
+    aggregator = ResultAggregator()
+    kept, kept_rows, kept_bytes = [], 0, 0
+    truncated, exact = False, True
+
+    for chunk in chunks:
+        aggregator.update(chunk)
+        if not truncated:
+            room = MAX_RESULT_ROWS - kept_rows
+            if len(chunk) > room:
+                chunk, truncated = chunk.iloc[:room], True
+            chunk_bytes = int(chunk.memory_usage(index=False, deep=True).sum())
+            if kept_bytes + chunk_bytes > MAX_RESULT_BYTES and kept:
+                truncated = True
+            else:
+                kept.append(chunk)
+                kept_rows += len(chunk)
+                kept_bytes += chunk_bytes
+        if aggregator.row_count >= MAX_SCAN_ROWS:
+            exact = False
+            break
+
+    if not kept:
+        result_df = pd.DataFrame()
+    elif len(kept) == 1:
+        result_df = kept[0]
+    else:
+        result_df = pd.concat(kept, ignore_index=True)
+    truncated = truncated or kept_rows < aggregator.row_count
+
+    if truncated:
+        print(f"Result truncated to {kept_rows} of {aggregator.row_count}{'' if exact else '+'} rows.")
+    result_df.attrs["result_info"] = ResultInfo(
+        truncated=truncated,
+        total_rows=aggregator.row_count,
+        total_rows_exact=exact,
+        stats=aggregator.summary(),
+    )
+    return result_df
+
+async def execute_query_async(sql_query: str, params: dict | None = None):
+    """
+    Runs `execute_query` on the bounded DB thread pool so the event loop
+    stays free to serve other requests while the database works. Queries wait
+    for a slot under their engine's concurrency limit first.
+    """
+    engine_name = resolve_engine_name(sql_query)
+    limit = _engine_limits.setdefault(engine_name, asyncio.Semaphore(DB_MAX_CONCURRENCY_PER_ENGINE))
+    metrics = _metrics_for(engine_name)
+
+    metrics["waiting"] += 1
+    queued_at = time.perf_counter()
+    async with limit:
+        wait_seconds = time.perf_counter() - queued_at
+        metrics["waiting"] -= 1
+        metrics["in_flight"] += 1
+        metrics["queries"] += 1
+        metrics["wait_seconds_total"] += wait_seconds
+        metrics["wait_seconds_max"] = max(metrics["wait_seconds_max"], wait_seconds)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(_db_executor, execute_query, sql_query, params)
+        finally:
+            metrics["in_flight"] -= 1
+
 # --- Example of how to run this file directly for testing ---
 '''if __name__ == '__main__':
     # IMPORTANT: Replace 'YourTableName' with a real table name from your database
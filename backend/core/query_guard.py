@@ -0,0 +1,396 @@
+# backend/core/query_guard.py
+"""
+Rewrites validated SQL before it is executed.
+
+- Adds a row limit (`TOP (N)` for SQL Server, `FETCH NEXT N ROWS ONLY` for
+  its queries with an OFFSET, `LIMIT N` elsewhere) to queries that do not
+  have one, so a runaway result is stopped by the database instead of being
+  streamed to the executor.
+- Rejects (or warns about) queries that read a large table without filtering
+  on one of its indexed columns. The columns come from the 'Filter on:'
+  lines of schema_description.txt; table sizes from its 'Size:' lines, which
+  are estimates, until `set_measured_sizes` replaces them with the row counts
+  the database reports (done at startup).
+
+A filter counts if the column is compared in a WHERE/ON/HAVING clause, or if
+the table is joined on it to a table that is itself filtered (or small), e.g.
+DetailFile1 joined on BatchNo to a BATCHFILE row picked by ProcessDate.
+"""
+import os
+import re
+from dataclasses import dataclass
+
+from sqlparse import lexer, tokens as T
+
+import core.query_executor as query_executor
+from core.cache import LRUCache
+
+# Rows to cap a query at when it has no TOP/LIMIT of its own. It defaults to
+# the executor's scan limit, so nothing the executor would read is lost.
+QUERY_ROW_LIMIT = int(os.getenv("QUERY_ROW_LIMIT", str(query_executor.MAX_SCAN_ROWS)))
+# Tables with at least this many rows must be filtered.
+LARGE_TABLE_ROWS = int(os.getenv("LARGE_TABLE_ROWS", "1000000"))
+# "reject" refuses unfiltered queries on large tables, "warn" only logs them,
+# "off" skips the check (the row limit is still added). It only warns by
+# default: until startup has measured them, table sizes are only estimates.
+QUERY_GUARD_MODE = os.getenv("QUERY_GUARD_MODE", "warn").lower()
+# Largest estimated plan cost (SQL Server's estimated subtree cost) allowed;
+# 0 disables the estimated-plan check.
+QUERY_COST_BUDGET = float(os.getenv("QUERY_COST_BUDGET", "0"))
+
+
+@dataclass(frozen=True)
+class TableHint:
+    rows: int
+    filter_columns: tuple[str, ...]
+    measured: bool = False    # rows counted on the database, not the 'Size:' estimate
+
+    def describe_size(self) -> str:
+        return f"{self.rows:,} rows" if self.measured else f"an estimated {self.rows:,} rows"
+
+
+@dataclass(frozen=True)
+class GuardResult:
+    sql: str
+    allowed: bool
+    message: str
+    warnings: tuple[str, ...] = ()
+
+
+# "PSGTMS.DETAILFILE1" -> TableHint, loaded from the schema description.
+table_hints: dict[str, TableHint] = {}
+_results = LRUCache(int(os.getenv("QUERY_GUARD_CACHE_SIZE", "1024")))
+
+_TABLE_PATTERN = re.compile(r"^Table:\s*(\S+)\s*$", re.MULTILINE)
+_SIZE_PATTERN = re.compile(
+    r"^Size:\s*~?([\d,]+)\s*rows(?:\s*\(estimated\))?\.?(?:\s*Filter on:\s*(.*?)\.?)?\s*$", re.MULTILINE,
+)
+
+_SKIPPED = (T.Whitespace, T.Newline, T.Comment.Single, T.Comment.Multiline)
+_TABLE_KEYWORDS = {'FROM', 'JOIN', 'APPLY'}
+_PREDICATE_KEYWORDS = {'WHERE', 'ON', 'HAVING'}
+_CLAUSE_KEYWORDS = {'FROM', 'GROUP BY', 'ORDER BY', 'OPTION', 'FOR'}
+_SET_OPERATORS = {'UNION', 'UNION ALL', 'EXCEPT', 'INTERSECT'}
+
+
+def load_table_hints(schema_text: str):
+    """Reads the 'Size:' / 'Filter on:' line that follows each 'Table:' line."""
+    global table_hints
+    hints = {}
+    for chunk in schema_text.split('---'):
+        table = _TABLE_PATTERN.search(chunk)
+        size = _SIZE_PATTERN.search(chunk)
+        if table and size:
+            columns = tuple(c.strip() for c in (size.group(2) or "").split(",") if c.strip())
+            hints[table.group(1).upper()] = TableHint(int(size.group(1).replace(",", "")), columns)
+    table_hints = hints
+    _results.clear()
+    print(f"Loaded size hints for {len(hints)} tables.")
+
+
+def set_measured_sizes(row_counts: dict[str, int]):
+    """Replaces the estimated sizes of the tables in `row_counts` ("SCHEMA.TABLE" -> rows) with those counts."""
+    global table_hints
+    hints = dict(table_hints)
+    for name, rows in row_counts.items():
+        hint = hints.get(name.upper())
+        if hint is not None:
+            hints[name.upper()] = TableHint(rows, hint.filter_columns, measured=True)
+    table_hints = hints
+    _results.clear()
+    print(f"Measured the size of {sum(hint.measured for hint in hints.values())} of {len(hints)} tables.")
+
+
+def guard_query(sql_query: str, dialect: str) -> GuardResult:
+    """
+    Adds a row limit to `sql_query` if it has none and checks large tables are
+    filtered. `dialect` is the SQLAlchemy dialect name ("mssql", "sqlite", ...).
+    Results are cached per query and dialect.
+    """
+    key = (sql_query, dialect)
+    result = _results.get(key)
+    if result is None:
+        result = _guard(sql_query, dialect)
+        _results.set(key, result)
+    return result
+
+
+def _identifier(value: str) -> str:
+    return value.strip('[]"').upper()
+
+
+def _analyze(sql_query: str) -> dict:
+    """
+    One pass over the token stream. Returns where a row limit would go (after
+    the main SELECT for TOP, at the end of the last token that is not a
+    comment or ';' for LIMIT and FETCH), whether there already is one or an
+    OFFSET clause, the tables read
+    (by alias) and the columns used in predicates, as ("col", qualifier,
+    column) items with "=" between them.
+    """
+    offset = 0
+    body_end = 0
+    depth = 0
+    previous = None
+    insert_at = None          # offset just after the main SELECT [DISTINCT]
+    limited = False
+    has_offset = False
+    set_operator = False
+    after_main_select = False
+    tables = {}               # alias / name -> full table name
+    from_depths = []
+    expect_table = False
+    expect_alias = None       # full name of the table whose alias may follow
+    name_parts = None         # dotted identifier being collected
+    name_kind = None          # "table" or "column"
+    after_dot = False
+    clauses = {}              # depth -> current clause keyword
+    predicate_items = []
+
+    def in_predicate():
+        for d in range(depth, -1, -1):
+            if d in clauses:
+                return clauses[d] in _PREDICATE_KEYWORDS
+        return False
+
+    for ttype, value in lexer.tokenize(sql_query):
+        offset += len(value)
+        if ttype in _SKIPPED:
+            continue
+        if value != ';':
+            body_end = offset
+        upper = value.upper()
+        # Bind parameters (:batch_0) and type names (int) are not columns.
+        is_identifier = (ttype in T.Name or ttype in T.Literal.String.Symbol) and not (
+            ttype in T.Name.Placeholder or ttype in T.Name.Builtin
+        )
+
+        # --- Finish a dotted identifier ---
+        if name_parts is not None:
+            if value == '.':
+                after_dot = True
+                continue
+            if after_dot and is_identifier:
+                name_parts.append(_identifier(value))
+                after_dot = False
+                continue
+            if name_kind == "table":
+                full_name = ".".join(name_parts[-2:])
+                tables[full_name] = full_name
+                tables[name_parts[-1]] = full_name
+                expect_alias = full_name
+            elif value != '(':   # a column, not a function call
+                qualifier = name_parts[-2] if len(name_parts) > 1 else None
+                predicate_items.append(("col", qualifier, name_parts[-1]))
+            name_parts = None
+
+        # --- Table alias: FROM table [AS] alias ---
+        if expect_alias is not None:
+            if upper == 'AS':
+                previous = upper
+                continue
+            if is_identifier and upper != 'APPLY':
+                tables[_identifier(value)] = expect_alias
+                expect_alias = None
+                previous = upper
+                continue
+            expect_alias = None
+
+        # SELECT [DISTINCT | ALL] [TOP n] of the main query
+        if after_main_select:
+            after_main_select = False
+            if upper in ('DISTINCT', 'ALL'):
+                insert_at, after_main_select = offset, True
+                previous = upper
+                continue
+            if upper == 'TOP':
+                limited = True
+
+        if ttype in T.Punctuation:
+            if in_predicate():
+                predicate_items.append(None)
+            if value == '(':
+                depth += 1
+                expect_table = False
+            elif value == ')':
+                clauses.pop(depth, None)
+                depth -= 1
+                while from_depths and from_depths[-1] > depth:
+                    from_depths.pop()
+            elif value == ',' and from_depths and from_depths[-1] == depth and clauses.get(depth) in _TABLE_KEYWORDS:
+                expect_table = True
+        elif ttype in T.Keyword.DML and upper == 'SELECT':
+            clauses[depth] = 'SELECT'
+            if insert_at is None and depth == 0:
+                insert_at, after_main_select = offset, True
+        elif depth == 0 and upper in ('LIMIT', 'FETCH'):
+            limited = True
+        elif depth == 0 and upper == 'OFFSET':
+            has_offset = True
+        elif upper in _TABLE_KEYWORDS or upper.endswith(' JOIN'):
+            clauses[depth] = 'FROM'
+            if not from_depths or from_depths[-1] != depth:
+                from_depths.append(depth)
+            expect_table = True
+        elif ttype in T.Keyword and upper in _PREDICATE_KEYWORDS:
+            clauses[depth] = upper
+        elif ttype in T.Keyword and (upper in _CLAUSE_KEYWORDS or upper in _SET_OPERATORS):
+            clauses[depth] = upper
+            if from_depths and from_depths[-1] == depth:
+                from_depths.pop()
+            if depth == 0 and upper in _SET_OPERATORS:
+                set_operator = True
+        elif is_identifier and expect_table:
+            name_parts, name_kind, after_dot = [_identifier(value)], "table", False
+            expect_table = False
+        elif is_identifier and in_predicate():
+            name_parts, name_kind, after_dot = [_identifier(value)], "column", False
+        elif ttype in T.Operator.Comparison and value == '=' and in_predicate():
+            predicate_items.append(("=",))
+        elif in_predicate():
+            predicate_items.append(None)
+        previous = upper
+
+    if name_parts is not None and name_kind == "table":
+        # The query ends with a table name (no WHERE or alias).
+        full_name = ".".join(name_parts[-2:])
+        tables[full_name] = full_name
+        tables[name_parts[-1]] = full_name
+    elif name_parts is not None and name_kind == "column":
+        qualifier = name_parts[-2] if len(name_parts) > 1 else None
+        predicate_items.append(("col", qualifier, name_parts[-1]))
+
+    return {
+        "insert_at": insert_at,
+        "body_end": body_end,
+        "limited": limited,
+        "has_offset": has_offset,
+        "set_operator": set_operator,
+        "tables": tables,
+        "predicate_items": predicate_items,
+    }
+
+
+def _unfiltered_large_tables(shape: dict) -> list[str]:
+    """Large tables the query reads without a filter on an indexed column."""
+    tables = shape["tables"]
+    used = set(tables.values())
+    large = {
+        name for name in used
+        if name in table_hints and table_hints[name].rows >= LARGE_TABLE_ROWS
+    }
+    if not large:
+        return []
+
+    def resolve(qualifier, column):
+        if qualifier is not None:
+            name = tables.get(qualifier)
+            return [name] if name else []
+        # Unqualified: every table in the query that has it as a filter column.
+        return [
+            name for name in used
+            if name in table_hints and column in {c.upper() for c in table_hints[name].filter_columns}
+        ]
+
+    def is_filter_column(name, column):
+        hint = table_hints.get(name)
+        return hint is not None and column in {c.upper() for c in hint.filter_columns}
+
+    items = shape["predicate_items"]
+    joins, paired = [], set()
+    for i in range(len(items) - 2):
+        left, op, right = items[i], items[i + 1], items[i + 2]
+        if left and op == ("=",) and right and left[0] == right[0] == "col":
+            joins.append((left, right))
+            paired.update((i, i + 2))
+
+    filtered = used - large
+    for i, item in enumerate(items):
+        if item and item[0] == "col" and i not in paired:
+            filtered.update(name for name in resolve(item[1], item[2]) if is_filter_column(name, item[2]))
+
+    # A join on an indexed column to a filtered table is selective too.
+    changed = True
+    while changed:
+        changed = False
+        for left, right in joins:
+            for a, b in ((left, right), (right, left)):
+                for a_name in resolve(a[1], a[2]):
+                    if a_name in filtered or not is_filter_column(a_name, a[2]):
+                        continue
+                    if any(b_name in filtered for b_name in resolve(b[1], b[2])):
+                        filtered.add(a_name)
+                        changed = True
+    return sorted(large - filtered)
+
+
+def _add_row_limit(sql_query: str, dialect: str, shape: dict):
+    """The query with a row limit added, or None if it cannot be added safely."""
+    if dialect == "mssql" and shape["has_offset"]:
+        # SQL Server refuses TOP together with OFFSET; FETCH limits the whole
+        # query, UNIONs included.
+        at = shape["body_end"]
+        return f"{sql_query[:at]} FETCH NEXT {QUERY_ROW_LIMIT} ROWS ONLY{sql_query[at:]}"
+    if dialect == "mssql":
+        # TOP only applies to the first SELECT of a UNION; leave those alone.
+        if shape["set_operator"] or shape["insert_at"] is None:
+            return None
+        at = shape["insert_at"]
+        return f"{sql_query[:at]} TOP ({QUERY_ROW_LIMIT}){sql_query[at:]}"
+    # Before a trailing ';' or comment, which would otherwise swallow it.
+    at = shape["body_end"]
+    return f"{sql_query[:at]} LIMIT {QUERY_ROW_LIMIT}{sql_query[at:]}"
+
+
+def _guard(sql_query: str, dialect: str) -> GuardResult:
+    shape = _analyze(sql_query)
+    warnings = []
+    rewritten = sql_query
+
+    if QUERY_GUARD_MODE != "off":
+        for name in _unfiltered_large_tables(shape):
+            hint = table_hints[name]
+            message = (
+                f"The query reads {name} ({hint.describe_size()}) without filtering on "
+                f"{', '.join(hint.filter_columns) or 'an indexed column'}. "
+                "Please narrow the question, e.g. to a batch number or a date range."
+            )
+            if QUERY_GUARD_MODE == "reject":
+                return GuardResult(sql_query, False, message)
+            warnings.append(message)
+
+    if not shape["limited"] and QUERY_ROW_LIMIT > 0:
+        limited_sql = _add_row_limit(sql_query, dialect, shape)
+        if limited_sql is None:
+            warnings.append("No row limit was added to this query; the executor's limits still apply.")
+        else:
+            rewritten = limited_sql
+    return GuardResult(rewritten, True, "Query is within limits.", tuple(warnings))
+
+
+def stats() -> dict:
+    return {
+        "tables_with_hints": len(table_hints),
+        "tables_measured": sum(hint.measured for hint in table_hints.values()),
+        "cache": _results.stats(),
+    }
+
+# --- Example of how to run this file directly for testing ---
+if __name__ == '__main__':
+    from pathlib import Path
+
+    load_table_hints((Path(__file__).parent.parent / "models" / "schema_description.txt").read_text())
+    test_queries = [
+        "SELECT BatchNo, TranNo FROM PSGTMS.DetailFile1 WHERE BatchNo = '0000513258' AND Reject = 1;",
+        "SELECT DISTINCT BatchNo FROM PSGTMS.DetailFile1 WHERE ProcessDate BETWEEN '20250101' AND '20250131'",
+        "SELECT TOP 10 * FROM PSGTMS.DetailFile1 ORDER BY DetailKey DESC",
+        "SELECT M.Usercode, D.FieldName FROM PSGAuditStats.tblAuditLogMaster AS M "
+        "JOIN PSGAuditStats.tblAuditLogDetail AS D ON M.LogId = D.LogId WHERE M.BatchNo = '0000513258'",
+        "SELECT SUM(Amount) FROM PSGTMS.DetailFile1 WHERE Reject = 1",
+        "SELECT * FROM PSGTMS.REJREASON",
+    ]
+    for query in test_queries:
+        for dialect in ("mssql", "sqlite"):
+            result = guard_query(query, dialect)
+            print(f"[{dialect}] {'ALLOWED' if result.allowed else 'REJECTED'}: {result.sql if result.allowed else result.message}")
+        print()
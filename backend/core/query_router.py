@@ -0,0 +1,196 @@
+# backend/core/query_router.py
+"""
+Decides which database a query runs on.
+
+Every table in the schema catalog (the 'Table:' lines of
+schema_description.txt) is mapped to a database engine: by a
+'Database: <engine>' line in its description if there is one, otherwise by
+its schema (DB_SCHEMA_ENGINES). Tables that are not in the catalog are
+routed by their schema as well.
+
+A query is routed by the qualified tables in its FROM/JOIN clauses, read
+from the token stream, so a schema name inside a string literal or a
+comment does not move it to another database. Routes are cached per
+normalized SQL.
+
+Queries that read tables from more than one database are not run; their
+route has `cross_database` set and a message naming the tables per engine.
+"""
+import os
+import re
+from dataclasses import dataclass
+
+from sqlparse import lexer, tokens as T
+
+from core.cache import LRUCache
+from core.sql_validator import verdict_key
+
+# Schema -> engine, as "SCHEMA=engine" pairs. The engine names are the
+# suffixes of the DATABASE_URL_<NAME> variables (lower-cased).
+DB_SCHEMA_ENGINES = {
+    schema.strip().upper(): engine.strip().lower()
+    for schema, _, engine in (
+        pair.partition("=") for pair in os.getenv("DB_SCHEMA_ENGINES", "PSGTMS=tms,PSGAuditStats=audit").split(",")
+    )
+    if schema.strip()
+}
+# Engine for queries that read no qualified table (e.g. "SELECT 1").
+DB_DEFAULT_ENGINE = os.getenv("DB_DEFAULT_ENGINE", "tms").lower()
+
+
+@dataclass(frozen=True)
+class Route:
+    engine_name: str                     # where the query runs (the first engine if cross-database)
+    tables: tuple[tuple[str, str], ...]  # (table, engine) for each table read
+    engines: tuple[str, ...]
+
+    @property
+    def cross_database(self) -> bool:
+        return len(self.engines) > 1
+
+    @property
+    def message(self) -> str:
+        by_engine = "; ".join(
+            f"{engine}: {', '.join(table for table, table_engine in self.tables if table_engine == engine)}"
+            for engine in self.engines
+        )
+        return (
+            f"The query reads tables from more than one database ({by_engine}). "
+            "Please ask about them in separate questions."
+        )
+
+
+# "PSGTMS.BATCHFILE" -> "tms", loaded from the schema catalog.
+table_engines: dict[str, str] = {}
+_routes = LRUCache(int(os.getenv("QUERY_ROUTE_CACHE_SIZE", "2048")))
+
+_TABLE_PATTERN = re.compile(r"^Table:\s*(\S+)\s*$", re.MULTILINE)
+_DATABASE_PATTERN = re.compile(r"^Database:\s*(\w+)\s*$", re.MULTILINE)
+
+_SKIPPED = (T.Whitespace, T.Newline, T.Comment.Single, T.Comment.Multiline)
+_TABLE_KEYWORDS = {'FROM', 'JOIN', 'APPLY'}
+_CLAUSE_END_KEYWORDS = {'WHERE', 'GROUP BY', 'ORDER BY', 'HAVING', 'OPTION', 'FOR'}
+_SET_OPERATORS = {'UNION', 'UNION ALL', 'EXCEPT', 'INTERSECT'}
+
+
+def _identifier(value: str) -> str:
+    return value.strip('[]"').upper()
+
+
+def load_routes(schema_text: str):
+    """Builds the table -> engine map from the schema descriptions (chunks separated by '---')."""
+    routes = {}
+    for chunk in schema_text.split("\n---\n"):
+        table = _TABLE_PATTERN.search(chunk)
+        if not table:
+            continue
+        name = ".".join(_identifier(part) for part in table.group(1).split("."))
+        database = _DATABASE_PATTERN.search(chunk)
+        routes[name] = database.group(1).lower() if database else _schema_engine(name)
+    table_engines.clear()
+    table_engines.update(routes)
+    _routes.clear()
+    print(f"Loaded database routes for {len(routes)} tables.")
+
+
+def _schema_engine(table: str) -> str:
+    schema = table.split(".")[0] if "." in table else ""
+    return DB_SCHEMA_ENGINES.get(schema, DB_DEFAULT_ENGINE)
+
+
+def engine_for_table(table: str) -> str:
+    """The engine a qualified table ("SCHEMA.TABLE", any case) lives on."""
+    table = table.upper()
+    return table_engines.get(table) or _schema_engine(table)
+
+
+def referenced_tables(sql_query: str) -> list[str]:
+    """
+    The qualified tables ("Schema.Table", spelled as in the query, in order
+    of first appearance) in the FROM/JOIN/APPLY clauses of a query,
+    subqueries included. Unqualified names (CTEs) are left out.
+    """
+    tables = {}               # upper-cased name -> name
+    depth = 0
+    from_depths = []
+    expect_table = False
+    name_parts = None
+    after_dot = False
+
+    def finish(parts):
+        if len(parts) > 1:
+            name = ".".join(parts[-2:])
+            tables.setdefault(name.upper(), name)
+
+    for ttype, value in lexer.tokenize(sql_query):
+        if ttype in _SKIPPED:
+            continue
+        is_identifier = ttype in T.Name or ttype in T.Literal.String.Symbol
+        upper = value.upper()
+
+        # --- Finish a (possibly dotted) table name ---
+        if name_parts is not None:
+            if value == '.':
+                after_dot = True
+                continue
+            if after_dot and is_identifier:
+                name_parts.append(value.strip('[]"'))
+                after_dot = False
+                continue
+            finish(name_parts)
+            name_parts = None
+
+        if ttype in T.Punctuation:
+            if value == '(':
+                depth += 1
+                expect_table = False
+            elif value == ')':
+                depth -= 1
+                while from_depths and from_depths[-1] > depth:
+                    from_depths.pop()
+            elif value == ',' and from_depths and from_depths[-1] == depth:
+                expect_table = True
+        elif upper in _TABLE_KEYWORDS or upper.endswith(' JOIN'):
+            if not from_depths or from_depths[-1] != depth:
+                from_depths.append(depth)
+            expect_table = True
+        elif ttype in T.Keyword and (upper in _CLAUSE_END_KEYWORDS or upper in _SET_OPERATORS):
+            if from_depths and from_depths[-1] == depth:
+                from_depths.pop()
+            expect_table = False
+        elif is_identifier and expect_table:
+            name_parts, after_dot = [value.strip('[]"')], False
+            expect_table = False
+
+    if name_parts is not None:
+        finish(name_parts)
+    return list(tables.values())
+
+
+def route(sql_query: str) -> Route:
+    """Which engine(s) a query reads from (see the module docstring). Cached."""
+    key = verdict_key(sql_query)
+    cached = _routes.get(key)
+    if cached is None:
+        tables = tuple((table, engine_for_table(table)) for table in referenced_tables(sql_query))
+        engines = tuple(dict.fromkeys(engine for _, engine in tables)) or (DB_DEFAULT_ENGINE,)
+        cached = Route(engine_name=engines[0], tables=tables, engines=engines)
+        _routes.set(key, cached)
+    return cached
+
+
+def stats() -> dict:
+    return {"tables": len(table_engines), "cache": _routes.stats()}
+
+
+# --- Example of how to run this file directly for testing ---
+if __name__ == '__main__':
+    test_queries = [
+        "SELECT * FROM PSGTMS.BATCHFILE WHERE RejDesc = 'see PSGAuditStats'",
+        "SELECT * FROM [PSGAuditStats].[tblAuditLogMaster] -- PSGTMS",
+        "WITH b AS (SELECT BatchNo FROM PSGTMS.BATCHFILE) SELECT * FROM b",
+        "SELECT * FROM PSGTMS.BATCHFILE B JOIN PSGAuditStats.tblAuditLogMaster M ON B.BatchNo = M.BatchNo",
+    ]
+    for query in test_queries:
+        result = route(query)
+        print(f"{query}\n  -> {result.engines} {result.message if result.cross_database else ''}\n")
@@ -0,0 +1,126 @@
+# backend/core/response_format.py
+"""
+Wire formats and compression for query results.
+
+- "records" (the default): `rows` is a list of {column: value} dicts, one
+  per row, so every column name is repeated on every row.
+- "columnar": `columns` lists the names once and `data[i]` holds all the
+  values of `columns[i]`. Clients opt in with `?format=columnar` or
+  `Accept: application/vnd.tmsbot.columnar+json`.
+
+Missing values are sent as null in the columnar format. Responses are
+compressed with zstd (when the optional `zstandard` package is installed)
+or gzip if the client's Accept-Encoding allows it.
+"""
+from __future__ import annotations
+
+import gzip
+import os
+import zlib
+
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip is used instead
+    zstandard = None
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.tmsbot.columnar+json"
+
+# Smaller bodies are sent as they are; compressing them saves next to nothing.
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "5"))
+ZSTD_LEVEL = int(os.getenv("RESPONSE_ZSTD_LEVEL", "3"))
+
+
+def negotiate_format(requested: str | None, accept: str | None) -> str:
+    """The row format to answer with: an explicit ?format= wins over the Accept header."""
+    if requested:
+        return requested
+    if accept and COLUMNAR_MEDIA_TYPE in accept:
+        return "columnar"
+    return "records"
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """The best content coding the client accepts ("zstd" or "gzip"), or None."""
+    accepted = set()
+    for part in (accept_encoding or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = params.strip().removeprefix("q=")
+        if coding and quality not in ("0", "0.0", "0.00", "0.000"):
+            accepted.add(coding.strip())
+    if zstandard is not None and "zstd" in accepted:
+        return "zstd"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def column_values(series: pd.Series) -> list:
+    """The values of a column as a JSON-friendly list, with None for missing values."""
+    if series.dtype.kind == "M" and getattr(series.dt, "tz", None) is None:
+        # ISO strings in one vectorized step, instead of a Timestamp per value.
+        stamps = series.to_numpy().astype("datetime64[us]")
+        whole_seconds = not (stamps.view("int64") % 1_000_000).any()
+        values = np.datetime_as_string(stamps, unit="s" if whole_seconds else "us").tolist()
+    else:
+        values = series.tolist()
+    if series.hasnans:
+        missing = series.isna().to_numpy()
+        values = [None if is_missing else value for value, is_missing in zip(values, missing)]
+    return values
+
+
+def encode_rows(frame: pd.DataFrame, row_format: str) -> dict:
+    """The rows of `frame` in the given wire format: {"rows": [...]} or {"data": [...]}."""
+    if row_format == "columnar":
+        return {"data": [column_values(frame.iloc[:, i]) for i in range(frame.shape[1])]}
+    return {"rows": frame.to_dict(orient="records")}
+
+
+def compress(body: bytes, encoding: str | None) -> tuple[bytes, dict]:
+    """
+    Compresses a whole response body.
+
+    Returns:
+        tuple: (body, headers) - the headers to send with it (Content-Encoding
+               and Vary), empty when the body is sent uncompressed.
+    """
+    if encoding is None or len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return body, {}
+    if encoding == "zstd":
+        body = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    else:
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body, {"Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+
+
+class StreamCompressor:
+    """
+    Compresses a streamed body piece by piece. Each piece is flushed, so the
+    client can decode every event as soon as it arrives.
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+            self._flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            # wbits=31 writes the gzip header and trailer.
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._flush_mode = zlib.Z_SYNC_FLUSH
+
+    @property
+    def headers(self) -> dict:
+        return {"Content-Encoding": self.encoding, "Vary": "Accept-Encoding"}
+
+    def compress(self, piece: bytes) -> bytes:
+        return self._compressor.compress(piece) + self._compressor.flush(self._flush_mode)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
@@ -1,21 +1,87 @@
+from __future__ import annotations
+
 import os
-import pandas as pd
-from openai import AzureOpenAI
+import re
+import asyncio
 import textwrap
+from typing import TYPE_CHECKING
+
+import core.prompt_builder as prompt_builder
+import core.tracing as tracing
+from core.lazy_import import lazy_import
+from core.result_stats import batch_breakdown, describe_runs, numeric_stats, result_info, top_values, with_means
+
+if TYPE_CHECKING:
+    from openai import AsyncAzureOpenAI
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
 
 # --- Placeholders ---
 # These will be configured by main.py when the server starts.
-client: AzureOpenAI = None
+client: AsyncAzureOpenAI = None
 AZURE_MODEL_NAME: str = None
 
-def summarize_result(history: list[dict[str, str]], query_result_df: pd.DataFrame):
-    """
-    Analyzes a query's result to generate a natural language summary.
-    This version pre-processes the data in Python for accuracy before sending it to the AI.
+# Rows of a plain result shown to the model (aggregates cover the rest), and
+# the token cap on the whole pre-processed summary.
+SUMMARY_MAX_ROWS = int(os.getenv("SUMMARY_MAX_ROWS", "50"))
+SUMMARY_DATA_TOKEN_BUDGET = int(os.getenv("SUMMARY_DATA_TOKEN_BUDGET", "2000"))
+# Results with at most this many cells (rows x columns) are formatted in Python
+# instead of by the AI (see fast_summary); 0 sends every result to the AI.
+FAST_SUMMARY_MAX_CELLS = int(os.getenv("FAST_SUMMARY_MAX_CELLS", "12"))
+# Summaries written so far, by how: "llm" or a fast_summary kind.
+summary_counts: dict[str, int] = {}
+
+
+class SummaryError(Exception):
+    """Raised by `stream_summary` when the model fails; its message is the error text to show."""
+
+# The BatchNo/TranNo breakdown lists at most this many batches (the largest),
+# each with at most this many TranNo ranges.
+BREAKDOWN_MAX_BATCHES = int(os.getenv("BREAKDOWN_MAX_BATCHES", "25"))
+BREAKDOWN_MAX_RANGES = int(os.getenv("BREAKDOWN_MAX_RANGES", "20"))
+# Most common values listed per text column when not every row is shown.
+SUMMARY_TOP_VALUES = int(os.getenv("SUMMARY_TOP_VALUES", "5"))
+
+# The system prompt, dedented once; build_summary_messages fills in the fields.
+SUMMARY_SYSTEM_PROMPT = textwrap.dedent("""
+    You are a helpful assistant. A user asked a question, and a program has already processed the data and created a factual summary.
+    Your only task is to rephrase the pre-processed summary below into a single, clear, and friendly paragraph or list.
+
+    ---
+    CONTEXT:
+    - User's Question: "{user_question}"
+    - The conversation so far:
+    {history}
+    - Pre-processed Data Summary to use for your answer:
+    ---
+    {pre_processed_summary}
+    ---
+
+    BUSINESS RULES for Summarization:
+    1.  **CRITICAL RULE for No Results**: If the summary says "no results," provide a direct, negative answer to the user's question (e.g., "No rejected transactions were found for that batch.").
+    2.  **CRITICAL RULE for Single-Value Answers**: If the data is just a single number, directly state what that number represents (e.g., "There were 73 rejected transactions.").
+    3.  **NEW RULE for Rejection Reasons**: If the data contains a 'RejDesc' column, your summary should clearly list all the rejection reasons found.
+    4.  **CRITICAL RULE for Accuracy**: You MUST use the exact numerical values and text from the pre-processed data. Do not invent information.
+    ---
+
+    YOUR TASK:
+    - Present the information from the pre-processed summary in a natural, conversational way, following all the rules.
+    - Do not add any extra notes like "(Note: the above is illustrative)". """)
 
+def format_number(value: float) -> str:
+    """Whole numbers without decimals, everything else rounded to 2 places."""
+    return str(int(value)) if float(value).is_integer() else f"{value:.2f}"
+
+def preprocess_result(query_result_df: pd.DataFrame) -> str:
+    """
+    Pre-processes a query's result in Python for accuracy: a factual text
+    version of it for the AI (or the user) to read.
     """
-    user_question = history[-1]["content"]
     pre_processed_summary = ""
+    # Set when the executor capped the result; its stats cover every row.
+    info = result_info(query_result_df)
+    truncated = info is not None and info.truncated
 
     # --- START OF DATA PRE-PROCESSING LOGIC ---
 
@@ -25,78 +91,227 @@ def summarize_result(history: list[dict[str, str]], query_result_df: pd.DataFram
 
     # CASE 1: Handle the complex breakdown for rejected transactions per batch.
     elif 'BatchNo' in query_result_df.columns and 'TranNo' in query_result_df.columns:
-        # Use pandas to group by BatchNo and get the unique transaction numbers
-        grouped = query_result_df.groupby('BatchNo')['TranNo'].unique()
-
-        # Calculate overall totals
-        total_items = len(query_result_df)
-        total_unique_transactions = query_result_df['TranNo'].nunique()
-        total_batches = len(grouped)
+        if truncated:
+            # Use the executor's aggregates, which include the rows left out
+            breakdown = describe_runs(info.stats["batch_runs"], BREAKDOWN_MAX_BATCHES, BREAKDOWN_MAX_RANGES)
+            total_items = info.total_rows
+        else:
+            breakdown = batch_breakdown(query_result_df, BREAKDOWN_MAX_BATCHES, BREAKDOWN_MAX_RANGES)
+            total_items = len(query_result_df)
 
         # Build a simple, factual text breakdown
         summary_lines = [
-            f"A total of {total_items} items were found, belonging to {total_unique_transactions} unique transactions across {total_batches} batches.",
+            f"A total of {total_items} items were found, belonging to {breakdown['unique_tran_count']} unique transactions across {breakdown['total_batches']} batches.",
             "Here is the breakdown:"
         ]
 
-        for batch_no, tran_nos in grouped.items():
-            num_trans_in_batch = len(tran_nos)
-            tran_list = ", ".join(map(str, sorted(tran_nos))) # Sort for consistency
+        for batch in breakdown["batches"]:
+            # Consecutive transaction numbers are written as ranges, e.g. "1-40, 42".
+            tran_list = ", ".join(str(start) if start == end else f"{start}-{end}" for start, end in batch["ranges"])
+            if batch["more_ranges"]:
+                tran_list += f" and {batch['more_ranges']} more ranges"
             summary_lines.append(
-                f"- For batch number {batch_no}, there were {num_trans_in_batch} transactions with the numbers: {tran_list}."
+                f"- For batch number {batch['batch_no']}, there were {batch['tran_count']} transactions with the numbers: {tran_list}."
+            )
+        if breakdown["other_batches"]:
+            summary_lines.append(
+                f"- The other {breakdown['other_batches']} batches had {breakdown['other_trans']} transactions in total."
             )
 
         pre_processed_summary = "\n".join(summary_lines)
 
     # CASE 2: Handle all other simple queries.
     else:
-        pre_processed_summary = query_result_df.to_string()
+        # Only the first rows are rendered; the model gets aggregates over all of them.
+        shown = query_result_df.head(SUMMARY_MAX_ROWS)
+        pre_processed_summary = shown.to_string()
+        total_rows = info.total_rows if truncated else len(query_result_df)
+        if len(shown) < total_rows:
+            at_least = "at least " if truncated and not info.total_rows_exact else ""
+            # Aggregates over every row: the executor's when it capped the result.
+            numeric = info.stats["numeric"] if truncated else with_means(numeric_stats(query_result_df))
+            note_lines = [
+                f"Note: The query returned {at_least}{total_rows} rows; only the first {len(shown)} are shown above.",
+            ]
+            for column, stats in numeric.items():
+                note_lines.append(
+                    f"- Over all rows, {column}: sum {format_number(stats['sum'])}, min {format_number(stats['min'])}, "
+                    f"max {format_number(stats['max'])}, average {format_number(stats['mean'])}."
+                )
+            for column, values in top_values(query_result_df, SUMMARY_TOP_VALUES, max_columns=10).items():
+                common = ", ".join(f"{value} ({count})" for value, count in values["top"])
+                scope = "" if not truncated else f" in the first {len(query_result_df)} rows"
+                note_lines.append(f"- {column} has {values['distinct']} distinct values{scope}; the most common are: {common}.")
+            pre_processed_summary += "\n" + "\n".join(note_lines)
 
     # --- END OF DATA PRE-PROCESSING LOGIC ---
 
+    return pre_processed_summary
 
-    # The new prompt is much simpler: its only job is to format our pre-processed summary.
-    system_prompt = textwrap.dedent(f"""
-        You are a helpful assistant. A user asked a question, and a program has already processed the data and created a factual summary.
-        Your only task is to rephrase the pre-processed summary below into a single, clear, and friendly paragraph or list.
+def build_summary_messages(history: list[dict[str, str]], query_result_df: pd.DataFrame) -> list[dict[str, str]]:
+    """
+    Builds the chat messages that ask the AI to phrase the pre-processed
+    result as a natural language summary.
+    """
+    user_question = history[-1]["content"]
+    pre_processed_summary = preprocess_result(query_result_df)
+
+    # Keep the prompt bounded however large the result or the conversation is.
+    pre_processed_summary = prompt_builder.cap_text(pre_processed_summary, SUMMARY_DATA_TOKEN_BUDGET)
+    conversation = prompt_builder.trim_history(history, prompt_builder.SUMMARY_HISTORY_TOKEN_BUDGET)
 
-        ---
-        CONTEXT:
-        - User's Question: "{user_question}"
-        - The full conversation so far: {history}
-        - Pre-processed Data Summary to use for your answer:
-        ---
-        {pre_processed_summary}
-        ---
+    # The prompt's only job is to format our pre-processed summary.
+    system_prompt = SUMMARY_SYSTEM_PROMPT.format(
+        user_question=user_question,
+        history=prompt_builder.format_history(conversation),
+        pre_processed_summary=pre_processed_summary,
+    )
 
-        BUSINESS RULES for Summarization:
-        1.  **CRITICAL RULE for No Results**: If the summary says "no results," provide a direct, negative answer to the user's question (e.g., "No rejected transactions were found for that batch.").
-        2.  **CRITICAL RULE for Single-Value Answers**: If the data is just a single number, directly state what that number represents (e.g., "There were 73 rejected transactions.").
-        3.  **NEW RULE for Rejection Reasons**: If the data contains a 'RejDesc' column, your summary should clearly list all the rejection reasons found.
-        4.  **CRITICAL RULE for Accuracy**: You MUST use the exact numerical values and text from the pre-processed data. Do not invent information.
-        ---
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": "Please provide the final, user-friendly summary."}
+    ]
 
-        YOUR TASK:
-        - Present the information from the pre-processed summary in a natural, conversational way, following all the rules.
-        - Do not add any extra notes like "(Note: the above is illustrative)". """)
+def _label(column) -> str:
+    """'TotalTrans' -> 'Total Trans', 'batch_no' -> 'batch no'; '' for unnamed columns."""
+    return re.sub(r"(?<=[a-z0-9])(?=[A-Z])", " ", str(column)).replace("_", " ").strip()
+
+def _format_value(value) -> str:
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return "no value"
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool):
+        return format_number(float(value))
+    return str(value).strip()
+
+def fast_summary(query_result_df: pd.DataFrame):
+    """
+    Formats results that need no rephrasing directly in Python:
+
+    - "empty": no rows.
+    - "single_value": one cell, e.g. SUM(TotalTrans).
+    - "lookup": at most FAST_SUMMARY_MAX_CELLS cells, e.g. a batch's status.
+    - "breakdown": the BatchNo/TranNo breakdown, already written out by
+      `preprocess_result`.
+
+    Returns:
+        tuple: (kind, summary), or None if the AI should write the summary.
+    """
+    if FAST_SUMMARY_MAX_CELLS <= 0:
+        return None
+    info = result_info(query_result_df)
+    if query_result_df.empty:
+        return "empty", "No matching records were found."
+    if 'BatchNo' in query_result_df.columns and 'TranNo' in query_result_df.columns:
+        return "breakdown", preprocess_result(query_result_df)
+    if (info is not None and info.truncated) or query_result_df.size > FAST_SUMMARY_MAX_CELLS:
+        return None
+
+    columns = list(query_result_df.columns)
+    rows = query_result_df.itertuples(index=False, name=None)
+    if query_result_df.size == 1:
+        label, value = _label(columns[0]), _format_value(query_result_df.iat[0, 0])
+        return "single_value", f"{label}: {value}." if label else f"The result is {value}."
+    if len(columns) == 1:
+        lines = [f"- {_format_value(row[0])}" for row in rows]
+        heading = f"{_label(columns[0]) or 'Results'} ({len(lines)}):"
+    elif len(query_result_df) == 1:
+        lines = [f"- {_label(column) or 'Value'}: {_format_value(value)}" for column, value in zip(columns, next(rows))]
+        heading = "Here is what was found:"
+    else:
+        lines = [
+            "- " + ", ".join(f"{_label(column) or 'Value'}: {_format_value(value)}" for column, value in zip(columns, row))
+            for row in rows
+        ]
+        heading = f"Here are the {len(lines)} results:"
+    return "lookup", "\n".join([heading, *lines])
+
+def _count_summary(kind: str):
+    summary_counts[kind] = summary_counts.get(kind, 0) + 1
+
+def summary_stats() -> dict:
+    """How many summaries were formatted in Python (by kind) versus by the AI."""
+    total = sum(summary_counts.values())
+    fast = total - summary_counts.get("llm", 0)
+    return {
+        "counts": dict(summary_counts),
+        "total": total,
+        "skipped_llm_fraction": round(fast / total, 4) if total else 0.0,
+    }
+
+async def summarize_result(history: list[dict[str, str]], query_result_df: pd.DataFrame):
+    """
+    Analyzes a query's result to generate a natural language summary.
+    This version pre-processes the data in Python for accuracy before sending it to the AI.
+    Results simple enough for `fast_summary` are answered without the AI.
+    """
+    fast = fast_summary(query_result_df)
+    if fast is not None:
+        kind, summary = fast
+        print(f"--- Summary formatted without the AI ({kind}) ---")
+        _count_summary(kind)
+        return summary
+    _count_summary("llm")
+    messages = build_summary_messages(history, query_result_df)
 
     print("--- Sending pre-processed data to Azure OpenAI for formatting ---")
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=AZURE_MODEL_NAME,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": "Please provide the final, user-friendly summary."}
-            ],
+            messages=messages,
             temperature=0,
             max_tokens=1500
         )
+        prompt_builder.log_prompt_tokens("summarization", messages, response.usage)
+        tracing.record_usage("summarization", response.usage)
         summary = response.choices[0].message.content.strip()
         return summary
     except Exception as e:
         print(f"An error occurred with the OpenAI API: {e}")
         return f"Error: Failed to summarize the result. {e}"
 
+async def stream_summary(history: list[dict[str, str]], query_result_df: pd.DataFrame):
+    """
+    Same as `summarize_result`, but yields the summary piece by piece as the
+    model generates it. A `fast_summary` is yielded in one piece.
+
+    Raises:
+        SummaryError: if the model call fails, possibly after some pieces
+            were yielded (so the caller knows the summary is incomplete).
+    """
+    fast = fast_summary(query_result_df)
+    if fast is not None:
+        kind, summary = fast
+        print(f"--- Summary formatted without the AI ({kind}) ---")
+        _count_summary(kind)
+        yield summary
+        return
+    _count_summary("llm")
+    messages = build_summary_messages(history, query_result_df)
+
+    print("--- Streaming pre-processed data summary from Azure OpenAI ---")
+    try:
+        stream = await client.chat.completions.create(
+            model=AZURE_MODEL_NAME,
+            messages=messages,
+            temperature=0,
+            max_tokens=1500,
+            stream=True,
+            # The last chunk then carries the usage of the whole call.
+            stream_options={"include_usage": True}
+        )
+        usage = None
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            # Azure can send chunks with no choices (e.g. content filter results).
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        prompt_builder.log_prompt_tokens("summarization", messages, usage)
+        tracing.record_usage("summarization", usage)
+    except Exception as e:
+        print(f"An error occurred with the OpenAI API: {e}")
+        raise SummaryError(f"Error: Failed to summarize the result. {e}") from e
+
 # --- Example of how to run this file directly for testing ---
 if __name__ == '__main__':
     test_question = "How many records are in the tblItemStatistics table?"
@@ -109,7 +324,8 @@ if __name__ == '__main__':
     print("\n--- Sample Data from Database ---")
     print(test_data.to_string())
     
-    summary = summarize_result(user_question=test_question, query_result_df=test_data)
+    history = [{"role": "user", "content": test_question}]
+    summary = asyncio.run(summarize_result(history, test_data))
 
     print("\n--- Generated Summary ---")
     print(summary)
\ No newline at end of file
@@ -0,0 +1,263 @@
+# backend/core/result_cache.py
+"""
+Cache for query results and their summaries.
+
+Entries are keyed on the normalized SQL text plus the target engine, so any
+question that produces the same SQL reuses the same DataFrame. Summaries are
+additionally keyed on the whole conversation they answered (the summary prompt
+includes it), so a follow-up never gets a summary written for another
+conversation. Each entry expires after a
+TTL taken from the tables the query reads: short for fast-changing tables such
+as PSGTMS.DetailFile1, long for lookup tables such as PSGTMS.TDF_BatchValues.
+
+Two backends are available, chosen with RESULT_CACHE_BACKEND:
+- "memory" (default): a per-process LRU bounded by total bytes.
+- "sqlite": a local SQLite file shared by every worker on the machine.
+- "off": disables the cache.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from sqlparse import lexer, tokens as T
+
+from core.lazy_import import lazy_import
+
+pd = lazy_import("pandas")
+
+# --- TTL configuration ---
+DEFAULT_TTL_SECONDS = int(os.getenv("RESULT_CACHE_DEFAULT_TTL", "300"))
+TABLE_TTL_SECONDS = {
+    "psgtms.detailfile1": 30,
+    "psgtms.batchfile": 60,
+    "psgtms.tdf_batchvalues": 3600,
+    "psgtms.tdf_batchmodes": 3600,
+    "psgtms.worksrcdesc": 3600,
+    "psgtms.rejreason": 3600,
+    "psgauditstats.tblauditlogmaster": 30,
+    "psgauditstats.tblauditlogdetail": 30,
+}
+
+# --- Size limits ---
+MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Larger results are not cached at all, to keep (de)serialization cheap.
+MAX_ENTRY_BYTES = int(os.getenv("RESULT_CACHE_MAX_ENTRY_BYTES", str(5 * 1024 * 1024)))
+
+_TABLE_NAME_PATTERN = re.compile(r"\[?(\w+)\]?\s*\.\s*\[?(\w+)\]?")
+
+
+def normalize_sql(sql_query: str) -> str:
+    """
+    Collapses whitespace and drops the trailing semicolon. Whitespace inside
+    string literals and quoted identifiers is kept: 'A  B' and 'A B' are
+    different queries.
+    """
+    if not any(quote in sql_query for quote in "'\"["):
+        return " ".join(sql_query.split()).rstrip(";").strip()
+    parts, pending_space = [], False
+    for ttype, value in lexer.tokenize(sql_query):
+        if ttype in T.Whitespace:
+            pending_space = True
+            continue
+        if pending_space and parts:
+            parts.append(" ")
+        parts.append(value)
+        pending_space = False
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def ttl_for(sql_query: str) -> int:
+    """The shortest TTL among the known tables the query references."""
+    ttls = [
+        TABLE_TTL_SECONDS[name]
+        for name in (f"{schema}.{table}".lower() for schema, table in _TABLE_NAME_PATTERN.findall(sql_query))
+        if name in TABLE_TTL_SECONDS
+    ]
+    return min(ttls) if ttls else DEFAULT_TTL_SECONDS
+
+
+def _estimate_size(value) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    return len(value.encode("utf-8")) if isinstance(value, str) else 256
+
+
+class InProcessBackend:
+    """A per-process LRU with expiry, bounded by the estimated size of its values."""
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._data = OrderedDict()  # key -> (expires_at, size, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return entry[2]
+
+    def set(self, key: str, value, ttl: int):
+        size = _estimate_size(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.time() + ttl, size, value)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and self._data:
+                self._remove(next(iter(self._data)))
+
+    def _remove(self, key: str):
+        _, size, _ = self._data.pop(key)
+        self.total_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """A cache stored in a local SQLite file, shared by every worker process."""
+
+    def __init__(self, path: str, max_bytes: int = MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS result_cache (
+                key TEXT PRIMARY KEY, expires_at REAL, last_access REAL, size INTEGER, value BLOB)""")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        conn = self._connect()
+        row = conn.execute("SELECT expires_at, value FROM result_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        with conn:
+            if row[0] < now:
+                conn.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE result_cache SET last_access = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[1])
+
+    def set(self, key: str, value, ttl: int):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO result_cache VALUES (?, ?, ?, ?, ?)",
+                         (key, now + ttl, now, len(blob), blob))
+            conn.execute("DELETE FROM result_cache WHERE expires_at < ?", (now,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM result_cache").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn, total - self.max_bytes)
+
+    def _evict(self, conn: sqlite3.Connection, bytes_to_free: int):
+        """Deletes least recently used entries until `bytes_to_free` is reclaimed."""
+        freed, doomed = 0, []
+        for key, size in conn.execute("SELECT key, size FROM result_cache ORDER BY last_access"):
+            doomed.append((key,))
+            freed += size
+            if freed >= bytes_to_free:
+                break
+        conn.executemany("DELETE FROM result_cache WHERE key = ?", doomed)
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM result_cache")
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM result_cache").fetchone()[0]
+
+
+def create_backend(kind: str):
+    if kind == "off":
+        return None
+    if kind == "sqlite":
+        return SQLiteBackend(os.getenv("RESULT_CACHE_PATH", "result_cache.sqlite3"))
+    return InProcessBackend()
+
+
+backend = create_backend(os.getenv("RESULT_CACHE_BACKEND", "memory").lower())
+hits = {"result": 0, "summary": 0}
+misses = {"result": 0, "summary": 0}
+
+
+def _key(kind: str, engine_name: str, sql_query: str, question: str = "") -> str:
+    raw = f"{kind}\0{engine_name}\0{normalize_sql(sql_query)}\0{question}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _get(kind: str, key: str):
+    if backend is None:
+        return None
+    value = backend.get(key)
+    if value is None:
+        misses[kind] += 1
+    else:
+        hits[kind] += 1
+    return value
+
+
+def _set(kind: str, key: str, value, sql_query: str):
+    if backend is None or _estimate_size(value) > MAX_ENTRY_BYTES:
+        return
+    backend.set(key, value, ttl_for(sql_query))
+
+
+def get_result(engine_name: str, sql_query: str) -> pd.DataFrame | None:
+    """A cached result DataFrame for this SQL on this engine, or None."""
+    return _get("result", _key("result", engine_name, sql_query))
+
+
+def set_result(engine_name: str, sql_query: str, result_df: pd.DataFrame):
+    _set("result", _key("result", engine_name, sql_query), result_df, sql_query)
+
+
+def _conversation(history: list[dict[str, str]]) -> str:
+    return json.dumps([[message.get("role"), message.get("content")] for message in history], ensure_ascii=False)
+
+
+def get_summary(engine_name: str, sql_query: str, history: list[dict[str, str]]) -> str | None:
+    """A cached summary of this SQL's result for this conversation, or None."""
+    return _get("summary", _key("summary", engine_name, sql_query, _conversation(history)))
+
+
+def set_summary(engine_name: str, sql_query: str, history: list[dict[str, str]], summary: str):
+    _set("summary", _key("summary", engine_name, sql_query, _conversation(history)), summary, sql_query)
+
+
+def stats() -> dict:
+    """Hit/miss counters and the current size of the cache."""
+    return {
+        "backend": type(backend).__name__ if backend is not None else "off",
+        "entries": len(backend) if backend is not None else 0,
+        "hits": dict(hits),
+        "misses": dict(misses),
+    }
@@ -0,0 +1,292 @@
+# backend/core/result_stats.py
+"""
+Incremental statistics over a query result, computed chunk by chunk.
+
+The query executor feeds every fetched chunk through a `ResultAggregator`,
+including chunks past the row/byte cap that are not kept in memory, so the
+summarizer still gets exact totals for results too large to load.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+
+@dataclass(frozen=True)
+class ResultInfo:
+    """
+    Describes the full result behind a possibly truncated DataFrame. The
+    executor stores it in `result_df.attrs["result_info"]`.
+    """
+    truncated: bool
+    total_rows: int
+    total_rows_exact: bool
+    stats: dict
+
+    def __deepcopy__(self, memo):
+        # pandas deep-copies DataFrame.attrs into every derived frame (each
+        # slice, each groupby), so share this read-only object instead.
+        return self
+
+
+def result_info(result_df: pd.DataFrame) -> ResultInfo | None:
+    """The ResultInfo attached to a result DataFrame, if any."""
+    return result_df.attrs.get("result_info")
+
+
+def numeric_stats(frame: pd.DataFrame) -> dict:
+    """count/sum/min/max of every numeric column, ignoring missing values."""
+    stats = {}
+    for column in frame.select_dtypes(include="number").columns:
+        values = frame[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        values = values[~np.isnan(values)]
+        if len(values):
+            stats[str(column)] = {
+                "count": len(values),
+                "sum": float(values.sum()),
+                "min": float(values.min()),
+                "max": float(values.max()),
+            }
+    return stats
+
+
+def with_means(stats: dict) -> dict:
+    return {column: {**s, "mean": s["sum"] / s["count"]} for column, s in stats.items()}
+
+
+@dataclass(frozen=True)
+class BatchRuns:
+    """
+    Distinct BatchNo/TranNo pairs as runs of consecutive TranNo: run i covers
+    TranNo starts[i]..ends[i] of batch batch_values[codes[i]]. Runs are sorted
+    by batch, then TranNo, and never overlap or touch. Non-integer TranNo
+    values are each their own run (start == end).
+    """
+    batch_values: np.ndarray  # every BatchNo seen, in BatchNo order
+    codes: np.ndarray
+    starts: np.ndarray
+    ends: np.ndarray
+
+    @property
+    def integer(self) -> bool:
+        return np.issubdtype(self.starts.dtype, np.integer)
+
+
+def batch_runs(pairs: pd.DataFrame, sort: bool = True) -> BatchRuns:
+    """
+    The BatchRuns of BatchNo/TranNo rows, computed without a Python loop over
+    the rows. With sort=False, batch_values are in order of appearance.
+    """
+    # Hash the BatchNo strings once; everything after works on integer codes.
+    codes, batch_values = pd.factorize(pairs["BatchNo"], sort=sort)
+    tran_nos = pairs["TranNo"].to_numpy()
+    keep = (codes >= 0) & ~pd.isna(tran_nos)
+    codes, tran_nos = codes[keep], tran_nos[keep]
+    if np.issubdtype(tran_nos.dtype, np.floating) and np.all(np.mod(tran_nos, 1) == 0):
+        tran_nos = tran_nos.astype(np.int64)
+    batch_values = np.asarray(batch_values, dtype=object)
+    if not len(codes):
+        return BatchRuns(batch_values, codes.astype(np.int64), tran_nos, tran_nos)
+
+    # Sort by (batch, TranNo) and drop repeated pairs (several items of one
+    # transaction). A new run starts wherever the batch changes or TranNo does
+    # not follow on from the previous one.
+    integer_trans = np.issubdtype(tran_nos.dtype, np.integer)
+    if integer_trans and int(tran_nos.max()) - int(tran_nos.min()) <= 0xFFFFFFFF:
+        # Pack (batch, TranNo) into one int64 so a single sort dedupes both.
+        offset = tran_nos.min()
+        keys = np.sort((codes.astype(np.int64) << 32) | (tran_nos - offset).astype(np.int64))
+        keys = keys[np.r_[True, keys[1:] != keys[:-1]]]
+        codes, tran_nos = keys >> 32, (keys & 0xFFFFFFFF) + offset
+    else:
+        order = np.lexsort((tran_nos, codes))
+        codes, tran_nos = codes[order].astype(np.int64), tran_nos[order]
+        distinct = np.ones(len(codes), dtype=bool)
+        distinct[1:] = (codes[1:] != codes[:-1]) | (tran_nos[1:] != tran_nos[:-1])
+        codes, tran_nos = codes[distinct], tran_nos[distinct]
+    new_run = np.ones(len(tran_nos), dtype=bool)
+    if integer_trans:
+        new_run[1:] = (codes[1:] != codes[:-1]) | (np.diff(tran_nos) != 1)
+    run_starts = np.flatnonzero(new_run)
+    run_ends = np.r_[run_starts[1:], len(tran_nos)] - 1
+    return BatchRuns(batch_values, codes[run_starts], tran_nos[run_starts], tran_nos[run_ends])
+
+
+def merge_runs(codes: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sorts runs by (batch code, start) and merges the ones of a batch that
+    overlap or touch, e.g. 1-5 and 6-9 into 1-9. Non-integer values are only
+    deduplicated.
+    """
+    if not len(codes):
+        return codes, starts, ends
+    integer = np.issubdtype(starts.dtype, np.integer)
+    if integer and int(ends.max()) - int(starts.min()) <= 0xFFFFFFFF:
+        # Pack (batch, TranNo) into one int64, as in batch_runs: one sort, and
+        # a running maximum of the packed ends is the furthest end so far
+        # within each batch.
+        offset = starts.min()
+        high = codes.astype(np.int64) << 32
+        start_keys = high | (starts - offset).astype(np.int64)
+        order = np.argsort(start_keys, kind="stable")
+        codes, start_keys = codes[order], start_keys[order]
+        reach = np.maximum.accumulate((high | (ends - offset).astype(np.int64))[order])
+        reach = (reach & 0xFFFFFFFF) + offset
+        starts = (start_keys & 0xFFFFFFFF) + offset
+    else:
+        order = np.lexsort((starts, codes))
+        codes, starts, ends = codes[order], starts[order], ends[order]
+        if not integer:
+            new_run = np.ones(len(codes), dtype=bool)
+            new_run[1:] = (codes[1:] != codes[:-1]) | (starts[1:] != starts[:-1])
+            return codes[new_run], starts[new_run], ends[new_run]
+        # The furthest end so far in each batch, so a run inside an earlier, longer one is merged into it.
+        reach = pd.Series(ends).groupby(codes).cummax().to_numpy()
+    new_run = np.ones(len(codes), dtype=bool)
+    new_run[1:] = (codes[1:] != codes[:-1]) | (starts[1:] > reach[:-1] + 1)
+    run_starts = np.flatnonzero(new_run)
+    run_ends = np.r_[run_starts[1:], len(codes)] - 1
+    return codes[run_starts], starts[run_starts], reach[run_ends]
+
+
+def describe_runs(runs: BatchRuns, max_batches: int, max_ranges: int) -> dict:
+    """
+    Transactions per batch from BatchRuns. Only the `max_batches` batches with
+    the most transactions are described, each with at most `max_ranges` runs
+    of consecutive TranNo, so the size of the result does not depend on the
+    number of rows.
+
+    Returns:
+        dict: total_batches, unique_tran_count, batches (a list of
+              {batch_no, tran_count, ranges, more_ranges} in BatchNo order),
+              other_batches and other_trans (the batches left out).
+    """
+    codes, starts, ends, batch_values = runs.codes, runs.starts, runs.ends, runs.batch_values
+    if not len(codes):
+        return {"total_batches": 0, "unique_tran_count": 0, "batches": [], "other_batches": 0, "other_trans": 0}
+    if runs.integer:
+        sizes = (ends - starts + 1).astype(np.int64)
+        # Transactions in several batches count once: merge every batch's runs.
+        _, all_starts, all_ends = merge_runs(np.zeros(len(codes), dtype=np.int64), starts, ends)
+        unique_tran_count = int((all_ends - all_starts + 1).sum())
+    else:
+        sizes = np.ones(len(codes), dtype=np.int64)
+        unique_tran_count = int(pd.unique(starts).size)
+    runs_per_batch = np.bincount(codes, minlength=len(batch_values))
+    first_run = np.r_[0, np.cumsum(runs_per_batch)[:-1]]
+    tran_counts = np.bincount(codes, weights=sizes, minlength=len(batch_values)).astype(np.int64)
+
+    # The largest batches, listed in BatchNo order.
+    top = np.sort(np.argsort(-tran_counts, kind="stable")[:max_batches])
+    batches = []
+    for b in top:
+        shown = min(int(runs_per_batch[b]), max_ranges)
+        batches.append({
+            "batch_no": batch_values[b],
+            "tran_count": int(tran_counts[b]),
+            "ranges": list(zip(starts[first_run[b]:first_run[b] + shown].tolist(),
+                               ends[first_run[b]:first_run[b] + shown].tolist())),
+            "more_ranges": int(runs_per_batch[b]) - shown,
+        })
+    return {
+        "total_batches": len(batch_values),
+        "unique_tran_count": unique_tran_count,
+        "batches": batches,
+        "other_batches": len(batch_values) - len(top),
+        "other_trans": int(tran_counts.sum() - tran_counts[top].sum()),
+    }
+
+
+def batch_breakdown(pairs: pd.DataFrame, max_batches: int, max_ranges: int) -> dict:
+    """Transactions per batch from BatchNo/TranNo rows (see `describe_runs`)."""
+    return describe_runs(batch_runs(pairs), max_batches, max_ranges)
+
+
+def top_values(frame: pd.DataFrame, n: int, max_columns: int) -> dict:
+    """The `n` most common values (with counts) of up to `max_columns` non-numeric columns."""
+    tops = {}
+    for column in frame.select_dtypes(exclude="number").columns[:max_columns]:
+        counts = frame[column].value_counts(dropna=True)
+        if len(counts):
+            tops[str(column)] = {"distinct": len(counts), "top": list(counts.head(n).items())}
+    return tops
+
+
+class ResultAggregator:
+    """
+    Accumulates row counts, numeric column stats and the runs of consecutive
+    TranNo per batch. Each chunk's BatchNo/TranNo pairs are folded into the
+    runs as it arrives, so memory grows with the number of runs, not rows.
+    """
+
+    def __init__(self):
+        self.row_count = 0
+        self.numeric = {}
+        self._batches = None      # every BatchNo seen (an Index), in order of first appearance
+        self._runs = None         # (codes, starts, ends) merged so far
+        # Chunks' runs not merged yet. They are merged once there are as many
+        # as merged runs, so scattered TranNo values do not re-sort everything
+        # for every chunk.
+        self._pending = []
+        self._pending_count = 0
+
+    def update(self, chunk: pd.DataFrame):
+        self.row_count += len(chunk)
+
+        for column, chunk_stats in numeric_stats(chunk).items():
+            stats = self.numeric.setdefault(column, {"count": 0, "sum": 0.0, "min": np.inf, "max": -np.inf})
+            stats["count"] += chunk_stats["count"]
+            stats["sum"] += chunk_stats["sum"]
+            stats["min"] = min(stats["min"], chunk_stats["min"])
+            stats["max"] = max(stats["max"], chunk_stats["max"])
+
+        if "BatchNo" in chunk.columns and "TranNo" in chunk.columns:
+            if self._batches is None:
+                self._batches = pd.Index([], dtype=object)
+            self._add_runs(batch_runs(chunk, sort=False))
+
+    def _add_runs(self, chunk_runs: BatchRuns):
+        # Number the chunk's batches like the ones seen before; new ones go last.
+        to_code = self._batches.get_indexer(chunk_runs.batch_values)
+        new = to_code < 0
+        if new.any():
+            to_code[new] = np.arange(len(self._batches), len(self._batches) + new.sum())
+            self._batches = self._batches.append(pd.Index(chunk_runs.batch_values[new], dtype=object))
+        if len(chunk_runs.codes):
+            self._pending.append((to_code[chunk_runs.codes], chunk_runs.starts, chunk_runs.ends))
+            self._pending_count += len(chunk_runs.codes)
+            if self._pending_count >= (len(self._runs[0]) if self._runs is not None else 0):
+                self._merge_pending()
+
+    def _merge_pending(self):
+        if self._pending:
+            parts = self._pending if self._runs is None else [self._runs, *self._pending]
+            self._runs = merge_runs(*(np.concatenate(arrays) for arrays in zip(*parts)))
+            self._pending, self._pending_count = [], 0
+
+    def runs(self) -> BatchRuns | None:
+        """The runs of every chunk so far, with batches renumbered in BatchNo order."""
+        if self._batches is None:
+            return None
+        self._merge_pending()
+        if self._runs is None:
+            empty = np.empty(0, dtype=np.int64)
+            return BatchRuns(np.empty(0, dtype=object), empty, empty, empty)
+        batch_values = self._batches.to_numpy(dtype=object)
+        order = np.argsort(batch_values, kind="stable")
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        codes, starts, ends = merge_runs(rank[self._runs[0]], self._runs[1], self._runs[2])
+        return BatchRuns(batch_values[order], codes, starts, ends)
+
+    def summary(self) -> dict:
+        return {
+            "row_count": self.row_count,
+            "numeric": with_means(self.numeric),
+            # Runs of consecutive TranNo per batch over the whole result, for describe_runs.
+            "batch_runs": self.runs(),
+        }
@@ -1,32 +1,127 @@
 # backend/core/schema_retriever.py
-import numpy as np
-from openai import AzureOpenAI
+from __future__ import annotations
+
+import math
+import os
+import re
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+import core.embedding_store as embedding_store
+import core.tracing as tracing
+import core.vector_index as vector_index
+from core.cache import LRUCache, SemanticCache
+from core.lazy_import import lazy_import
+
+if TYPE_CHECKING:
+    from openai import AsyncAzureOpenAI
+
+np = lazy_import("numpy")
 
 
 # This client will be configured and passed from main.py
-client: AzureOpenAI = None 
+client: AsyncAzureOpenAI = None 
 AZURE_EMBEDDING_MODEL_NAME: str = None
 
-# This will hold our indexed schemas in memory
-schema_embeddings = []
+# This will hold our indexed schemas in memory. `schema_embeddings` is one
+# L2-normalized float32 matrix with a row per schema chunk.
+schema_embeddings = None
 schemas = []
 
-def get_embedding(text):
+# Above this many chunks, searches go through an approximate IVF index.
+ANN_INDEX_THRESHOLD = int(os.getenv("ANN_INDEX_THRESHOLD", "20000"))
+ann_index: vector_index.IVFIndex = None
+
+# The schema descriptions, chunks separated by '---'.
+SCHEMA_DESCRIPTION_FILE = Path(os.getenv(
+    "SCHEMA_DESCRIPTION_FILE",
+    Path(__file__).parent.parent / "models" / "schema_description.txt",
+))
+
+# How many texts to send per embeddings API call.
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+
+# --- Retrieval caches ---
+# Exact tier: normalized question text -> normalized question embedding.
+question_embedding_cache = LRUCache(int(os.getenv("QUESTION_EMBEDDING_CACHE_SIZE", "1024")))
+# Optional semantic tier: near-duplicate question embedding -> retrieved schema text.
+semantic_cache: SemanticCache = None
+if os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true":
+    semantic_cache = SemanticCache(
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97")),
+        max_size=int(os.getenv("SEMANTIC_CACHE_SIZE", "512")),
+    )
+
+async def get_embedding(text):
     """Generates an embedding for a given text."""
-    return client.embeddings.create(input=[text], model=AZURE_EMBEDDING_MODEL_NAME).data[0].embedding
+    with tracing.span("embedding"):
+        response = await client.embeddings.create(input=[text], model=AZURE_EMBEDDING_MODEL_NAME)
+    tracing.record_usage("embedding", response.usage)
+    return response.data[0].embedding
+
+async def get_embeddings(texts: list[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> list[list[float]]:
+    """Generates embeddings for many texts, sending them in batches of `batch_size`."""
+    embeddings = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        with tracing.span("embedding"):
+            response = await client.embeddings.create(input=batch, model=AZURE_EMBEDDING_MODEL_NAME)
+        tracing.record_usage("embedding", response.usage)
+        # The API may return items out of order, so sort them by their input index.
+        embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return embeddings
+
+def normalize_question(question: str) -> str:
+    """The cache key for a question: lower-cased, whitespace-collapsed, no trailing punctuation."""
+    return " ".join(question.lower().split()).rstrip("?.! ")
+
+async def get_question_embedding(question: str) -> np.ndarray:
+    """Returns the normalized embedding for a question, from the LRU cache when possible."""
+    key = normalize_question(question)
+    embedding = question_embedding_cache.get(key)
+    if embedding is None:
+        embedding = vector_index.normalize_rows(await get_embedding(question))
+        question_embedding_cache.set(key, embedding)
+    return embedding
+
+async def prefetch_question_embeddings(questions: list[str]) -> int:
+    """
+    Embeds the questions that are not in the question embedding cache with a
+    single embeddings call and caches them, so that retrieving schemas for
+    them afterwards needs no API call. Returns how many were embedded.
+    """
+    missing = {}
+    for question in questions:
+        key = normalize_question(question)
+        if key not in question_embedding_cache and key not in missing:
+            missing[key] = question
+    if not missing:
+        return 0
+    embeddings = vector_index.normalize_rows(await get_embeddings(list(missing.values()), batch_size=len(missing)))
+    for key, embedding in zip(missing, embeddings):
+        question_embedding_cache.set(key, embedding)
+    return len(missing)
+
+def cache_stats() -> dict:
+    """Hit/miss counters for the retrieval caches."""
+    return {
+        "question_embeddings": question_embedding_cache.stats(),
+        "semantic": semantic_cache.stats() if semantic_cache is not None else None,
+        "keyword_fallbacks": keyword_fallbacks,
+    }
 
 def cosine_similarity(vec1, vec2):
     """Calculates the similarity between two vectors."""
     return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
 
-def load_and_index_schemas():
-    """Reads the schema file, splits it, and creates embeddings."""
-    global schemas, schema_embeddings
-    print("Loading and indexing schemas...")
+def load_schemas():
+    """
+    Reads the schema file and splits it into chunks. Until `index_schemas`
+    has embedded them, retrieval falls back to keyword matching.
+    """
+    global schemas, schema_embeddings, ann_index, _keyword_index
     try: 
-        script_dir = Path(__file__).parent.parent
-        schema_file_path = script_dir / "models" / "schema_description.txt"
+        schema_file_path = SCHEMA_DESCRIPTION_FILE
         with open(schema_file_path, 'r') as f:
             full_schema_text = f.read()
     except FileNotFoundError:
@@ -39,21 +134,134 @@ def load_and_index_schemas():
 
     # Split schemas by a delimiter (e.g., ---) and strip whitespace
     schemas = [s.strip() for s in full_schema_text.split('---') if s.strip()]
+    schema_embeddings = None
+    ann_index = None
+    _keyword_index = _build_keyword_index(schemas)
+    print(f"Loaded {len(schemas)} schemas.")
+
+async def index_schemas():
+    """Creates (or loads from the embedding store) the embeddings of the loaded schemas."""
+    global schema_embeddings, ann_index
+    # Reuse stored embeddings for unchanged chunks and only embed the rest
+    embeddings = await _load_or_embed(schemas)
+    # Cached retrievals refer to the previous index.
+    if semantic_cache is not None:
+        semantic_cache.clear()
 
-    # Generate and store embeddings for each schema
-    schema_embeddings = [get_embedding(s) for s in schemas]
+    index = None
+    if len(schemas) > ANN_INDEX_THRESHOLD:
+        print(f"Building approximate (IVF) index over {len(schemas)} chunks...")
+        index = vector_index.IVFIndex(embeddings)
+    ann_index, schema_embeddings = index, embeddings
     print(f"✅ Indexed {len(schemas)} schemas.")
 
-def retrieve_relevant_schemas(question, top_k=2):
+async def load_and_index_schemas():
+    """Reads the schema file, splits it, and creates embeddings."""
+    print("Loading and indexing schemas...")
+    load_schemas()
+    await index_schemas()
+
+def index_ready() -> bool:
+    """True once the schemas are embedded; before that, retrieval matches keywords."""
+    return schema_embeddings is not None
+
+async def _load_or_embed(chunks: list[str]):
+    """
+    Returns one L2-normalized embedding row per chunk, using the on-disk
+    embedding store for chunks whose content hash is already known and
+    embedding only the others. Rows are normalized before they are stored, so
+    the stored matrix can be searched as-is.
+    """
+    keys = [embedding_store.content_hash(chunk, AZURE_EMBEDDING_MODEL_NAME) for chunk in chunks]
+    stored_keys, stored_vectors = embedding_store.load()
+
+    # Fast path: the store matches the schema file exactly, so use the shared
+    # memory-mapped array as-is.
+    if stored_keys == keys:
+        print("Loaded all schema embeddings from the embedding store.")
+        return stored_vectors
+
+    # Only one worker at a time embeds; the others then find its result.
+    async with embedding_store.build_lock():
+        stored_keys, stored_vectors = embedding_store.load()
+        if stored_keys == keys:
+            print("Loaded all schema embeddings from the embedding store (built by another worker).")
+            return stored_vectors
+        return await _embed_missing(chunks, keys, stored_keys, stored_vectors)
+
+async def _embed_missing(chunks: list[str], keys: list[str], stored_keys: list[str], stored_vectors):
+    """Embeds the chunks that are not in the store and saves the store with all of them."""
+    row_of = {key: row for row, key in enumerate(stored_keys)}
+    missing = [i for i, key in enumerate(keys) if key not in row_of]
+    print(f"Embedding {len(missing)} new or changed schema chunks ({len(chunks) - len(missing)} reused).")
+    new_rows = {}
+    if missing:
+        new_embeddings = await get_embeddings([chunks[i] for i in missing])
+        new_rows = dict(zip(missing, vector_index.normalize_rows(new_embeddings)))
+    vectors = np.array(
+        [new_rows[i] if i in new_rows else stored_vectors[row_of[key]] for i, key in enumerate(keys)],
+        dtype=np.float32,
+    )
+    if embedding_store.save(keys, vectors):
+        # Re-open read-only so this worker shares the file's pages with the others.
+        _, vectors = embedding_store.load()
+    return vectors
+
+async def retrieve_relevant_schemas(question, top_k=2):
     """Finds the most relevant schema(s) for a user's question."""
-    question_embedding = get_embedding(question)
+    global keyword_fallbacks
+    if schema_embeddings is None:
+        # Still indexing (e.g. just after startup): match keywords instead.
+        keyword_fallbacks += 1
+        return keyword_search(question, top_k)
 
-    similarity_scores = [cosine_similarity(question_embedding, emb) for emb in schema_embeddings]
+    question_embedding = await get_question_embedding(question)
 
-    top_indices = np.argsort(similarity_scores)[-top_k:][::-1]
+    if semantic_cache is not None:
+        cached = semantic_cache.get(question_embedding)
+        if cached is not None and cached[0] == top_k:
+            return cached[1]
 
-    retrieved = [schemas[i] for i in top_indices]
-    return "\n---\n".join(retrieved)
+    # With normalized rows the cosine similarity is a single matrix-vector product.
+    if ann_index is not None:
+        top_indices = ann_index.search(question_embedding, top_k)
+    else:
+        top_indices = vector_index.search_exact(schema_embeddings, question_embedding, top_k)
+
+    retrieved = "\n---\n".join(schemas[i] for i in top_indices)
+    if semantic_cache is not None:
+        semantic_cache.set(question_embedding, (top_k, retrieved))
+    return retrieved
+
+# --- Keyword fallback ---
+# Word stems per schema chunk, and how rare each stem is across the chunks.
+_keyword_index: tuple[list[set[str]], dict[str, float]] = ([], {})
+keyword_fallbacks = 0
+
+def _stems(text: str) -> set[str]:
+    """
+    Crude word stems: words (CamelCase split) of 3+ letters cut to 5
+    characters, so "rejected", "Reject" and "rejection" all give "rejec".
+    """
+    words = re.findall(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+", text)
+    return {word.lower()[:5] for word in words if len(word) >= 3}
+
+def _build_keyword_index(chunks: list[str]) -> tuple[list[set[str]], dict[str, float]]:
+    chunk_stems = [_stems(chunk) for chunk in chunks]
+    counts = {}
+    for stems in chunk_stems:
+        for stem in stems:
+            counts[stem] = counts.get(stem, 0) + 1
+    weights = {stem: math.log((1 + len(chunks)) / count) for stem, count in counts.items()}
+    return chunk_stems, weights
+
+def keyword_search(question: str, top_k: int = 2) -> str:
+    """The `top_k` chunks sharing the most (rarest) word stems with the question."""
+    chunk_stems, weights = _keyword_index
+    question_stems = _stems(question)
+    scores = [sum(weights[stem] for stem in question_stems & stems) for stems in chunk_stems]
+    best = sorted(range(len(scores)), key=lambda i: -scores[i])[:top_k]
+    return "\n---\n".join(schemas[i] for i in best)
 
 def retrieve_specific_schemas(table_names: list[str]) -> str:
     """
@@ -66,4 +274,28 @@ def retrieve_specific_schemas(table_names: list[str]) -> str:
             if table_name in schema_text:
                 retrieved.append(schema_text)
                 break # Move to the next schema_text
-    return "\n---\n".join(retrieved)
\ No newline at end of file
+    return "\n---\n".join(retrieved)
+
+def table_names(schema_text: str) -> list[str]:
+    """Lists the qualified table names ("Table: ..." lines) in retrieved schema text."""
+    return re.findall(r"^Table:\s*(\S+)", schema_text, flags=re.MULTILINE)
+
+
+# --- Preload: build the embedding store once, before starting the workers ---
+# Run from the backend folder:  python -m core.schema_retriever
+# Every worker started afterwards memory-maps the stored index without any
+# embeddings call (see core/embedding_store.py).
+if __name__ == "__main__":
+    import asyncio
+    from dotenv import load_dotenv
+    from openai import AsyncAzureOpenAI
+
+    load_dotenv(dotenv_path='config/.env')
+    client = AsyncAzureOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=os.getenv("AZURE_API_VERSION")
+    )
+    AZURE_EMBEDDING_MODEL_NAME = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")
+    asyncio.run(load_and_index_schemas())
+    print(f"Embedding store ready at {embedding_store.STORE_DIR}")
@@ -0,0 +1,152 @@
+# backend/core/sql_templates.py
+"""
+Template cache for generated SQL.
+
+Many questions differ only in a literal, e.g. "status of batch 0000513258" vs
+"status of batch 0000578130". The literals (batch numbers, YYYYMMDD dates from
+date pre-processing, and amounts) are replaced with placeholders to get a
+question skeleton. After the model generates and the validator approves SQL
+for one question, the same literals are swapped for named bind parameters in
+the SQL and the result is cached under the skeleton. Later questions with the
+same skeleton bind their own literals as parameters instead of calling the
+model. The first question runs with its literals bound the same way
+(`parameterize`).
+
+A template is only stored when every literal of the question maps to exactly
+one literal in the SQL, so a value can never be bound into the wrong place.
+"""
+import hashlib
+import os
+import re
+
+from core.cache import LRUCache
+
+# (placeholder kind, pattern, whether the literal is quoted in SQL)
+LITERAL_PATTERNS = [
+    ("date", re.compile(r"\b(?:19|20)\d{6}\b"), True),
+    ("batch", re.compile(r"\b\d{10}\b"), True),
+    ("amount", re.compile(r"\$\s?\d[\d,]*(?:\.\d{1,2})?|\b\d+\.\d{2}\b"), False),
+]
+
+templates = LRUCache(int(os.getenv("SQL_TEMPLATE_CACHE_SIZE", "512")))
+schema_version: str = None
+# Questions whose SQL could not be turned into a template.
+unusable = 0
+
+
+def extract_literals(question: str) -> tuple[str, list[tuple[str, str]]]:
+    """
+    Replaces literals in a question with numbered placeholders.
+
+    Returns:
+        tuple: (skeleton, literals) - e.g. ("status of batch {batch_0}", [("batch_0", "0000513258")])
+    """
+    literals = []
+    counts = {}
+    skeleton = question.lower()
+    for kind, pattern, _ in LITERAL_PATTERNS:
+        def replace(match):
+            name = f"{kind}_{counts.get(kind, 0)}"
+            counts[kind] = counts.get(kind, 0) + 1
+            literals.append((name, match.group(0)))
+            return "{" + name + "}"
+        skeleton = pattern.sub(replace, skeleton)
+    return " ".join(skeleton.split()).rstrip("?.! "), literals
+
+
+def _bind_value(name: str, raw: str):
+    if name.startswith("amount"):
+        return float(raw.replace("$", "").replace(",", "").strip())
+    return raw
+
+
+def _sql_literal_pattern(name: str, raw: str) -> re.Pattern:
+    value = _bind_value(name, raw)
+    if isinstance(value, float):
+        # Match the number however SQL writes it, e.g. 150, 150.0 or 150.00.
+        digits = f"{value:.2f}".rstrip("0").rstrip(".")
+        trailing = "0*" if "." in digits else r"(?:\.0*)?"
+        return re.compile(rf"(?<![\w.']){re.escape(digits)}{trailing}(?![\w.'])")
+    return re.compile(rf"'{re.escape(value)}'")
+
+
+def lookup(question: str) -> tuple[str, dict] | None:
+    """
+    Returns (sql_template, params) for a question whose skeleton is cached, or None.
+    """
+    skeleton, literals = extract_literals(question)
+    template = templates.get(skeleton)
+    if template is None:
+        return None
+    return template, {name: _bind_value(name, raw) for name, raw in literals}
+
+
+def _template(question: str, sql_query: str) -> tuple[str, str, dict] | None:
+    skeleton, literals = extract_literals(question)
+    template = sql_query
+    for name, raw in literals:
+        pattern = _sql_literal_pattern(name, raw)
+        if len(pattern.findall(template)) != 1:
+            return None
+        template = pattern.sub(f":{name}", template)
+    return skeleton, template, {name: _bind_value(name, raw) for name, raw in literals}
+
+
+def parameterize(question: str, sql_query: str) -> tuple[str, dict] | None:
+    """
+    Returns (sql_template, params): validated SQL for `question` with the
+    question's literals swapped for bind parameters, so the database gets
+    them as typed values (see query_executor) instead of literals in the
+    text. None if a literal does not map to exactly one place in the SQL.
+    """
+    templated = _template(question, sql_query)
+    return templated[1:] if templated is not None else None
+
+
+def store(question: str, sql_query: str) -> tuple[str, dict] | None:
+    """
+    Turns validated SQL for `question` into a template and caches it.
+
+    Returns:
+        tuple: (sql_template, params) as from `parameterize`, or None if the
+            SQL could not be templated (and was not stored).
+    """
+    global unusable
+    templated = _template(question, sql_query)
+    if templated is None:
+        unusable += 1
+        return None
+    skeleton, template, params = templated
+    templates.set(skeleton, template)
+    return template, params
+
+
+def render(sql_template: str, params: dict) -> str:
+    """The SQL with its parameters written inline, for display and cache keys."""
+    # Replace longer names first so ":batch_1" never eats ":batch_10".
+    for name in sorted(params, key=len, reverse=True):
+        value = params[name]
+        literal = f"{value:.2f}" if isinstance(value, float) else f"'{value}'"
+        sql_template = re.sub(rf":{name}\b", literal, sql_template)
+    return sql_template
+
+
+def set_schema_version(schema_text: str):
+    """
+    Invalidation hook: drops every template when the schema description changes,
+    since the cached SQL was generated against the old one.
+    """
+    global schema_version
+    version = hashlib.sha256(schema_text.encode("utf-8")).hexdigest()
+    if schema_version is not None and version != schema_version:
+        invalidate()
+    schema_version = version
+
+
+def invalidate():
+    """Drops every cached template."""
+    templates.clear()
+
+
+def stats() -> dict:
+    return {**templates.stats(), "unusable": unusable}
@@ -1,20 +1,75 @@
+import os
 import re
-import sqlparse
+import hashlib
+from sqlparse import lexer, tokens as T
+
+from core.cache import LRUCache
 
 # List of SQL keywords that are not allowed.
-# These are commands that can modify or delete data.
-FORBIDDEN_KEYWORDS = [
+# These are commands that can modify or delete data, run other code or
+# change the session. They are matched against keyword and identifier
+# tokens, so the same words inside string literals or comments are ignored.
+FORBIDDEN_KEYWORDS = {
     'INSERT', 'UPDATE', 'DELETE', 'DROP', 'TRUNCATE', 'ALTER', 'CREATE',
-    'RENAME', 'GRANT', 'REVOKE', 'COMMIT', 'ROLLBACK'
-]
+    'RENAME', 'GRANT', 'REVOKE', 'DENY', 'COMMIT', 'ROLLBACK', 'MERGE',
+    'INTO', 'EXEC', 'EXECUTE', 'DECLARE', 'SET', 'USE', 'WAITFOR', 'DBCC',
+    'BULK', 'BACKUP', 'RESTORE', 'SHUTDOWN', 'KILL', 'RECONFIGURE',
+    'OPENROWSET', 'OPENQUERY', 'OPENDATASOURCE',
+}
+# Extended and system stored procedures (xp_cmdshell, sp_executesql, ...).
+FORBIDDEN_PREFIXES = ('XP_', 'SP_')
+
+# Tables may only be read from these schemas (or from CTEs the query defines).
+ALLOWED_SCHEMAS = {'PSGTMS', 'PSGAUDITSTATS'}
+
+# Keywords that start a list of table references / end the FROM clause.
+_TABLE_KEYWORDS = {'FROM', 'JOIN', 'APPLY'}
+_CLAUSE_END_KEYWORDS = {'WHERE', 'GROUP BY', 'ORDER BY', 'HAVING', 'OPTION', 'FOR'}
+_SET_OPERATORS = {'UNION', 'UNION ALL', 'EXCEPT', 'INTERSECT'}
+_SKIPPED = (T.Whitespace, T.Newline, T.Comment.Single, T.Comment.Multiline,
+            T.Comment.Single.Hint, T.Comment.Multiline.Hint)
+
+# --- Verdict cache ---
+# The same SQL (from templates, retries and follow-up questions) is validated
+# over and over; verdicts are memoized by a hash of the normalized query.
+SQL_VERDICT_CACHE_SIZE = int(os.getenv("SQL_VERDICT_CACHE_SIZE", "2048"))
+verdicts = LRUCache(SQL_VERDICT_CACHE_SIZE)
+
+# Collapses spaces and tabs only; newlines end '--' comments, so they stay.
+_HORIZONTAL_SPACE = re.compile(r'[ \t]+')
+
+
+def verdict_key(sql_query: str) -> bytes:
+    normalized = _HORIZONTAL_SPACE.sub(' ', sql_query.replace('\r\n', '\n')).strip()
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+
+
+def _identifier(value: str) -> str:
+    """Upper-cased identifier without [brackets] or "quotes"."""
+    return value.strip('[]"').upper()
+
+
+def _table_error(parts: list[str], cte_names: set[str]):
+    """Why a table reference is not allowed, or None if it is."""
+    if len(parts) > 1:
+        if parts[0] not in ALLOWED_SCHEMAS:
+            return f"Validation failed: Table '{'.'.join(parts)}' is outside the allowed schemas."
+    elif parts[0] not in cte_names:
+        return f"Validation failed: Table '{parts[0]}' must be qualified with an allowed schema."
+    return None
+
 
 def is_safe_query(sql_query: str):
     """
     Validates a SQL query to ensure it is safe to execute.
 
     A query is considered safe if it:
-    1. Is a read-only 'SELECT' statement.
-    2. Does not contain any forbidden keywords that could modify or delete data.
+    1. Is a single read-only 'SELECT' statement (a CTE is fine).
+    2. Does not contain any forbidden keywords that could modify or delete data,
+       write into a table (SELECT ... INTO) or run procedures (EXEC, xp_...).
+    3. Only reads tables from the allowed schemas.
+
+    Verdicts are cached, so repeated queries are not re-checked.
 
     Args:
         sql_query (str): The SQL query string to validate.
@@ -24,49 +79,145 @@ def is_safe_query(sql_query: str):
                - `is_safe` is a boolean (True if safe, False otherwise).
                - `message` is a string explaining the result.
     """
-    # Normalize the query to uppercase for case-insensitive checks
-    query_upper = sql_query.upper()
-    # 1. Ensure starts with SELECT
-
-    if not query_upper.strip().startswith('SELECT'):
-            return False, "Validation failed: Query must be a SELECT statement."
-
-
-    # 2. Check for any forbidden keywords
-    for keyword in FORBIDDEN_KEYWORDS:
-        # We use regex with word boundaries (\b) to avoid false positives.
-        # For example, to prevent 'UPDATE' from matching a column named 'LAST_UPDATE'.
-    
-        pattern = r'\b' + keyword + r'\b'
-        if re.search(pattern, query_upper):
-            return False, f"Validation failed: Query contains forbidden keyword '{keyword}'."
-        
-    parsed = sqlparse.parse(sql_query)
-    for stmt in parsed:
-        if stmt.get_type() != "SELECT":
-            return False, "Validation failed: Non-SELECT SQL detected."
-    print("SQL Paresed Successfully")
-
-        
-    
+    key = verdict_key(sql_query)
+    verdict = verdicts.get(key)
+    if verdict is None:
+        verdict = check_query(sql_query)
+        verdicts.set(key, verdict)
+    return verdict
+
+
+def check_query(sql_query: str):
+    """
+    Validates a query in one pass over its token stream (see `is_safe_query`).
+    Comments and whitespace are skipped, so nothing can hide in them.
+    """
+    previous = None          # last meaningful token value (upper-cased)
+    depth = 0                # parenthesis depth
+    seen_token = False
+    starts_with_cte = False
+    main_select_seen = False
+    statement_ended = False
+    cte_names = set()
+    # FROM-clause tracking: the depths of the open FROM clauses (subqueries
+    # nest them), whether a table reference is expected next, and the dotted
+    # parts of the current one.
+    from_depths = []
+    expect_table = False
+    table_parts = None
+    after_dot = False
+
+    for ttype, value in lexer.tokenize(sql_query):
+        if ttype in _SKIPPED:
+            continue
+
+        if statement_ended:
+            return False, "Validation failed: Only a single SQL statement is allowed."
+
+        is_identifier = ttype in T.Name or ttype in T.Literal.String.Symbol
+        upper = value.upper()
+
+        # --- Finish a (possibly dotted) table reference ---
+        if table_parts is not None:
+            if value == '.':
+                after_dot = True
+                continue
+            if after_dot and is_identifier:
+                table_parts.append(_identifier(value))
+                after_dot = False
+                continue
+            error = _table_error(table_parts, cte_names)
+            if error:
+                return False, error
+            table_parts = None
+
+        # --- The statement must open with SELECT (or WITH ... SELECT) ---
+        if not seen_token:
+            seen_token = True
+            if ttype in T.Keyword.CTE:
+                starts_with_cte = True
+            elif not (ttype in T.Keyword.DML and upper == 'SELECT'):
+                return False, "Validation failed: Query must be a SELECT statement."
+
+        # --- Forbidden commands, wherever they appear ---
+        if (ttype in T.Keyword or (ttype in T.Name and not value.startswith('['))) and (
+            upper in FORBIDDEN_KEYWORDS or upper.startswith(FORBIDDEN_PREFIXES)
+        ):
+            return False, f"Validation failed: Query contains forbidden keyword '{upper}'."
+
+        if ttype in T.Punctuation:
+            if value == '(':
+                # FROM (SELECT ...) is a derived table, not a table name.
+                depth += 1
+                expect_table = False
+            elif value == ')':
+                depth -= 1
+                while from_depths and from_depths[-1] > depth:
+                    from_depths.pop()
+            elif value == ';':
+                if depth == 0:
+                    statement_ended = True
+            elif value == ',' and from_depths and from_depths[-1] == depth:
+                expect_table = True
+        elif ttype in T.Keyword.DML and upper == 'SELECT' and depth == 0:
+            # A top-level SELECT may only open the query, follow a set
+            # operator or follow the CTE list; anything else is a second statement.
+            if not (previous is None or previous in _SET_OPERATORS
+                    or (starts_with_cte and previous == ')' and not main_select_seen)):
+                return False, "Validation failed: Only a single SQL statement is allowed."
+            main_select_seen = True
+        elif upper in _TABLE_KEYWORDS or upper.endswith(' JOIN'):
+            if not from_depths or from_depths[-1] != depth:
+                from_depths.append(depth)
+            expect_table = True
+        elif ttype in T.Keyword and (upper in _CLAUSE_END_KEYWORDS or upper in _SET_OPERATORS):
+            if from_depths and from_depths[-1] == depth:
+                from_depths.pop()
+            expect_table = False
+        elif is_identifier and expect_table:
+            table_parts, after_dot = [_identifier(value)], False
+            expect_table = False
+        elif is_identifier and starts_with_cte and not main_select_seen and depth == 0 and previous in ('WITH', ','):
+            # WITH name AS (...), name AS (...)
+            cte_names.add(_identifier(value))
+
+        previous = upper
+
+    if not seen_token:
+        return False, "Validation failed: Query must be a SELECT statement."
+    error = table_parts and _table_error(table_parts, cte_names)
+    if error:
+        return False, error
+
     # If all checks pass, the query is considered safe
     return True, "Query is safe."
 
+
+def cache_stats() -> dict:
+    return verdicts.stats()
+
 # --- Example of how to run this file directly for testing ---
 if __name__ == '__main__':
     print("--- Testing SQL Validator ---")
 
     # List of queries to test
     test_queries = [
-        "SELECT CustomerName, Amount FROM RemittanceTransactions WHERE Status = 'SUCCESS';", # Safe
-        "SELECT * FROM AuditLog;", # Safe
-        "UPDATE RemittanceTransactions SET Amount = 500 WHERE TransactionID = 123;", # Unsafe
-        "DROP TABLE AuditLog;", # Unsafe
-        "   SELECT * FROM users", # Safe (with whitespace)
-        "delete from users where id = 1" # Unsafe (lowercase)
+        "SELECT BatchNo, Amount FROM PSGTMS.DetailFile1 WHERE Reject = 1;", # Safe
+        "SELECT * FROM [PSGAuditStats].[tblAuditLogMaster];", # Safe
+        "   SELECT * FROM PSGTMS.BATCHFILE", # Safe (with whitespace)
+        "WITH b AS (SELECT BatchNo FROM PSGTMS.BATCHFILE) SELECT * FROM b", # Safe (CTE)
+        "SELECT * FROM PSGTMS.REJREASON WHERE RejDesc = 'DROP TABLE'", # Safe (keyword in a string)
+        "UPDATE PSGTMS.BATCHFILE SET TotalTrans = 500 WHERE BatchNo = '123';", # Unsafe
+        "DROP TABLE PSGAuditStats.tblAuditLogMaster;", # Unsafe
+        "delete from PSGTMS.DetailFile1 where DetailKey = 1", # Unsafe (lowercase)
+        "SELECT * INTO #copy FROM PSGTMS.DetailFile1", # Unsafe (SELECT ... INTO)
+        "SELECT 1 /* harmless */; EXEC xp_cmdshell 'dir'", # Unsafe (second statement)
+        "SELECT 1 SELECT name FROM PSGTMS.BATCHFILE", # Unsafe (second statement, no semicolon)
+        "SELECT name FROM sys.tables", # Unsafe (schema not allowed)
+        "SELECT * FROM Users", # Unsafe (unqualified table)
     ]
 
     for i, query in enumerate(test_queries):
         is_valid, message = is_safe_query(query)
         print(f"Query {i+1}: \"{query}\"")
-        print(f"Result: {'SAFE' if is_valid else 'UNSAFE'} -> {message}\n")
\ No newline at end of file
+        print(f"Result: {'SAFE' if is_valid else 'UNSAFE'} -> {message}\n")
@@ -0,0 +1,220 @@
+# backend/core/tracing.py
+"""
+Lightweight request tracing and in-process metrics.
+
+Every request gets a `Trace`: a request ID, the start and duration of each
+pipeline stage (a span) and the tokens used by each model call. The trace
+lives in a context variable, so code deep in the pipeline adds to it without
+it being passed around, and concurrent stages of one request share it.
+
+Span durations, token counts and request totals also feed process-wide
+histograms and counters, which `render_metrics` formats in the Prometheus
+text format for the /metrics endpoint.
+
+With TRACING_ENABLED=0, `span` and `record_usage` return straight away and
+no traces or metrics are kept.
+"""
+import contextvars
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1").lower() not in ("0", "false", "no")
+# Upper bounds (in seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_HELP = {
+    "tmsbot_requests_total": ("counter", "HTTP requests handled, by route and status code."),
+    "tmsbot_request_duration_seconds": ("histogram", "Time until the response starts, by route."),
+    "tmsbot_stage_duration_seconds": ("histogram", "Duration of each pipeline stage."),
+    "tmsbot_llm_calls_total": ("counter", "Azure OpenAI calls that reported token usage, by stage."),
+    "tmsbot_llm_tokens_total": ("counter", "Tokens reported by Azure OpenAI, by stage and kind (prompt/completion)."),
+}
+
+
+@dataclass
+class Trace:
+    request_id: str
+    started: float = field(default_factory=time.perf_counter)
+    spans: list = field(default_factory=list)    # (stage, start offset ms, duration ms)
+    tokens: dict = field(default_factory=dict)   # stage -> {"prompt": n, "completion": n}
+
+    def describe(self) -> str:
+        spans = ", ".join(f"{stage}@{start:g}+{duration:g}ms" for stage, start, duration in self.spans)
+        tokens = ", ".join(f"{stage}={t['prompt']}/{t['completion']}" for stage, t in self.tokens.items())
+        return f"request_id={self.request_id} spans=[{spans}] tokens(prompt/completion)=[{tokens}]"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)   # per bucket, not cumulative
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+_lock = threading.Lock()
+# (metric name, ((label, value), ...)) -> Histogram / count
+_histograms: dict[tuple, Histogram] = {}
+_counters: dict[tuple, float] = {}
+
+
+def observe(name: str, labels: tuple, value: float):
+    with _lock:
+        histogram = _histograms.get((name, labels))
+        if histogram is None:
+            histogram = _histograms[(name, labels)] = Histogram()
+        histogram.observe(value)
+
+
+def increment(name: str, labels: tuple, amount: float = 1):
+    with _lock:
+        _counters[(name, labels)] = _counters.get((name, labels), 0) + amount
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def start_trace(request_id: str | None = None):
+    """Makes a new Trace the current one for the wrapped block (and the tasks it starts)."""
+    if not TRACING_ENABLED:
+        yield None
+        return
+    trace = Trace(request_id or new_request_id())
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace() -> Trace | None:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage: str):
+    """Times the wrapped block as `stage`, in the current trace and the stage histogram."""
+    if not TRACING_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe("tmsbot_stage_duration_seconds", (("stage", stage),), elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append((stage, round((started - trace.started) * 1000, 1), round(elapsed * 1000, 1)))
+
+
+def record_usage(stage: str, usage):
+    """Records the token usage of an OpenAI response (`response.usage`, may be None)."""
+    if not TRACING_ENABLED or usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    increment("tmsbot_llm_calls_total", (("stage", stage),))
+    increment("tmsbot_llm_tokens_total", (("stage", stage), ("kind", "prompt")), prompt)
+    increment("tmsbot_llm_tokens_total", (("stage", stage), ("kind", "completion")), completion)
+    trace = _current_trace.get()
+    if trace is not None:
+        tokens = trace.tokens.setdefault(stage, {"prompt": 0, "completion": 0})
+        tokens["prompt"] += prompt
+        tokens["completion"] += completion
+
+
+def record_request(route: str, status_code: int, seconds: float):
+    increment("tmsbot_requests_total", (("route", route), ("status", str(status_code))))
+    observe("tmsbot_request_duration_seconds", (("route", route),), seconds)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that gives each HTTP request a trace, under the caller's
+    X-Request-ID or a new one, echoes the ID back in the response headers and
+    records the request in the metrics. The duration is the time until the
+    response starts (for streaming responses, before the body is sent).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        request_id = dict(scope["headers"]).get(b"x-request-id")
+        recorded = False
+
+        with start_trace(request_id.decode("latin-1") if request_id else None) as trace:
+            async def send_with_request_id(message):
+                nonlocal recorded
+                if message["type"] == "http.response.start":
+                    message["headers"] = [*message.get("headers", []), (b"x-request-id", trace.request_id.encode("latin-1"))]
+                    record_request(_route(scope), message["status"], time.perf_counter() - started)
+                    recorded = True
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_request_id)
+            finally:
+                if not recorded:
+                    record_request(_route(scope), 500, time.perf_counter() - started)
+
+
+def _route(scope) -> str:
+    """The route template ("/query") rather than the raw path, to keep label values few."""
+    return getattr(scope.get("route"), "path", "unmatched")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = [f'{key}="{_escape(value)}"' for key, value in labels + extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render_metrics() -> str:
+    """All histograms and counters in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {key: (list(h.counts), h.count, h.sum, h.buckets) for key, h in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = []
+    for name, (kind, help_text) in METRIC_HELP.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        if kind == "counter":
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {value:.15g}")
+            continue
+        for (metric, labels), (counts, count, total, buckets) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labels, (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
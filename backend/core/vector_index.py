@@ -0,0 +1,94 @@
+# backend/core/vector_index.py
+"""
+Nearest-neighbour search over L2-normalized embedding matrices.
+
+For normalized vectors the cosine similarity is a plain dot product, so an
+exact search is one matrix-vector product plus an `argpartition` top-k.
+For large catalogs, `IVFIndex` adds an approximate inverted-file index
+(spherical k-means in pure NumPy) that only scores the rows in the clusters
+closest to the query.
+"""
+from __future__ import annotations
+
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+
+def normalize_rows(matrix) -> np.ndarray:
+    """Returns a float32 copy of `matrix` with every row scaled to unit length."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the `k` highest scores, best first, without a full sort."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(scores, -k)[-k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+def search_exact(matrix: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    """Exact top-k search. `matrix` rows and `query` must already be normalized."""
+    return top_k(matrix @ query, k)
+
+
+class IVFIndex:
+    """
+    An approximate inverted-file index over a normalized matrix.
+
+    Rows are grouped into `n_lists` clusters; a search scores the `n_probe`
+    closest centroids and then only the rows in those clusters.
+    """
+
+    def __init__(self, matrix: np.ndarray, n_lists: int | None = None, n_probe: int = 8,
+                 iterations: int = 10, sample_per_list: int = 64, seed: int = 0):
+        self.matrix = matrix
+        n_rows = len(matrix)
+        self.n_lists = max(1, min(n_lists or int(np.sqrt(n_rows)), n_rows))
+        self.n_probe = min(n_probe, self.n_lists)
+
+        self.centroids = self._train(iterations, sample_per_list, np.random.default_rng(seed))
+        assignments = self._assign(matrix)
+
+        # Store the row ids grouped by cluster, with offsets marking each cluster's slice.
+        self.row_ids = np.argsort(assignments, kind="stable")
+        self.offsets = np.searchsorted(assignments[self.row_ids], np.arange(self.n_lists + 1))
+
+    def _train(self, iterations: int, sample_per_list: int, rng) -> np.ndarray:
+        """Spherical k-means on a sample of the rows."""
+        sample_size = min(len(self.matrix), self.n_lists * sample_per_list)
+        sample = np.asarray(self.matrix[np.sort(rng.choice(len(self.matrix), sample_size, replace=False))])
+        centroids = sample[rng.choice(sample_size, self.n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = ~np.any(sums, axis=1)
+            # Re-seed empty clusters with random sample rows.
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = normalize_rows(sums)
+        return centroids
+
+    def _assign(self, matrix: np.ndarray, block_size: int = 8192) -> np.ndarray:
+        """Nearest centroid for every row, in blocks to bound memory."""
+        assignments = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), block_size):
+            block = matrix[start:start + block_size]
+            assignments[start:start + block_size] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+
+    def search(self, query: np.ndarray, k: int) -> np.ndarray:
+        """Approximate top-k row indices, best first."""
+        probe = top_k(self.centroids @ query, self.n_probe)
+        candidates = np.concatenate([self.row_ids[self.offsets[c]:self.offsets[c + 1]] for c in probe])
+        best = top_k(self.matrix[candidates] @ query, k)
+        return candidates[best]
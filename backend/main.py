@@ -1,23 +1,37 @@
+from __future__ import annotations
+
 from dotenv import load_dotenv
 load_dotenv(dotenv_path='config/.env')
 
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-import pandas as pd
-from openai import AzureOpenAI
+from typing import Literal
 import os
-from sqlalchemy import create_engine
-from datetime import date, timedelta
+import json
+import asyncio
+import time
+from contextlib import contextmanager
 import textwrap
 
 
 
 
 
+import core.date_resolver as date_resolver
+import core.intent_classifier as intent_classifier
 import core.nl_to_sql as nl_to_sql
+import core.prompt_builder as prompt_builder
 import core.query_executor as query_executor
+import core.query_guard as query_guard
+import core.query_router as query_router
 import core.result_analyzer as result_analyzer
+import core.result_cache as result_cache
+import core.response_format as response_format
+import core.sql_templates as sql_templates
+import core.sql_validator as sql_validator
+import core.tracing as tracing
 
 
 #from core.nl_to_sql import generate_sql_query
@@ -25,94 +39,53 @@ from core.sql_validator import is_safe_query
 #from core.query_executor import execute_query
 #from core.result_analyzer import summarize_result
 from core.logger import setup_logger
+from core.result_stats import result_info
 import core.schema_retriever as schema_retriever
+from core.lazy_import import lazy_import
 logger = setup_logger(__name__)   
 
-def preprocess_question_for_dates(user_question: str) -> str:
-    """
-    Looks for relative date terms in the user's question and replaces them
-    with specific dates or date ranges that the AI can easily understand.
-    """
-    today = date.today()
-    question_lower = user_question.lower()
-
-    # --- Handle "today" ---
-    if "today" in question_lower:
-        date_str = today.strftime('%Y%m%d')
-        return question_lower.replace("today", f"on the date {date_str}")
-        
-    # --- Handle "yesterday" ---
-    elif "yesterday" in question_lower:
-        yesterday = today - timedelta(days=1)
-        date_str = yesterday.strftime('%Y%m%d')
-        return question_lower.replace("yesterday", f"on the date {date_str}")
-
-    # --- Handle "last month" ---
-    elif "last month" in question_lower:
-        first_day_of_current_month = today.replace(day=1)
-        last_day_of_last_month = first_day_of_current_month - timedelta(days=1)
-        first_day_of_last_month = last_day_of_last_month.replace(day=1)
-        start_date_str = first_day_of_last_month.strftime('%Y%m%d')
-        end_date_str = last_day_of_last_month.strftime('%Y%m%d')
-        return question_lower.replace(
-            "last month", f"between the dates {start_date_str} and {end_date_str}"
-        )
+# pandas, numpy, sqlalchemy and openai are loaded after the server has
+# started (see `initialize`), so that importing this module is quick.
+pd = lazy_import("pandas")
 
-    # --- Handle "last week" ---
-    elif "last week" in question_lower:
-        start_of_last_week = today - timedelta(days=today.weekday() + 7)
-        end_of_last_week = start_of_last_week + timedelta(days=6)
-        start_date_str = start_of_last_week.strftime('%Y%m%d')
-        end_date_str = end_of_last_week.strftime('%Y%m%d')
-        return question_lower.replace(
-            "last week", f"between the dates {start_date_str} and {end_date_str}"
-        )
+# The schemas that audit questions are always answered from.
+AUDIT_SCHEMA_TABLES = ["PSGAuditStats.tblAuditLogMaster", "PSGAuditStats.tblAuditLogDetail"]
 
-    # --- Dynamically handle "last [day of week]" ---
-    weekdays = {
-        "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3,
-        "friday": 4, "saturday": 5, "sunday": 6
-    }
-    
-    for day_name, day_number in weekdays.items():
-        if f"last {day_name}" in question_lower:
-            days_ago = 1
-            while True:
-                day_to_check = today - timedelta(days=days_ago)
-                if day_to_check.weekday() == day_number:
-                    last_day_date = day_to_check
-                    break
-                days_ago += 1
-            
-            date_str = last_day_date.strftime('%Y%m%d')
-            return question_lower.replace(f"last {day_name}", f"on the date {date_str}")
-
-    # If no special date terms are found, return the original question
-    return user_question
-
-def classify_intent(history: list[dict[str, str]]) -> str:
+@contextmanager
+def stage_timer(timings: dict, stage: str):
+    """Records how long the wrapped block took, in milliseconds, under `stage` (and as a tracing span)."""
+    started = time.perf_counter()
+    try:
+        with tracing.span(stage):
+            yield
+    finally:
+        timings[stage] = round((time.perf_counter() - started) * 1000, 1)
+
+INTENT_PROMPT = textwrap.dedent("""
+    Classify the user's final question into one of the following categories based on the conversation history:
+    1. "audit_history": The user is asking about the history of changes, what was changed, who changed it, or using words like 'audit', 'log', 'history', 'track', 'update', 'change'.
+    2. "data_retrieval": The user is asking a general question about the data itself (e.g., counts, sums, lists).
+    **You MUST respond with only one of the two category names ("audit_history" or "data_retrieval") and nothing else.**
+
+""")
+
+async def classify_intent(history: list[dict[str, str]]) -> str:
     """
     Uses the AI to classify the user's latest question into one of a few categories.
     This helps us decide which tools or schemas to use.
     """
-    intent_prompt = textwrap.dedent("""
-        Classify the user's final question into one of the following categories based on the conversation history:
-        1. "audit_history": The user is asking about the history of changes, what was changed, who changed it, or using words like 'audit', 'log', 'history', 'track', 'update', 'change'.
-        2. "data_retrieval": The user is asking a general question about the data itself (e.g., counts, sums, lists).
-        **You MUST respond with only one of the two category names ("audit_history" or "data_retrieval") and nothing else.**
-
-    """)
-
-    messages_for_intent = [{"role": "system", "content": intent_prompt}]
-    messages_for_intent.extend(history)
+    messages_for_intent = [{"role": "system", "content": INTENT_PROMPT}]
+    messages_for_intent.extend(prompt_builder.trim_history(history, prompt_builder.INTENT_HISTORY_TOKEN_BUDGET))
 
     try:
-        response = nl_to_sql.client.chat.completions.create(
+        response = await nl_to_sql.client.chat.completions.create(
             model=nl_to_sql.AZURE_MODEL_NAME,
             messages=messages_for_intent,
             temperature=0,
             max_tokens=10  # Very small, as we only expect one word back
         )
+        prompt_builder.log_prompt_tokens("intent", messages_for_intent, response.usage)
+        tracing.record_usage("intent", response.usage)
         intent = response.choices[0].message.content.strip().lower()
         if intent not in ["audit_history", "data_retrieval"]:
             logger.warning(f"Intent classification returned an invalid category: '{intent}'. Defaulting to 'data_retrieval'.")
@@ -124,6 +97,67 @@ def classify_intent(history: list[dict[str, str]]) -> str:
         return "data_retrieval" # Default to data retrieval on error
 
 
+async def resolve_intent_and_schemas(history: list[dict[str, str]], timings: dict):
+    """
+    Runs intent classification and the RAG schema lookup at the same time,
+    unless the local intent classifier is confident about the question (only
+    tried for the first question of a conversation; follow-ups depend on the
+    earlier turns, which the LLM sees).
+
+    The RAG lookup is speculative: for "data_retrieval" questions (the common
+    case) its result is kept, saving a full round trip before SQL generation.
+    For "audit_history" questions it is discarded in favour of the fixed audit
+    schemas. On return, the last history message holds the date-processed
+    question if the RAG path was taken.
+
+    Returns:
+        tuple: (intent, relevant_schemas)
+    """
+    user_question = history[-1]["content"]
+    processed_question = date_resolver.rewrite_question(user_question)
+
+    # The local classifier decides most questions from the embedding that
+    # retrieval needs anyway, saving the intent LLM round trip.
+    if intent_classifier.decides(history):
+        with stage_timer(timings, "question_embedding"):
+            question_embedding = await schema_retriever.get_question_embedding(processed_question)
+        with stage_timer(timings, "intent"):
+            intent = intent_classifier.classify(question_embedding)
+        if intent == "audit_history":
+            return intent, schema_retriever.retrieve_specific_schemas(AUDIT_SCHEMA_TABLES)
+        if intent == "data_retrieval":
+            with stage_timer(timings, "schema_retrieval"):
+                relevant_schemas = await schema_retriever.retrieve_relevant_schemas(processed_question)
+            history[-1]["content"] = processed_question
+            return intent, relevant_schemas
+
+    async def timed_intent():
+        with stage_timer(timings, "intent"):
+            return await classify_intent(history)
+
+    async def timed_retrieval():
+        with stage_timer(timings, "schema_retrieval"):
+            return await schema_retriever.retrieve_relevant_schemas(processed_question)
+
+    with stage_timer(timings, "fanout"):
+        intent, rag_result = await asyncio.gather(
+            timed_intent(), timed_retrieval(), return_exceptions=True
+        )
+    if isinstance(intent, BaseException):
+        raise intent
+
+    if intent == "audit_history":
+        # If the user wants audit history, we FORCE the retriever to only
+        # consider the audit schemas and drop the speculative RAG result.
+        return intent, schema_retriever.retrieve_specific_schemas(AUDIT_SCHEMA_TABLES)
+
+    # For all other questions, use the normal RAG result.
+    if isinstance(rag_result, BaseException):
+        raise rag_result
+    history[-1]["content"] = processed_question
+    return intent, rag_result
+
+
 # Initialize the FastAPI app
 app = FastAPI(title="TMS Bot API", description="API for converting natural language to SQL and getting summarized results.")
 
@@ -138,6 +172,53 @@ class QueryResponse(BaseModel):
     summary: str
     sql_query: str
     query_result: list # This will hold the data from the database
+    truncated: bool = False # True if query_result holds only the first rows of the result
+    total_rows: int | None = None # Rows in the full result, including any left out
+
+class ColumnarQueryResponse(BaseModel):
+    """The response of /query in the columnar format (?format=columnar)."""
+    summary: str
+    sql_query: str
+    columns: list[str] # Column names, once
+    data: list[list] # data[i] holds the values of columns[i]
+    truncated: bool = False
+    total_rows: int | None = None
+
+class BatchQueryRequest(BaseModel):
+    """Many independent (single-turn) questions, e.g. the standard questions of a dashboard."""
+    questions: list[str]
+
+class BatchItemResult(BaseModel):
+    """The answer to one question of a batch, or why it could not be answered."""
+    question: str
+    summary: str | None = None
+    sql_query: str | None = None
+    query_result: list = []
+    truncated: bool = False
+    total_rows: int | None = None
+    status_code: int = 200 # The status /query would have returned for the question
+    error: str | None = None
+    request_id: str | None = None # The question's own trace ("<batch request id>-<n>"), when traced
+
+class BatchQueryResponse(BaseModel):
+    """The results of /query/batch, in the order of the questions."""
+    results: list[BatchItemResult]
+
+# ?format=columnar (or Accept: application/vnd.tmsbot.columnar+json) sends rows column by column.
+RowFormat = Literal["records", "columnar"]
+
+# --- Request tracing ---
+
+# Each request gets a trace and an X-Request-ID; not installed at all when
+# tracing is off, so it costs nothing.
+if tracing.TRACING_ENABLED:
+    app.add_middleware(tracing.TracingMiddleware)
+
+def log_trace():
+    """Logs the spans and token usage of the current request, if it is traced."""
+    trace = tracing.current_trace()
+    if trace is not None:
+        logger.info(f"Trace: {trace.describe()}")
 
 # --- API Endpoints ---
 
@@ -146,72 +227,282 @@ def root():
     """A simple endpoint to check if the API is running."""
     return {"message": "TMS Bot API is running!"}
 
+@app.get("/cache/stats", tags=["Diagnostics"])
+def cache_stats():
+    """Hit/miss counters for the in-process caches, for tuning their sizes and thresholds."""
+    return {
+        "retrieval": schema_retriever.cache_stats(),
+        "sql_templates": sql_templates.stats(),
+        "sql_verdicts": sql_validator.cache_stats(),
+        "query_guard": query_guard.stats(),
+        "query_routes": query_router.stats(),
+        "results": result_cache.stats(),
+    }
+
+@app.get("/intent/stats", tags=["Diagnostics"])
+def intent_stats():
+    """How many intents the local classifier decided, and how many it left to the LLM."""
+    return intent_classifier.stats()
+
+@app.get("/summary/stats", tags=["Diagnostics"])
+def summary_stats():
+    """How many summaries were formatted without the AI, by kind, and the fraction of all summaries that skipped it."""
+    return result_analyzer.summary_stats()
+
+@app.get("/db/stats", tags=["Diagnostics"])
+def db_stats():
+    """Per-engine queue-wait, in-flight and timeout metrics, plus connection pool status."""
+    return query_executor.engine_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Diagnostics"])
+def metrics():
+    """Request counts, per-stage latency histograms and token usage, in the Prometheus text format."""
+    return PlainTextResponse(tracing.render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready", tags=["Health Check"])
+def ready():
+    """
+    Readiness, separate from the liveness check at "/": 200 once questions
+    can be answered, 503 while the service is starting (or if it failed to).
+    Questions can be answered before the schema index is built, with keyword
+    retrieval; "schema_index" tells whether it is "building" or "ready", and
+    "intent_classifier" whether the local intent classifier is trained yet.
+    """
+    return JSONResponse(startup_status, status_code=200 if startup_status["status"] == "ready" else 503)
+
+# --- Startup ---
+
+# Index the schemas while the server already accepts traffic; "false" makes
+# startup wait for the index, as it used to.
+SCHEMA_INDEX_IN_BACKGROUND = os.getenv("SCHEMA_INDEX_IN_BACKGROUND", "true").lower() == "true"
+startup_status = {"status": "starting", "schema_index": "pending", "intent_classifier": "pending", "error": None}
+startup_task: asyncio.Task | None = None
+
 @app.on_event("startup")
-def startup_event():
-    """On startup, configure clients and index the schemas."""
-    # Configure clients for all modules that need it
-    client = AzureOpenAI(
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        api_version=os.getenv("AZURE_API_VERSION")
-    )
-    schema_retriever.client = client
-    schema_retriever.AZURE_EMBEDDING_MODEL_NAME = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")
-    nl_to_sql.client = client
-    nl_to_sql.AZURE_MODEL_NAME = os.getenv("AZURE_OPENAI_MODEL_NAME")
+async def startup_event():
+    """
+    On startup, configure clients and index the schemas - in the background,
+    so that the server answers health checks at once. /ready tells when
+    questions can be answered; requests before that get a 503.
+    """
+    global startup_task
+    startup_task = asyncio.create_task(initialize())
+    if not SCHEMA_INDEX_IN_BACKGROUND:
+        await startup_task
+
+def load_libraries():
+    """Loads the lazily imported libraries. Slow, so it runs on a worker thread."""
+    import openai
+    import numpy
+    import pandas
+    import sqlalchemy
+    for module in (openai, numpy, pandas, sqlalchemy):
+        getattr(module, "__version__", None)  # the first attribute access runs a lazy module
+    prompt_builder.get_encoding()
+    return openai.AsyncAzureOpenAI
+
+async def initialize():
+    """
+    Configures the clients and engines and loads the schemas, then measures
+    the table sizes for the query guard, builds the schema index and trains
+    the local intent classifier.
+    """
+    try:
+        AsyncAzureOpenAI = await asyncio.to_thread(load_libraries)
 
-    result_analyzer.client = client
-    result_analyzer.AZURE_MODEL_NAME = os.getenv("AZURE_OPENAI_MODEL_NAME")
+        # Configure clients for all modules that need it
+        client = AsyncAzureOpenAI(
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            api_version=os.getenv("AZURE_API_VERSION")
+        )
+        schema_retriever.client = client
+        schema_retriever.AZURE_EMBEDDING_MODEL_NAME = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")
+        nl_to_sql.client = client
+        nl_to_sql.AZURE_MODEL_NAME = os.getenv("AZURE_OPENAI_MODEL_NAME")
+
+        result_analyzer.client = client
+        result_analyzer.AZURE_MODEL_NAME = os.getenv("AZURE_OPENAI_MODEL_NAME")
+
+        # One engine per DATABASE_URL_<NAME> variable (DATABASE_URL_TMS -> "tms", ...)
+        print("Configuring database engines...")
+        for engine_name, database_url in query_executor.database_urls().items():
+            query_executor.engines[engine_name] = query_executor.create_tuned_engine(database_url)
+        print(f"Database engines configured: {', '.join(query_executor.engines)}.")
+        # ------------------------------------
+
+        # Load the schemas; questions are answered with keyword retrieval until they are indexed.
+        schema_retriever.load_schemas()
+        schema_text = "\n---\n".join(schema_retriever.schemas)
+        # Cached SQL templates are only valid for the schema they were generated against.
+        sql_templates.set_schema_version(schema_text)
+        query_guard.load_table_hints(schema_text)
+        query_router.load_routes(schema_text)
+    except Exception as e:
+        logger.exception(f"Startup failed: {e}")
+        startup_status.update(status="failed", error=str(e))
+        return
+    startup_status["status"] = "ready"
+    logger.info("Ready to answer questions.")
 
-    print("Configuring database engines...")
-    tms_engine = create_engine(os.getenv("DATABASE_URL_TMS"))
-    query_executor.tms_engine = tms_engine
+    try:
+        row_counts = await asyncio.to_thread(query_executor.table_row_counts, list(query_guard.table_hints))
+        query_guard.set_measured_sizes(row_counts)
+    except Exception as e:
+        # The guard keeps the estimated sizes from the schema description.
+        logger.exception(f"Measuring the table sizes failed, the query guard uses the estimates: {e}")
 
+    try:
+        startup_status["schema_index"] = "building"
+        await schema_retriever.index_schemas()
+        startup_status["schema_index"] = "ready"
+        logger.info("Schema index ready.")
+    except Exception as e:
+        # Keyword retrieval keeps answering; a restart retries the index.
+        logger.exception(f"Indexing the schemas failed, retrieval stays on keywords: {e}")
+        startup_status.update(schema_index="failed", error=str(e))
+
+    if not intent_classifier.LOCAL_INTENT_ENABLED:
+        startup_status["intent_classifier"] = "off"
+        return
+    try:
+        await intent_classifier.build()
+        startup_status["intent_classifier"] = "ready"
+    except Exception as e:
+        # Every intent is then decided by the LLM, as before.
+        logger.exception(f"Training the intent classifier failed, intents stay on the LLM: {e}")
+        startup_status.update(intent_classifier="failed", error=str(e))
+
+def require_ready():
+    """Refuses questions until startup has configured the clients and loaded the schemas."""
+    if startup_status["status"] != "ready":
+        raise HTTPException(
+            status_code=503,
+            detail="The service is starting. Please try again shortly.",
+            headers={"Retry-After": "1"},
+        )
 
-    audit_engine = create_engine(os.getenv("DATABASE_URL_AUDIT"))
-    query_executor.audit_engine = audit_engine
-    print("Database engines configured.")
-    # ------------------------------------
-    
-    # Load and index the schemas into memory
-    schema_retriever.load_and_index_schemas()
+# How many result rows go into each "rows" event of the pipeline.
+ROW_BATCH_SIZE = int(os.getenv("STREAM_ROW_BATCH_SIZE", "500"))
 
-@app.post("/query", response_model=QueryResponse, tags=["Query Processing"])
-async def process_query(request: QueryRequest):
+def row_events(result_df: pd.DataFrame, row_format: str = "records", batch_size: int | None = ROW_BATCH_SIZE):
     """
-    The main endpoint to process a user's natural language query.
+    The result as "rows" events of up to `batch_size` rows (all of them when
+    None) in the given wire format (see core/response_format.py). At least
+    one batch is sent so the columns are always known.
+    """
+    info = result_info(result_df)
+    size = {
+        "truncated": info.truncated if info else False,
+        "total_rows": info.total_rows if info else len(result_df),
+    }
+    columns = [str(column) for column in result_df.columns]
+    batch_size = batch_size or max(len(result_df), 1)
+    for start in range(0, max(len(result_df), 1), batch_size):
+        batch = result_df.iloc[start:start + batch_size]
+        yield "rows", {"columns": columns, **response_format.encode_rows(batch, row_format), **size}
+
+# Results of queries being executed, by (engine, normalized SQL), so that
+# identical queries arriving at the same time run only once.
+_running_queries: dict[tuple[str, str], asyncio.Task] = {}
+
+async def fetch_result(engine_name: str, sql_query: str, executable_sql: str, sql_params: dict | None,
+                       timings: dict) -> pd.DataFrame:
+    """
+    The result of a guarded query: from the result cache when it is fresh,
+    otherwise by executing it - or by waiting for an identical query that is
+    already running. Failures are raised as HTTPException.
+    """
+    result_df = result_cache.get_result(engine_name, sql_query)
+    if result_df is not None:
+        logger.info("Using cached query result.")
+        return result_df
+
+    key = (engine_name, result_cache.normalize_sql(sql_query))
+    running = _running_queries.get(key)
+    if running is None:
+        running = asyncio.ensure_future(execute_guarded_query(engine_name, sql_query, executable_sql, sql_params, timings))
+        _running_queries[key] = running
+        running.add_done_callback(lambda task: _finish_running_query(key, task))
+        # Shielded so that one caller going away does not cancel the others' query.
+        return await asyncio.shield(running)
+
+    logger.info("Waiting for the result of the same query already running.")
+    with stage_timer(timings, "db_execution"):
+        return await asyncio.shield(running)
+
+def _finish_running_query(key: tuple[str, str], task: asyncio.Task):
+    _running_queries.pop(key, None)
+    if not task.cancelled():
+        task.exception()  # marks a failure as seen even if every caller has gone away
+
+async def execute_guarded_query(engine_name: str, sql_query: str, executable_sql: str, sql_params: dict | None,
+                                timings: dict) -> pd.DataFrame:
+    """Checks the cost budget, executes the query and caches its result."""
+    if query_guard.QUERY_COST_BUDGET > 0:
+        with stage_timer(timings, "cost_estimate"):
+            cost = await query_executor.estimate_cost_async(executable_sql, sql_params)
+        if cost is not None and cost > query_guard.QUERY_COST_BUDGET:
+            logger.warning(f"Estimated cost {cost:g} of SQL '{sql_query}' is over the budget of {query_guard.QUERY_COST_BUDGET:g}.")
+            raise HTTPException(
+                status_code=403,
+                detail="Validation Failed: The query is too expensive to run. Please narrow the question, e.g. to a batch number or a date range.",
+            )
+    with stage_timer(timings, "db_execution"):
+        result_df, error = await query_executor.execute_query_async(executable_sql, sql_params)
+    if error:
+        logger.error(f"Database execution failed for SQL '{sql_query}': {error}")
+        raise HTTPException(status_code=500, detail=f"Database execution failed: {error}")
+    #print("Query executed successfully.")
+    logger.info("Query executed successfully.")
+
+    # Handle cases where the query runs but returns no data
+    if result_df is None:
+        logger.info("Query returned no data (None result). Initializing empty DataFrame.")
+        result_df = pd.DataFrame() # Create an empty DataFrame to avoid errors
+    result_cache.set_result(engine_name, sql_query, result_df)
+    return result_df
+
+async def run_query_pipeline(history: list[dict[str, str]], timings: dict, stream_summary: bool = False,
+                             row_format: str = "records", row_batch_size: int | None = ROW_BATCH_SIZE):
+    """
+    Runs the whole question-to-answer pipeline, yielding (event, data) pairs
+    as each stage completes:
+        - "intent":        {"intent": ...}  (skipped when a SQL template is reused)
+        - "tables":        {"tables": [...]}  (skipped when a SQL template is reused)
+        - "sql":           {"sql_query": ...}
+        - "rows":          {"columns": [...], "rows": [...], "truncated": ..., "total_rows": ...},
+                           one or more batches; with row_format="columnar" they
+                           carry "data" (one array per column) instead of "rows";
+                           row_batch_size=None sends all rows in one batch
+        - "summary_token": {"text": ...}, only when `stream_summary` is True
+        - "summary":       {"summary": ...}
+    Failures are raised as HTTPException.
     """
-    history = request.history
-    if not history:
-        raise HTTPException(status_code=400, detail="History cannot be empty.")
-    
     user_question = history[-1]["content"]
 
-    logger.info(f"Received question: '{user_question}'")
-    logger.info(f"Full history contains {len(history)} messages.")
-    # --- START OF CHANGE ---
-    # First, preprocess the question to handle relative dates
-    try :
-        intent = classify_intent(history)
-        
-        # 2. Based on the intent, retrieve the correct schemas.
-        if intent == "audit_history":
-            # If the user wants audit history, we FORCE the retriever to only
-            # consider the audit schemas, bypassing the normal RAG search.
-            relevant_schemas = schema_retriever.retrieve_specific_schemas(
-                ["PSGAuditStats.tblAuditLogMaster", "PSGAuditStats.tblAuditLogDetail"]
-            )
-        else:
-            # For all other questions, use the normal RAG process.
-            processed_question = preprocess_question_for_dates(user_question)
-            history[-1]["content"] = processed_question
-            relevant_schemas = schema_retriever.retrieve_relevant_schemas(processed_question)
-    
-        logger.info(f"Retrieved Schemas:\n{relevant_schemas}")
+    # Single-turn questions that only differ from an earlier one in their
+    # literals reuse its validated SQL template and skip the model entirely.
+    template_question = date_resolver.rewrite_question(user_question)
+    template_hit = sql_templates.lookup(template_question) if len(history) == 1 else None
+    sql_params = None
+
+    if template_hit is not None:
+        executable_sql, sql_params = template_hit
+        logger.info(f"Reusing SQL template: {executable_sql} with parameters {sql_params}")
+    else:
+        # Classify the intent and retrieve the schemas concurrently.
+        intent, relevant_schemas = await resolve_intent_and_schemas(history, timings)
+        yield "intent", {"intent": intent}
+        yield "tables", {"tables": schema_retriever.table_names(relevant_schemas)}
+
+        logger.info(f"Retrieved schemas for: {', '.join(schema_retriever.table_names(relevant_schemas))}")
+        logger.debug(f"Retrieved Schemas:\n{relevant_schemas}")
 
         # Step 1: Generate SQL from the natural language question
         #sql_query = generate_sql_query(user_question)
-        sql_query = nl_to_sql.generate_sql_query(history, relevant_schemas)
+        with stage_timer(timings, "sql_generation"):
+            sql_query = await nl_to_sql.generate_sql_query(history, relevant_schemas)
 
         if "ERROR:" in sql_query:
             logger.error(f"Failed to generate SQL for '{user_question}': {sql_query}")
@@ -228,40 +519,151 @@ async def process_query(request: QueryRequest):
         #print("SQL query passed validation.")
         logger.info("SQL query passed validation.")
 
+        # Run it with the question's literals (dates, batch numbers) as bind
+        # parameters, as later questions reusing the template will. Follow-ups
+        # are parameterized the same way, dates resolved, but not stored.
+        if len(history) == 1:
+            parameterized = sql_templates.store(template_question, sql_query)
+        else:
+            parameterized = sql_templates.parameterize(template_question, sql_query)
+        executable_sql, sql_params = parameterized or (sql_query, None)
+
+    # Step 2a: Route the query to the database that holds its tables
+    route = query_router.route(executable_sql)
+    if route.cross_database:
+        logger.warning(f"Cross-database SQL '{executable_sql}' rejected: {route.message}")
+        raise HTTPException(status_code=403, detail=f"Validation Failed: {route.message}")
+
+    # Step 2b: Add a row limit and refuse unfiltered scans of large tables
+    guarded = query_guard.guard_query(executable_sql, query_executor.dialect_for(executable_sql))
+    for warning in guarded.warnings:
+        logger.warning(f"Query guard: {warning} SQL: '{executable_sql}'")
+    if not guarded.allowed:
+        logger.warning(f"Query guard rejected SQL '{executable_sql}': {guarded.message}")
+        raise HTTPException(status_code=403, detail=f"Validation Failed: {guarded.message}")
+    executable_sql = guarded.sql
+    sql_query = sql_templates.render(executable_sql, sql_params) if sql_params else executable_sql
+
+    yield "sql", {"sql_query": sql_query}
+
+
+    # Step 3: Execute the safe SQL query against the database,
+    # reusing a cached result for the same SQL when it is still fresh.
+    engine_name = route.engine_name
+    result_df = await fetch_result(engine_name, sql_query, executable_sql, sql_params, timings)
+
+    # Format the DataFrame into JSON-friendly batches of rows.
+    for event in row_events(result_df, row_format, row_batch_size):
+        yield event
+
+
+    # Step 4: Analyze the result and generate a natural language summary
+    # Keyed on the whole conversation, which the summary prompt includes.
+    summary = result_cache.get_summary(engine_name, sql_query, history)
+    if summary is None:
+        with stage_timer(timings, "summarization"):
+            if stream_summary:
+                parts, failed = [], False
+                try:
+                    async for token in result_analyzer.stream_summary(history, result_df):
+                        parts.append(token)
+                        yield "summary_token", {"text": token}
+                except result_analyzer.SummaryError as e:
+                    # Whatever streamed before the failure is incomplete.
+                    failed = True
+                    error = f"\n\n{e}" if parts else str(e)
+                    parts.append(error)
+                    yield "summary_token", {"text": error}
+                summary = "".join(parts).strip()
+            else:
+                summary = await result_analyzer.summarize_result(history, result_df)
+                failed = summary.startswith("Error:")
+        if not failed:
+            result_cache.set_summary(engine_name, sql_query, history, summary)
+    elif stream_summary:
+        yield "summary_token", {"text": summary}
+    #print(f"Generated Summary: {summary}")
+    logger.info(f"Generated Summary: {summary}")
+
+    yield "summary", {"summary": summary}
+
+def log_request(history: list[dict[str, str]]):
+    """Rejects an empty history and logs the incoming question."""
+    if not history:
+        raise HTTPException(status_code=400, detail="History cannot be empty.")
+    logger.info(f"Received question: '{history[-1]['content']}'")
+    logger.info(f"Full history contains {len(history)} messages.")
 
-        # Step 3: Execute the safe SQL query against the database
-        result_df, error = query_executor.execute_query(sql_query)
-        if error:
-            logger.error(f"Database execution failed for SQL '{sql_query}': {error}")
-            raise HTTPException(status_code=500, detail=f"Database execution failed: {error}")
-        #print("Query executed successfully.")
-        logger.info("Query executed successfully.")
-
-        
-        # Handle cases where the query runs but returns no data
-        if result_df is None:
-            logger.info("Query returned no data (None result). Initializing empty DataFrame.")
-            result_df = pd.DataFrame() # Create an empty DataFrame to avoid errors
-        
-
-        # Step 4: Analyze the result and generate a natural language summary
-        summary = result_analyzer.summarize_result(history, result_df)
-        #print(f"Generated Summary: {summary}")
-        logger.info(f"Generated Summary: {summary}")
+async def collect_answer(history: list[dict[str, str]], timings: dict, row_format: str = "records") -> dict:
+    """
+    Runs the pipeline to the end and returns the fields of a QueryResponse
+    (or ColumnarQueryResponse). Failures are raised as HTTPException.
+    """
+    sql_query, query_result, columns, summary, size = "", [], [], "", {}
+    # Nothing is sent before the answer is complete, so the rows come in one batch.
+    async for event, data in run_query_pipeline(history, timings, row_format=row_format, row_batch_size=None):
+        if event == "sql":
+            sql_query = data["sql_query"]
+        elif event == "rows":
+            if row_format == "columnar":
+                columns = data["columns"]
+                query_result = query_result or [[] for _ in columns]
+                for values, batch_values in zip(query_result, data["data"]):
+                    values.extend(batch_values)
+            else:
+                query_result.extend(data["rows"])
+            size = {"truncated": data["truncated"], "total_rows": data["total_rows"]}
+        elif event == "summary":
+            summary = data["summary"]
+    if row_format == "columnar":
+        return {"summary": summary, "sql_query": sql_query, "columns": columns, "data": query_result, **size}
+    return {"summary": summary, "sql_query": sql_query, "query_result": query_result, **size}
+
+def compressed_response(payload: BaseModel, media_type: str, http_request: Request) -> Response:
+    """The payload as JSON, compressed if the client's Accept-Encoding allows it."""
+    body, headers = response_format.compress(
+        payload.model_dump_json().encode(), response_format.negotiate_encoding(http_request.headers.get("accept-encoding"))
+    )
+    return Response(content=body, media_type=media_type, headers=headers)
+
+@app.post(
+    "/query",
+    response_model=QueryResponse,
+    responses={200: {"content": {response_format.COLUMNAR_MEDIA_TYPE: {"schema": ColumnarQueryResponse.model_json_schema()}}}},
+    tags=["Query Processing"],
+)
+async def process_query(request: QueryRequest, http_request: Request,
+                        row_format: RowFormat | None = Query(None, alias="format")):
+    """
+    The main endpoint to process a user's natural language query.
 
+    Rows are sent as a list of records unless the columnar format is asked
+    for (?format=columnar or the Accept header), and the response is
+    compressed when the client's Accept-Encoding allows it.
+    """
+    require_ready()
+    history = request.history
+    log_request(history)
+    row_format = response_format.negotiate_format(row_format, http_request.headers.get("accept"))
 
-        # Step 5: Format the DataFrame result into a JSON-friendly list of dictionaries
-        # This is easy for frontends to work with.
-        query_result_json = result_df.to_dict(orient='records')
+    timings = {}
+    try :
+        answer = await collect_answer(history, timings, row_format)
 
         # Return the final, structured response
+        logger.info(f"Stage timings (ms): {timings}")
+        log_trace()
         logger.info("Successfully processed query and returning response.")
 
-        return QueryResponse(
-            summary=summary,
-            sql_query=sql_query,
-            query_result=query_result_json
-        )
+        # The body is serialized here, not by the response_model, so that the
+        # (possibly large) rows are not validated again and can be compressed.
+        if row_format == "columnar":
+            payload = ColumnarQueryResponse.model_construct(**answer)
+            media_type = response_format.COLUMNAR_MEDIA_TYPE
+        else:
+            payload = QueryResponse(**answer)
+            media_type = "application/json"
+        return compressed_response(payload, media_type, http_request)
     except HTTPException:
         raise 
     except Exception as e:
@@ -269,3 +671,147 @@ async def process_query(request: QueryRequest):
             logger.exception(f"An unhandled internal server error occurred: {e}")
             print(f"An unhandled internal server error occurred: {e}")
             raise HTTPException(status_code=500, detail="Internal Server Error: An unexpected issue occurred during processing.")
+
+def ndjson_event(event: str, data: dict) -> str:
+    """One line of the streaming response."""
+    return json.dumps({"event": event, **data}, default=str) + "\n"
+
+@app.post("/query/stream", tags=["Query Processing"])
+async def process_query_stream(request: QueryRequest, http_request: Request,
+                               row_format: RowFormat | None = Query(None, alias="format")):
+    """
+    Same as /query, but streams newline-delimited JSON events as each stage
+    completes (see `run_query_pipeline`), ending with a "done" event carrying
+    the stage timings or an "error" event with a status code and detail.
+    Each event is flushed through the compressor on its own, so compression
+    does not delay it.
+    """
+    require_ready()
+    history = request.history
+    log_request(history)
+    row_format = response_format.negotiate_format(row_format, http_request.headers.get("accept"))
+    encoding = response_format.negotiate_encoding(http_request.headers.get("accept-encoding"))
+
+    async def event_stream():
+        timings = {}
+        try:
+            async for event, data in run_query_pipeline(history, timings, stream_summary=True, row_format=row_format):
+                yield ndjson_event(event, data)
+            logger.info(f"Stage timings (ms): {timings}")
+            log_trace()
+            trace = tracing.current_trace()
+            yield ndjson_event("done", {"timings_ms": timings, "request_id": trace.request_id if trace else None})
+        except HTTPException as e:
+            yield ndjson_event("error", {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.exception(f"An unhandled internal server error occurred: {e}")
+            yield ndjson_event("error", {
+                "status_code": 500,
+                "detail": "Internal Server Error: An unexpected issue occurred during processing."
+            })
+
+    if encoding is None:
+        return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+    compressor = response_format.StreamCompressor(encoding)
+
+    async def compressed_stream():
+        async for line in event_stream():
+            yield compressor.compress(line.encode())
+        yield compressor.finish()
+
+    return StreamingResponse(compressed_stream(), media_type="application/x-ndjson", headers=compressor.headers)
+
+# At most this many questions per /query/batch request.
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "50"))
+# Questions of one batch being answered at the same time. Their queries also
+# wait for the per-engine limit of query_executor, shared with other requests.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+async def answer_batch_question(question: str, request_id: str | None = None) -> BatchItemResult:
+    """
+    Answers one question of a batch, turning failures into an item error.
+    It runs under its own trace, `request_id`, so its spans and token usage
+    are logged apart from those of the other questions.
+    """
+    with tracing.start_trace(request_id) as trace:
+        request_id = trace.request_id if trace is not None else None
+        result = await _answer_batch_question(question)
+        log_trace()
+    return result.model_copy(update={"request_id": request_id}) if request_id else result
+
+async def _answer_batch_question(question: str) -> BatchItemResult:
+    history = [{"role": "user", "content": question}]
+    timings = {}
+    try:
+        log_request(history)
+        answer = await collect_answer(history, timings)
+        logger.info(f"Stage timings (ms): {timings}")
+        return BatchItemResult.model_construct(question=question, status_code=200, error=None, **answer)
+    except HTTPException as e:
+        return BatchItemResult(question=question, status_code=e.status_code, error=str(e.detail))
+    except Exception as e:
+        logger.exception(f"An unhandled internal server error occurred: {e}")
+        return BatchItemResult(
+            question=question, status_code=500,
+            error="Internal Server Error: An unexpected issue occurred during processing.",
+        )
+
+@app.post("/query/batch", response_model=BatchQueryResponse, tags=["Query Processing"])
+async def process_query_batch(request: BatchQueryRequest, http_request: Request):
+    """
+    Answers many independent questions in one request, with a result (or an
+    error) per question in the same order.
+
+    Compared with one /query call per question:
+        - the questions are embedded for schema retrieval in one API call,
+        - repeated questions are answered once,
+        - identical generated SQL is executed once (see `fetch_result`),
+        - up to BATCH_CONCURRENCY questions are answered in parallel, so
+          queries on different databases run side by side.
+
+    Each distinct question is traced on its own, as "<request id>-<n>"; the
+    request's trace only holds the shared embedding prefetch.
+    """
+    require_ready()
+    questions = request.questions
+    if not questions:
+        raise HTTPException(status_code=400, detail="Questions cannot be empty.")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions can be sent in one batch.")
+
+    # Repeated questions (ignoring case, spacing and trailing punctuation) are answered once.
+    distinct = {}
+    for question in questions:
+        distinct.setdefault(schema_retriever.normalize_question(question), question)
+    logger.info(f"Received a batch of {len(questions)} questions ({len(distinct)} distinct).")
+
+    timings = {}
+    with stage_timer(timings, "embedding_prefetch"):
+        try:
+            # Retrieval embeds the date-processed question, so that is what is prefetched.
+            await schema_retriever.prefetch_question_embeddings(
+                [date_resolver.rewrite_question(question) for question in distinct.values()]
+            )
+        except Exception as e:
+            # Not fatal: each question then embeds its own text.
+            logger.warning(f"Embedding the batch questions in one call failed: {e}")
+
+    limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+    batch_trace = tracing.current_trace()
+
+    async def answer(i: int, question: str) -> BatchItemResult:
+        async with limit:
+            request_id = f"{batch_trace.request_id}-{i}" if batch_trace is not None else None
+            return await answer_batch_question(question, request_id)
+
+    with stage_timer(timings, "answers"):
+        answers = dict(zip(distinct, await asyncio.gather(*(answer(i, q) for i, q in enumerate(distinct.values())))))
+    logger.info(f"Batch timings (ms): {timings}")
+    log_trace()
+
+    results = []
+    for question in questions:
+        result = answers[schema_retriever.normalize_question(question)]
+        results.append(result if result.question == question else result.model_copy(update={"question": question}))
+    return compressed_response(BatchQueryResponse.model_construct(results=results), "application/json", http_request)
@@ -0,0 +1,100 @@
+# backend/tests/test_date_resolver.py
+from datetime import date
+
+import pytest
+
+import core.date_resolver as date_resolver
+
+# A Friday.
+TODAY = date(2025, 10, 17)
+
+
+@pytest.mark.parametrize("question, rewritten", [
+    ("How many batches were processed today?", "How many batches were processed on the date 20251017?"),
+    ("total transactions yesterday", "total transactions on the date 20251016"),
+    ("batches last week", "batches between the dates 20251006 and 20251012"),
+    ("rejections last month", "rejections between the dates 20250901 and 20250930"),
+    ("batches in the last 7 days", "batches between the dates 20251011 and 20251017"),
+    ("batches in the last 2 days", "batches between the dates 20251016 and 20251017"),
+    ("batches in the last 1 day", "batches on the date 20251017"),
+    ("rejects previous day", "rejects on the date 20251016"),
+    ("rejects for the last day", "rejects on the date 20251016"),
+    ("what was rejected the prior day?", "what was rejected on the date 20251016?"),
+    ("what was processed last friday?", "what was processed on the date 20251010?"),
+    ("total for Q2 2025", "total between the dates 20250401 and 20250630"),
+    ("batches on 2025-10-01", "batches on the date 20251001"),
+    ("Why were transactions rejected on Oct 16?", "Why were transactions rejected on the date 20251016?"),
+    ("what happened in March?", "what happened between the dates 20250301 and 20250331?"),
+    ("transactions between 2025-10-01 and 2025-10-05", "transactions between the dates 20251001 and 20251005"),
+    ("compare yesterday with last friday", "compare on the date 20251016 with on the date 20251010"),
+])
+def test_rewrites_date_expressions(question, rewritten):
+    assert date_resolver.rewrite_question(question, TODAY) == rewritten
+
+
+@pytest.mark.parametrize("question", [
+    "totals in 2024",
+    "what happened during 2024?",
+    "batches for the year 2024",
+    "count in 2024, by month",
+])
+def test_bare_year_after_in_or_during_is_a_date(question):
+    resolved = date_resolver.resolve_dates(question, TODAY)
+    assert [r.bounds for r in resolved.ranges] == [("20240101", "20241231")]
+
+
+@pytest.mark.parametrize("question", [
+    # Counts and amounts that look like years.
+    "which batches had over 2000 transactions?",
+    "amount over 2024.50",
+    "for 2021 transactions",
+    "batches with more than 2000 items",
+    "sum for 2024",
+    "checks within 2020 rows of the top",
+    "rejected items in 2024 batches",
+    "amount in 2024.50 increments",
+    "in 2021 rows",
+    # Batch numbers and other literals.
+    "status of batch 0000513258",
+    "May I see the rejections for batch 0000578130?",
+    "top 5 batches by total transactions",
+    # Not a real day.
+    "sum of amounts on 2025-02-30",
+])
+def test_numbers_are_left_alone(question):
+    resolved = date_resolver.resolve_dates(question, TODAY)
+    assert resolved.text == question
+    assert resolved.ranges == ()
+    assert not date_resolver.mentions_date(question)
+
+
+@pytest.mark.parametrize("question, bounds", [
+    ("totals in 2024 and 2025", [("20240101", "20241231"), ("20250101", "20251231")]),
+    ("batches during 2023, 2024 or 2025",
+     [("20230101", "20231231"), ("20240101", "20241231"), ("20250101", "20251231")]),
+    ("the year 2023, and 2024", [("20230101", "20231231"), ("20240101", "20241231")]),
+    # Only the year is a date; the count after the list is not.
+    ("in 2024 and 2025 transactions", [("20240101", "20241231")]),
+    ("in 2024 and over 2000 items", [("20240101", "20241231")]),
+    ("in 2024 and for 2025", [("20240101", "20241231")]),
+])
+def test_each_year_of_a_list_is_a_date(question, bounds):
+    assert [r.bounds for r in date_resolver.resolve_dates(question, TODAY).ranges] == bounds
+
+
+def test_rewritten_numbers_keep_their_template_literals():
+    # The amount must reach the SQL template cache as an amount, not a date.
+    question = date_resolver.rewrite_question("items in batch 0000513258 over 2024.50 last week", TODAY)
+    assert question == "items in batch 0000513258 over 2024.50 between the dates 20251006 and 20251012"
+
+
+def test_ranges_describe_their_bounds():
+    resolved = date_resolver.resolve_dates("batches since last monday and on Oct 16", TODAY)
+    assert [r.describe() for r in resolved.ranges] == [
+        "between the dates 20251013 and 20251017", "on the date 20251016",
+    ]
+    assert resolved.ranges[0].phrase == "since last monday"
+
+
+def test_dates_without_a_year_are_never_in_the_future():
+    assert date_resolver.resolve_dates("batches on Dec 24", TODAY).ranges[0].bounds == ("20241224", "20241224")
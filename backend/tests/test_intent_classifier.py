@@ -0,0 +1,49 @@
+# backend/tests/test_intent_classifier.py
+import numpy as np
+import pytest
+
+import core.intent_classifier as intent_classifier
+
+QUESTION = [{"role": "user", "content": "who changed the status of batch 0000513258?"}]
+FOLLOW_UP = QUESTION + [
+    {"role": "assistant", "content": "The status was changed by ..."},
+    {"role": "user", "content": "and when?"},
+]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    # Audit questions point along the first axis, data questions along the second.
+    embeddings = np.array([[1.0, 0.0], [0.9, 0.1], [0.0, 1.0], [0.1, 0.9]])
+    intents = ["audit_history", "audit_history", "data_retrieval", "data_retrieval"]
+    monkeypatch.setattr(intent_classifier, "LOCAL_INTENT_ENABLED", True)
+    monkeypatch.setattr(intent_classifier, "model", intent_classifier.train(embeddings, intents, l2=0.0))
+    monkeypatch.setattr(intent_classifier, "decisions", {"local": 0, "not_confident": 0, "follow_up": 0})
+
+
+def test_classifies_confident_questions_locally(model):
+    assert intent_classifier.classify(np.array([1.0, 0.0], dtype=np.float32)) == "audit_history"
+    assert intent_classifier.classify(np.array([0.0, 1.0], dtype=np.float32)) == "data_retrieval"
+    assert intent_classifier.stats()["local"] == 2
+
+
+def test_leaves_unsure_questions_to_the_llm(model):
+    assert intent_classifier.classify(np.array([0.7, 0.7], dtype=np.float32)) is None
+    assert intent_classifier.stats()["not_confident"] == 1
+
+
+def test_decides_only_the_first_question_of_a_conversation(model):
+    assert intent_classifier.decides(QUESTION)
+    assert not intent_classifier.decides(FOLLOW_UP)
+    assert intent_classifier.stats()["follow_up"] == 1
+
+
+def test_untrained_model_decides_nothing(monkeypatch):
+    monkeypatch.setattr(intent_classifier, "model", None)
+    assert not intent_classifier.decides(QUESTION)
+    assert intent_classifier.classify(np.array([1.0, 0.0], dtype=np.float32)) is None
+
+
+def test_training_needs_both_intents():
+    with pytest.raises(ValueError):
+        intent_classifier.train(np.eye(2), ["audit_history", "audit_history"])
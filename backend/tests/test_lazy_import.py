@@ -0,0 +1,59 @@
+# backend/tests/test_lazy_import.py
+import sys
+import threading
+
+import pytest
+
+from core.lazy_import import lazy_import
+
+SLOW_MODULE = """
+import time
+time.sleep(0.2)
+def answer():
+    return 42
+"""
+
+
+@pytest.fixture
+def slow_module(tmp_path, monkeypatch):
+    (tmp_path / "lazy_slow_module.py").write_text(SLOW_MODULE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield "lazy_slow_module"
+    sys.modules.pop("lazy_slow_module", None)
+
+
+def test_module_is_imported_on_first_attribute_access(slow_module):
+    module = lazy_import(slow_module)
+    assert slow_module not in sys.modules
+    assert module.answer() == 42
+    assert slow_module in sys.modules
+
+
+def test_threads_racing_to_the_first_access_all_see_the_whole_module(slow_module):
+    module = lazy_import(slow_module)
+    barrier = threading.Barrier(16)
+    results, errors = [], []
+
+    def touch():
+        barrier.wait()
+        try:
+            results.append(module.answer())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=touch) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert results == [42] * 16
+
+
+def test_missing_module_fails_at_import_time():
+    with pytest.raises(ModuleNotFoundError):
+        lazy_import("no_such_module_here")
+
+
+def test_imported_module_is_returned_as_is():
+    assert lazy_import("json") is sys.modules["json"]
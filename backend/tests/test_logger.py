@@ -0,0 +1,31 @@
+# backend/tests/test_logger.py
+from datetime import date, timedelta
+
+import pytest
+
+import core.logger as logger
+
+
+@pytest.fixture
+def log_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(logger, "LOG_DIR", str(tmp_path))
+    old = date.today() - timedelta(days=400)
+    for name in (f"{old:%Y-%m-%d}.log", f"{old:%Y-%m-%d}.1.log", f"{date.today():%Y-%m-%d}.log"):
+        (tmp_path / name).write_text("INFO | ...\n")
+    return tmp_path
+
+
+def test_keeps_every_log_file_by_default(log_dir):
+    assert logger.LOG_RETENTION_DAYS == 0
+    handler = logger.DailyFileHandler()
+    handler._delete_old_files()
+    handler.close()
+    assert len(list(log_dir.iterdir())) == 3
+
+
+def test_deletes_files_past_the_retention_when_set(log_dir, monkeypatch):
+    monkeypatch.setattr(logger, "LOG_RETENTION_DAYS", 30)
+    handler = logger.DailyFileHandler()
+    handler._delete_old_files()
+    handler.close()
+    assert [path.name for path in log_dir.iterdir()] == [f"{date.today():%Y-%m-%d}.log"]
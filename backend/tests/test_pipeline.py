@@ -0,0 +1,128 @@
+# backend/tests/test_pipeline.py
+import asyncio
+from datetime import date
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import core.date_resolver as date_resolver
+import core.nl_to_sql as nl_to_sql
+import core.result_analyzer as result_analyzer
+import core.result_cache as result_cache
+import core.sql_templates as sql_templates
+import core.tracing as tracing
+import main
+
+SQL = "SELECT RejCode, RejDesc FROM PSGTMS.REJREASON"
+TODAY = date(2025, 10, 17)
+RESULT = pd.DataFrame({"RejCode": [1, 2], "RejDesc": ["Stale date", "Missing signature"]})
+
+
+def run(history, stream_summary=False):
+    async def collect():
+        return [event async for event in main.run_query_pipeline(history, {}, stream_summary=stream_summary)]
+    return asyncio.run(collect())
+
+
+def summary_of(events):
+    return next(data["summary"] for event, data in events if event == "summary")
+
+
+@pytest.fixture(autouse=True)
+def pipeline(monkeypatch):
+    """A pipeline that reuses a cached template for SQL and returns RESULT."""
+    async def fetch_result(engine_name, sql_query, executable_sql, sql_params, timings):
+        return RESULT
+
+    monkeypatch.setattr(sql_templates, "lookup", lambda question: (SQL, None))
+    monkeypatch.setattr(main, "fetch_result", fetch_result)
+    monkeypatch.setattr(result_cache, "backend", result_cache.InProcessBackend())
+
+
+def stream_of(*tokens, error=None):
+    async def stream_summary(history, result_df):
+        for token in tokens:
+            yield token
+        if error is not None:
+            raise result_analyzer.SummaryError(error)
+    return stream_summary
+
+
+def test_streamed_summary_is_cached(monkeypatch):
+    monkeypatch.setattr(result_analyzer, "stream_summary", stream_of("Two ", "reasons."))
+    history = [{"role": "user", "content": "list the rejection reasons"}]
+    assert summary_of(run(history, stream_summary=True)) == "Two reasons."
+
+    monkeypatch.setattr(result_analyzer, "stream_summary", stream_of(error="Error: not called"))
+    assert summary_of(run(history, stream_summary=True)) == "Two reasons."
+
+
+def test_summary_that_failed_midway_is_not_cached(monkeypatch):
+    monkeypatch.setattr(
+        result_analyzer, "stream_summary", stream_of("There are ", error="Error: Failed to summarize the result. timeout"),
+    )
+    history = [{"role": "user", "content": "list the rejection reasons"}]
+    events = run(history, stream_summary=True)
+    tokens = [data["text"] for event, data in events if event == "summary_token"]
+    assert tokens == ["There are ", "\n\nError: Failed to summarize the result. timeout"]
+    assert summary_of(events) == "There are \n\nError: Failed to summarize the result. timeout"
+
+    monkeypatch.setattr(result_analyzer, "stream_summary", stream_of("Two reasons."))
+    assert summary_of(run(history, stream_summary=True)) == "Two reasons."
+
+
+def test_each_batch_question_has_its_own_trace(monkeypatch):
+    async def summarize_result(history, result_df):
+        question = history[-1]["content"]
+        tracing.record_usage("summarization", type("Usage", (), {"prompt_tokens": len(question), "completion_tokens": 1}))
+        return f"Answer to {question}"
+
+    traces = []
+    monkeypatch.setattr(result_analyzer, "summarize_result", summarize_result)
+    monkeypatch.setattr(main, "log_trace", lambda: traces.append(tracing.current_trace()))
+    monkeypatch.setitem(main.startup_status, "status", "ready")
+
+    response = TestClient(main.app).post(
+        "/query/batch", json={"questions": ["reasons", "all the reasons", "Reasons?"]}, headers={"X-Request-ID": "batch1"},
+    )
+    results = response.json()["results"]
+    assert [r["request_id"] for r in results] == ["batch1-0", "batch1-1", "batch1-0"]
+    assert [r["summary"] for r in results] == ["Answer to reasons", "Answer to all the reasons", "Answer to reasons"]
+
+    by_id = {trace.request_id: trace for trace in traces}
+    assert by_id["batch1-0"].tokens == {"summarization": {"prompt": 7, "completion": 1}}
+    assert by_id["batch1-1"].tokens == {"summarization": {"prompt": 15, "completion": 1}}
+    assert [stage for stage, _, _ in by_id["batch1-1"].spans] == ["summarization"]
+    # The request's own trace holds the shared stages only.
+    batch_stages = {stage for stage, _, _ in by_id["batch1"].spans}
+    assert {"embedding_prefetch", "answers"} <= batch_stages and "summarization" not in batch_stages
+    assert by_id["batch1"].tokens == {}
+
+
+def test_follow_up_dates_become_bind_parameters(monkeypatch):
+    async def resolve_intent_and_schemas(history, timings):
+        return "data_retrieval", "Table: PSGTMS.BATCHFILE"
+
+    async def generate_sql_query(history, schemas):
+        return "SELECT COUNT(*) FROM PSGTMS.BATCHFILE WHERE ProcessDate = '20251016'"
+
+    fetched = []
+
+    async def fetch_result(engine_name, sql_query, executable_sql, sql_params, timings):
+        fetched.append((executable_sql, sql_params))
+        return RESULT
+
+    monkeypatch.setattr(date_resolver, "date", type("FixedDate", (date,), {"today": staticmethod(lambda: TODAY)}))
+    monkeypatch.setattr(main, "resolve_intent_and_schemas", resolve_intent_and_schemas)
+    monkeypatch.setattr(nl_to_sql, "generate_sql_query", generate_sql_query)
+    monkeypatch.setattr(main, "fetch_result", fetch_result)
+    history = [
+        {"role": "user", "content": "how many batches last friday?"},
+        {"role": "assistant", "content": "There were 12 batches."},
+        {"role": "user", "content": "and yesterday?"},
+    ]
+    run(history)
+    [(executable_sql, sql_params)] = fetched
+    assert sql_params == {"date_0": "20251016"}
+    assert "ProcessDate = :date_0" in executable_sql
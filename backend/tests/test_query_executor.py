@@ -0,0 +1,38 @@
+# backend/tests/test_query_executor.py
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, event
+
+import core.query_executor as query_executor
+import core.query_router as query_router
+
+
+@pytest.fixture
+def tms_engine(tmp_path, monkeypatch):
+    path = tmp_path / "PSGTMS.db"
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE BATCHFILE (BatchNo TEXT)")
+        connection.executemany("INSERT INTO BATCHFILE VALUES (?)", [(str(i),) for i in range(25)])
+        connection.execute("CREATE TABLE REJREASON (RejCode INTEGER)")
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def _attach(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE '{path}' AS PSGTMS")
+
+    monkeypatch.setattr(query_executor, "engines", {"tms": engine})
+    monkeypatch.setattr(query_router, "table_engines", {})
+    yield engine
+    engine.dispose()
+
+
+def test_counts_the_rows_of_each_table(tms_engine):
+    counts = query_executor.table_row_counts(["PSGTMS.BATCHFILE", "PSGTMS.RejReason"])
+    assert counts == {"PSGTMS.BATCHFILE": 25, "PSGTMS.REJREASON": 0}
+
+
+def test_leaves_out_tables_it_cannot_count(tms_engine):
+    # PSGAuditStats routes to the "audit" engine, which is not configured here.
+    counts = query_executor.table_row_counts(["PSGTMS.Missing", "PSGAuditStats.tblAuditLogMaster", "PSGTMS.BATCHFILE"])
+    assert counts == {"PSGTMS.BATCHFILE": 25}
@@ -0,0 +1,145 @@
+# backend/tests/test_query_guard.py
+import pytest
+
+import core.query_guard as query_guard
+
+SCHEMA_TEXT = """Table: PSGTMS.BATCHFILE
+Size: ~2,000,000 rows (estimated). Filter on: BatchNo, ProcessDate.
+---
+Table: PSGTMS.DetailFile1
+Size: ~60,000,000 rows. Filter on: BatchNo, ProcessDate, DetailKey.
+---
+Table: PSGTMS.REJREASON
+Size: ~20 rows.
+"""
+
+
+@pytest.fixture(autouse=True)
+def hints(monkeypatch):
+    monkeypatch.setattr(query_guard, "QUERY_ROW_LIMIT", 1000)
+    query_guard.load_table_hints(SCHEMA_TEXT)
+    yield
+    query_guard.load_table_hints("")
+
+
+def test_loads_size_hints():
+    assert query_guard.table_hints["PSGTMS.DETAILFILE1"] == query_guard.TableHint(
+        60_000_000, ("BatchNo", "ProcessDate", "DetailKey"),
+    )
+    assert query_guard.table_hints["PSGTMS.REJREASON"].filter_columns == ()
+
+
+@pytest.mark.parametrize("sql_query, limited", [
+    ("SELECT * FROM PSGTMS.REJREASON", "SELECT TOP (1000) * FROM PSGTMS.REJREASON"),
+    ("SELECT DISTINCT RejDesc FROM PSGTMS.REJREASON", "SELECT DISTINCT TOP (1000) RejDesc FROM PSGTMS.REJREASON"),
+    ("WITH r AS (SELECT * FROM PSGTMS.REJREASON) SELECT * FROM r",
+     "WITH r AS (SELECT * FROM PSGTMS.REJREASON) SELECT TOP (1000) * FROM r"),
+])
+def test_adds_top_for_sql_server(sql_query, limited):
+    result = query_guard.guard_query(sql_query, "mssql")
+    assert result.allowed
+    assert result.sql == limited
+
+
+@pytest.mark.parametrize("sql_query, limited", [
+    ("SELECT * FROM PSGTMS.REJREASON", "SELECT * FROM PSGTMS.REJREASON LIMIT 1000"),
+    ("SELECT * FROM PSGTMS.REJREASON;", "SELECT * FROM PSGTMS.REJREASON LIMIT 1000;"),
+    ("SELECT * FROM PSGTMS.REJREASON -- all reasons",
+     "SELECT * FROM PSGTMS.REJREASON LIMIT 1000 -- all reasons"),
+    ("SELECT * FROM PSGTMS.REJREASON; -- all reasons\n",
+     "SELECT * FROM PSGTMS.REJREASON LIMIT 1000; -- all reasons\n"),
+    ("SELECT * FROM PSGTMS.REJREASON /* all */", "SELECT * FROM PSGTMS.REJREASON LIMIT 1000 /* all */"),
+])
+def test_adds_limit_before_trailing_semicolons_and_comments(sql_query, limited):
+    assert query_guard.guard_query(sql_query, "sqlite").sql == limited
+
+
+@pytest.mark.parametrize("sql_query, dialect", [
+    ("SELECT TOP 10 * FROM PSGTMS.REJREASON", "mssql"),
+    ("SELECT * FROM PSGTMS.REJREASON LIMIT 10", "sqlite"),
+    ("SELECT * FROM PSGTMS.REJREASON ORDER BY RejCode OFFSET 0 ROWS FETCH NEXT 10 ROWS ONLY", "mssql"),
+])
+def test_keeps_an_existing_limit(sql_query, dialect):
+    assert query_guard.guard_query(sql_query, dialect).sql == sql_query
+
+
+@pytest.mark.parametrize("sql_query, limited", [
+    ("SELECT RejCode FROM PSGTMS.REJREASON ORDER BY RejCode OFFSET 10 ROWS",
+     "SELECT RejCode FROM PSGTMS.REJREASON ORDER BY RejCode OFFSET 10 ROWS FETCH NEXT 1000 ROWS ONLY"),
+    ("SELECT RejCode FROM PSGTMS.REJREASON ORDER BY RejCode OFFSET 10 ROWS; -- page 2",
+     "SELECT RejCode FROM PSGTMS.REJREASON ORDER BY RejCode OFFSET 10 ROWS FETCH NEXT 1000 ROWS ONLY; -- page 2"),
+    # FETCH limits the whole UNION, unlike TOP.
+    ("SELECT RejCode FROM PSGTMS.REJREASON UNION SELECT RejCode FROM PSGTMS.REJREASON ORDER BY 1 OFFSET 0 ROWS",
+     "SELECT RejCode FROM PSGTMS.REJREASON UNION SELECT RejCode FROM PSGTMS.REJREASON ORDER BY 1 OFFSET 0 ROWS "
+     "FETCH NEXT 1000 ROWS ONLY"),
+])
+def test_adds_fetch_instead_of_top_after_an_offset(sql_query, limited):
+    result = query_guard.guard_query(sql_query, "mssql")
+    assert result.sql == limited
+    assert result.warnings == ()
+
+
+def test_offset_in_a_subquery_still_gets_top():
+    sql_query = "SELECT * FROM (SELECT RejCode FROM PSGTMS.REJREASON ORDER BY RejCode OFFSET 5 ROWS) AS r"
+    assert query_guard.guard_query(sql_query, "mssql").sql == sql_query.replace("SELECT *", "SELECT TOP (1000) *", 1)
+
+
+def test_union_gets_no_top_but_a_warning():
+    sql_query = "SELECT RejCode FROM PSGTMS.REJREASON UNION SELECT RejCode FROM PSGTMS.REJREASON"
+    result = query_guard.guard_query(sql_query, "mssql")
+    assert result.allowed and result.sql == sql_query
+    assert any("No row limit" in warning for warning in result.warnings)
+
+
+@pytest.mark.parametrize("sql_query", [
+    "SELECT COUNT(*) FROM PSGTMS.DetailFile1 WHERE Reject = 1",
+    "SELECT * FROM PSGTMS.BATCHFILE",
+    "SELECT * FROM PSGTMS.DetailFile1;",
+    # A join on an indexed column does not help if neither side is filtered.
+    "SELECT * FROM PSGTMS.BATCHFILE B JOIN PSGTMS.DetailFile1 D ON B.BatchNo = D.BatchNo",
+])
+def test_rejects_unfiltered_large_tables_in_reject_mode(monkeypatch, sql_query):
+    monkeypatch.setattr(query_guard, "QUERY_GUARD_MODE", "reject")
+    result = query_guard._guard(sql_query, "mssql")
+    assert not result.allowed
+    assert "without filtering on" in result.message
+
+
+@pytest.mark.parametrize("sql_query", [
+    "SELECT COUNT(*) FROM PSGTMS.DetailFile1 WHERE BatchNo = '0000513258' AND Reject = 1",
+    "SELECT * FROM PSGTMS.DetailFile1 WHERE ProcessDate BETWEEN :date_0 AND :date_1",
+    "SELECT D.* FROM PSGTMS.BATCHFILE AS B JOIN PSGTMS.DetailFile1 AS D ON B.BatchNo = D.BatchNo "
+    "WHERE B.ProcessDate = '20251016'",
+    "SELECT * FROM PSGTMS.REJREASON",
+])
+def test_allows_filtered_or_small_tables_in_reject_mode(monkeypatch, sql_query):
+    monkeypatch.setattr(query_guard, "QUERY_GUARD_MODE", "reject")
+    result = query_guard._guard(sql_query, "mssql")
+    assert result.allowed
+    assert result.warnings == ()
+
+
+def test_only_warns_by_default():
+    assert query_guard.QUERY_GUARD_MODE == "warn"
+    result = query_guard.guard_query("SELECT COUNT(*) FROM PSGTMS.DetailFile1 WHERE Reject = 1", "mssql")
+    assert result.allowed
+    assert result.sql == "SELECT TOP (1000) COUNT(*) FROM PSGTMS.DetailFile1 WHERE Reject = 1"
+    assert "PSGTMS.DETAILFILE1 (an estimated 60,000,000 rows)" in result.warnings[0]
+
+
+def test_measured_sizes_replace_the_estimates(monkeypatch):
+    monkeypatch.setattr(query_guard, "QUERY_GUARD_MODE", "reject")
+    sql_query = "SELECT * FROM PSGTMS.BATCHFILE"
+    assert not query_guard.guard_query(sql_query, "mssql").allowed
+
+    query_guard.set_measured_sizes({"PSGTMS.BATCHFILE": 5_000, "PSGTMS.Unknown": 1})
+    assert query_guard.table_hints["PSGTMS.BATCHFILE"] == query_guard.TableHint(
+        5_000, ("BatchNo", "ProcessDate"), measured=True,
+    )
+    assert "PSGTMS.UNKNOWN" not in query_guard.table_hints
+    assert query_guard.guard_query(sql_query, "mssql").allowed
+
+    query_guard.set_measured_sizes({"PSGTMS.DETAILFILE1": 70_000_000})
+    message = query_guard.guard_query("SELECT * FROM PSGTMS.DetailFile1", "mssql").message
+    assert "PSGTMS.DETAILFILE1 (70,000,000 rows)" in message
+    assert query_guard.stats()["tables_measured"] == 2
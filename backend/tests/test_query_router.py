@@ -0,0 +1,71 @@
+# backend/tests/test_query_router.py
+import pytest
+
+import core.query_router as query_router
+
+SCHEMA_TEXT = """Table: PSGTMS.BATCHFILE
+Description: One row per batch.
+---
+Table: PSGTMS.ARCHIVE
+Database: archive
+Description: Batches moved to the archive database.
+---
+Table: PSGAuditStats.tblAuditLogMaster
+Description: One row per audited change.
+"""
+
+
+@pytest.fixture(autouse=True)
+def routes():
+    query_router.load_routes(SCHEMA_TEXT)
+    yield
+    query_router.table_engines.clear()
+    query_router._routes.clear()
+
+
+def test_referenced_tables_reads_from_and_join_clauses():
+    sql_query = (
+        "SELECT * FROM PSGTMS.BATCHFILE B "
+        "JOIN PSGAuditStats.tblAuditLogMaster M ON B.BatchNo = M.BatchNo "
+        "WHERE B.BatchNo IN (SELECT BatchNo FROM [PSGTMS].[REJREASON])"
+    )
+    assert query_router.referenced_tables(sql_query) == [
+        "PSGTMS.BATCHFILE", "PSGAuditStats.tblAuditLogMaster", "PSGTMS.REJREASON",
+    ]
+
+
+def test_referenced_tables_leaves_out_ctes():
+    sql_query = "WITH b AS (SELECT BatchNo FROM PSGTMS.BATCHFILE) SELECT * FROM b"
+    assert query_router.referenced_tables(sql_query) == ["PSGTMS.BATCHFILE"]
+
+
+@pytest.mark.parametrize("sql_query, engine", [
+    ("SELECT * FROM PSGTMS.BATCHFILE", "tms"),
+    ("SELECT * FROM [PSGAuditStats].[tblAuditLogMaster]", "audit"),
+    # Tables that are not in the catalog are routed by their schema.
+    ("SELECT * FROM psgauditstats.tblAuditLogDetail", "audit"),
+    # A 'Database:' line overrides the schema.
+    ("SELECT * FROM PSGTMS.ARCHIVE", "archive"),
+    ("SELECT 1", query_router.DB_DEFAULT_ENGINE),
+])
+def test_routes_by_table(sql_query, engine):
+    result = query_router.route(sql_query)
+    assert result.engine_name == engine
+    assert not result.cross_database
+
+
+@pytest.mark.parametrize("sql_query", [
+    "SELECT * FROM PSGTMS.BATCHFILE WHERE RejDesc = 'see PSGAuditStats.tblAuditLogMaster'",
+    "SELECT * FROM PSGTMS.BATCHFILE -- FROM PSGAuditStats.tblAuditLogMaster",
+])
+def test_schema_names_in_literals_and_comments_do_not_route(sql_query):
+    assert query_router.route(sql_query).engines == ("tms",)
+
+
+def test_cross_database_query_names_tables_per_engine():
+    result = query_router.route(
+        "SELECT * FROM PSGTMS.BATCHFILE B JOIN PSGAuditStats.tblAuditLogMaster M ON B.BatchNo = M.BatchNo"
+    )
+    assert result.cross_database
+    assert result.engines == ("tms", "audit")
+    assert "tms: PSGTMS.BATCHFILE; audit: PSGAuditStats.tblAuditLogMaster" in result.message
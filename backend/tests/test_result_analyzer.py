@@ -0,0 +1,73 @@
+# backend/tests/test_result_analyzer.py
+import asyncio
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import core.result_analyzer as result_analyzer
+import core.tracing as tracing
+
+# Too many cells for fast_summary, so the model writes the summary.
+RESULT = pd.DataFrame({"BatchNo": [f"00005132{i:02d}" for i in range(10)], "Items": range(10)})
+HISTORY = [{"role": "user", "content": "items per batch"}]
+TOKENS = ("tmsbot_llm_tokens_total", (("stage", "summarization"), ("kind", "completion")))
+
+
+def chunk(content=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class FakeCompletions:
+    def __init__(self, chunks, error=None):
+        self.chunks, self.error, self.kwargs = chunks, error, None
+
+    async def create(self, **kwargs):
+        self.kwargs = kwargs
+
+        async def stream():
+            for item in self.chunks:
+                yield item
+            if self.error is not None:
+                raise self.error
+        return stream()
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    def install(chunks, error=None):
+        fake = FakeCompletions(chunks, error)
+        monkeypatch.setattr(result_analyzer, "client", SimpleNamespace(chat=SimpleNamespace(completions=fake)))
+        return fake
+    return install
+
+
+def stream(history=HISTORY):
+    async def collect():
+        return [token async for token in result_analyzer.stream_summary(history, RESULT)]
+    return asyncio.run(collect())
+
+
+def test_streamed_summary_records_its_token_usage(completions):
+    usage = SimpleNamespace(prompt_tokens=120, completion_tokens=7)
+    fake = completions([chunk("Ten "), chunk("batches."), chunk(usage=usage)])
+    before = tracing._counters.get(TOKENS, 0)
+    with tracing.start_trace("test") as trace:
+        assert stream() == ["Ten ", "batches."]
+    assert fake.kwargs["stream"] and fake.kwargs["stream_options"] == {"include_usage": True}
+    assert trace.tokens["summarization"] == {"prompt": 120, "completion": 7}
+    assert tracing._counters[TOKENS] == before + 7
+
+
+def test_stream_failure_raises_after_the_tokens_that_arrived(completions):
+    completions([chunk("Ten ")], error=RuntimeError("connection reset"))
+    tokens = []
+
+    async def collect():
+        async for token in result_analyzer.stream_summary(HISTORY, RESULT):
+            tokens.append(token)
+
+    with pytest.raises(result_analyzer.SummaryError, match="^Error: Failed to summarize the result. connection reset"):
+        asyncio.run(collect())
+    assert tokens == ["Ten "]
@@ -0,0 +1,45 @@
+# backend/tests/test_result_cache.py
+import pandas as pd
+import pytest
+
+import core.result_cache as result_cache
+
+
+@pytest.mark.parametrize("a, b", [
+    ("SELECT * FROM PSGTMS.BATCHFILE;", "SELECT *\n  FROM PSGTMS.BATCHFILE"),
+    ("SELECT * FROM PSGTMS.BATCHFILE WHERE BatchNo = '0000513258' ;",
+     "SELECT  *\tFROM PSGTMS.BATCHFILE\r\nWHERE BatchNo = '0000513258'"),
+])
+def test_whitespace_outside_literals_is_normalized(a, b):
+    assert result_cache.normalize_sql(a) == result_cache.normalize_sql(b)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("SELECT * FROM PSGAuditStats.tblAuditLogMaster WHERE Usercode = 'A  B'",
+     "SELECT * FROM PSGAuditStats.tblAuditLogMaster WHERE Usercode = 'A B'"),
+    ("SELECT [Batch  No] FROM PSGTMS.BATCHFILE", "SELECT [Batch No] FROM PSGTMS.BATCHFILE"),
+])
+def test_whitespace_inside_literals_is_kept(a, b):
+    assert result_cache.normalize_sql(a) != result_cache.normalize_sql(b)
+
+
+def test_results_are_not_shared_between_different_literals(monkeypatch):
+    monkeypatch.setattr(result_cache, "backend", result_cache.InProcessBackend())
+    two_spaces = "SELECT * FROM PSGAuditStats.tblAuditLogMaster WHERE Usercode = 'A  B'"
+    one_space = "SELECT * FROM PSGAuditStats.tblAuditLogMaster WHERE Usercode = 'A B'"
+    result_cache.set_result("audit", two_spaces, pd.DataFrame({"Usercode": ["A  B"]}))
+    assert result_cache.get_result("audit", one_space) is None
+    assert result_cache.get_result("audit", two_spaces + ";")["Usercode"].tolist() == ["A  B"]
+
+
+def test_summaries_are_keyed_on_the_whole_conversation(monkeypatch):
+    monkeypatch.setattr(result_cache, "backend", result_cache.InProcessBackend())
+    sql_query = "SELECT COUNT(*) FROM PSGTMS.DetailFile1 WHERE BatchNo = '0000513258' AND Reject = 1"
+    follow_up = {"role": "user", "content": "and how many were rejected?"}
+    about_checks = [{"role": "user", "content": "checks in batch 0000513258"}, {"role": "assistant", "content": "12"}]
+    about_items = [{"role": "user", "content": "items in batch 0000513258"}, {"role": "assistant", "content": "40"}]
+
+    result_cache.set_summary("tms", sql_query, about_checks + [follow_up], "3 of the 12 checks were rejected.")
+    assert result_cache.get_summary("tms", sql_query, about_checks + [follow_up]) == "3 of the 12 checks were rejected."
+    assert result_cache.get_summary("tms", sql_query, about_items + [follow_up]) is None
+    assert result_cache.get_summary("tms", sql_query, [follow_up]) is None
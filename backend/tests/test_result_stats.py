@@ -0,0 +1,75 @@
+# backend/tests/test_result_stats.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.result_stats import BatchRuns, ResultAggregator, batch_breakdown, describe_runs
+
+
+def pairs(batch_nos, tran_nos) -> pd.DataFrame:
+    return pd.DataFrame({"BatchNo": batch_nos, "TranNo": tran_nos})
+
+
+def test_batch_breakdown_writes_consecutive_tran_nos_as_ranges():
+    breakdown = batch_breakdown(pairs(
+        ["0000000002", "0000000001", "0000000001", "0000000001", "0000000001", "0000000001"],
+        [7, 1, 2, 2, 3, 9],
+    ), max_batches=25, max_ranges=20)
+    assert breakdown == {
+        "total_batches": 2,
+        "unique_tran_count": 5,
+        "batches": [
+            {"batch_no": "0000000001", "tran_count": 4, "ranges": [(1, 3), (9, 9)], "more_ranges": 0},
+            {"batch_no": "0000000002", "tran_count": 1, "ranges": [(7, 7)], "more_ranges": 0},
+        ],
+        "other_batches": 0,
+        "other_trans": 0,
+    }
+
+
+def test_batch_breakdown_caps_batches_and_ranges():
+    breakdown = batch_breakdown(pairs(
+        ["0000000001"] * 3 + ["0000000002"] * 4, [1, 2, 3, 1, 3, 5, 7],
+    ), max_batches=1, max_ranges=2)
+    assert breakdown["batches"] == [
+        {"batch_no": "0000000002", "tran_count": 4, "ranges": [(1, 1), (3, 3)], "more_ranges": 2},
+    ]
+    assert (breakdown["other_batches"], breakdown["other_trans"]) == (1, 3)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 250, 5000])
+def test_aggregator_matches_the_whole_result(chunk_size):
+    rng = np.random.default_rng(7)
+    rows = 3000
+    frame = pairs(
+        [f"{b:010d}" for b in rng.integers(0, 40, rows)],
+        rng.integers(0, 300, rows).astype(float),
+    )
+    frame.loc[rng.integers(0, rows, 20), "TranNo"] = np.nan
+    frame["Amount"] = rng.random(rows) * 100
+
+    aggregator = ResultAggregator()
+    for start in range(0, rows, chunk_size):
+        aggregator.update(frame.iloc[start:start + chunk_size])
+    summary = aggregator.summary()
+
+    assert summary["row_count"] == rows
+    assert summary["numeric"]["Amount"]["sum"] == pytest.approx(frame["Amount"].sum())
+    assert describe_runs(summary["batch_runs"], 25, 20) == batch_breakdown(frame, 25, 20)
+
+
+def test_aggregator_keeps_runs_not_rows():
+    aggregator = ResultAggregator()
+    for start in range(0, 100_000, 2000):
+        tran_nos = np.arange(start, start + 2000)
+        aggregator.update(pairs([f"{b:010d}" for b in tran_nos // 10_000], tran_nos))
+    runs = aggregator.summary()["batch_runs"]
+    assert isinstance(runs, BatchRuns)
+    assert len(runs.codes) == 10
+    assert list(zip(runs.starts.tolist(), runs.ends.tolist()))[:2] == [(0, 9999), (10000, 19999)]
+
+
+def test_aggregator_without_batch_columns_has_no_runs():
+    aggregator = ResultAggregator()
+    aggregator.update(pd.DataFrame({"Amount": [1.0, 2.0]}))
+    assert aggregator.summary()["batch_runs"] is None
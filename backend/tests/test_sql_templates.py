@@ -0,0 +1,92 @@
+# backend/tests/test_sql_templates.py
+import pytest
+
+import core.sql_templates as sql_templates
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    sql_templates.invalidate()
+    yield
+    sql_templates.invalidate()
+
+
+def test_extract_literals():
+    skeleton, literals = sql_templates.extract_literals("Status of batch 0000513258 on 20251016?")
+    assert skeleton == "status of batch {batch_0} on {date_0}"
+    assert literals == [("date_0", "20251016"), ("batch_0", "0000513258")]
+
+
+@pytest.mark.parametrize("question, sql_query, params", [
+    (
+        "status of batch 0000513258",
+        "SELECT * FROM PSGTMS.BATCHFILE WHERE BatchNo = '0000513258';",
+        {"batch_0": "0000513258"},
+    ),
+    (
+        "batches between the dates 20251001 and 20251005",
+        "SELECT COUNT(*) FROM PSGTMS.BATCHFILE WHERE ProcessDate BETWEEN '20251001' AND '20251005'",
+        {"date_0": "20251001", "date_1": "20251005"},
+    ),
+    (
+        "items in batch 0000513258 over 150.00",
+        "SELECT * FROM PSGTMS.DetailFile1 WHERE BatchNo = '0000513258' AND Amount > 150.00",
+        {"batch_0": "0000513258", "amount_0": 150.0},
+    ),
+])
+def test_parameterize_and_render_round_trip(question, sql_query, params):
+    template, bound = sql_templates.parameterize(question, sql_query)
+    assert bound == params
+    for name in params:
+        assert f":{name}" in template
+    assert "'" not in template.split("WHERE", 1)[1]
+    assert sql_templates.render(template, bound) == sql_query
+
+
+def test_amount_matches_however_sql_writes_it():
+    template, params = sql_templates.parameterize(
+        "items over $1,500", "SELECT * FROM PSGTMS.DetailFile1 WHERE Amount > 1500.0"
+    )
+    assert template == "SELECT * FROM PSGTMS.DetailFile1 WHERE Amount > :amount_0"
+    assert params == {"amount_0": 1500.0}
+    assert sql_templates.render(template, params) == "SELECT * FROM PSGTMS.DetailFile1 WHERE Amount > 1500.00"
+
+
+@pytest.mark.parametrize("question, sql_query", [
+    # The literal is not in the SQL.
+    ("status of batch 0000513258", "SELECT * FROM PSGTMS.BATCHFILE WHERE BatchNo = '0000578130'"),
+    # The literal is in the SQL twice, so it could be bound into the wrong place.
+    ("status of batch 0000513258",
+     "SELECT * FROM PSGTMS.BATCHFILE WHERE BatchNo = '0000513258' OR SourceBatch = '0000513258'"),
+])
+def test_ambiguous_literals_are_not_templated(question, sql_query):
+    assert sql_templates.parameterize(question, sql_query) is None
+    unusable = sql_templates.unusable
+    assert sql_templates.store(question, sql_query) is None
+    assert sql_templates.unusable == unusable + 1
+
+
+def test_stored_template_serves_questions_with_the_same_skeleton():
+    stored = sql_templates.store(
+        "status of batch 0000513258", "SELECT * FROM PSGTMS.BATCHFILE WHERE BatchNo = '0000513258'"
+    )
+    assert stored == ("SELECT * FROM PSGTMS.BATCHFILE WHERE BatchNo = :batch_0", {"batch_0": "0000513258"})
+    assert sql_templates.lookup("Status of batch 0000578130?") == (
+        "SELECT * FROM PSGTMS.BATCHFILE WHERE BatchNo = :batch_0", {"batch_0": "0000578130"},
+    )
+    assert sql_templates.lookup("rejections of batch 0000578130") is None
+
+
+def test_render_does_not_confuse_parameter_prefixes():
+    params = {f"batch_{i}": f"{i:010d}" for i in range(11)}
+    rendered = sql_templates.render("SELECT :batch_1, :batch_10", params)
+    assert rendered == "SELECT '0000000001', '0000000010'"
+
+
+def test_schema_change_drops_templates():
+    sql_templates.set_schema_version("Table: PSGTMS.BATCHFILE")
+    sql_templates.store("status of batch 0000513258", "SELECT * FROM PSGTMS.BATCHFILE WHERE BatchNo = '0000513258'")
+    sql_templates.set_schema_version("Table: PSGTMS.BATCHFILE")
+    assert sql_templates.lookup("status of batch 0000578130") is not None
+    sql_templates.set_schema_version("Table: PSGTMS.BATCHFILE\nColumn: Status")
+    assert sql_templates.lookup("status of batch 0000578130") is None
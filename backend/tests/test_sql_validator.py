@@ -0,0 +1,79 @@
+# backend/tests/test_sql_validator.py
+import pytest
+
+import core.sql_validator as sql_validator
+
+
+@pytest.mark.parametrize("sql_query", [
+    "SELECT BatchNo, Amount FROM PSGTMS.DetailFile1 WHERE Reject = 1;",
+    "SELECT * FROM [PSGAuditStats].[tblAuditLogMaster];",
+    "   SELECT * FROM PSGTMS.BATCHFILE",
+    "select count(*) from psgtms.batchfile",
+    "WITH b AS (SELECT BatchNo FROM PSGTMS.BATCHFILE) SELECT * FROM b",
+    "WITH a AS (SELECT 1 AS x), b AS (SELECT x FROM a) SELECT * FROM b",
+    "SELECT BatchNo FROM PSGTMS.BATCHFILE UNION ALL SELECT BatchNo FROM PSGTMS.DetailFile1",
+    "SELECT * FROM (SELECT BatchNo FROM PSGTMS.BATCHFILE) AS t",
+    "SELECT B.BatchNo FROM PSGTMS.BATCHFILE B JOIN PSGTMS.DetailFile1 D ON B.BatchNo = D.BatchNo",
+    "SELECT * FROM PSGTMS.BATCHFILE WHERE BatchNo = :batch_0",
+])
+def test_allows_read_only_queries(sql_query):
+    assert sql_validator.check_query(sql_query) == (True, "Query is safe.")
+
+
+@pytest.mark.parametrize("sql_query", [
+    # Keywords inside string literals and comments are not commands.
+    "SELECT * FROM PSGTMS.REJREASON WHERE RejDesc = 'DROP TABLE'",
+    "SELECT * FROM PSGTMS.REJREASON WHERE RejDesc = 'EXEC xp_cmdshell; SELECT 1'",
+    "SELECT * FROM PSGTMS.BATCHFILE -- DELETE FROM PSGTMS.BATCHFILE",
+    "SELECT * FROM PSGTMS.BATCHFILE /* UPDATE; DROP */ WHERE BatchNo = '1'",
+    "SELECT [Update] FROM PSGTMS.BATCHFILE",
+])
+def test_ignores_keywords_in_literals_and_comments(sql_query):
+    assert sql_validator.check_query(sql_query)[0]
+
+
+@pytest.mark.parametrize("sql_query, reason", [
+    ("UPDATE PSGTMS.BATCHFILE SET TotalTrans = 500 WHERE BatchNo = '123';", "must be a SELECT"),
+    ("DROP TABLE PSGAuditStats.tblAuditLogMaster;", "must be a SELECT"),
+    ("delete from PSGTMS.DetailFile1 where DetailKey = 1", "must be a SELECT"),
+    ("EXEC sp_who", "must be a SELECT"),
+    ("", "must be a SELECT"),
+    ("-- only a comment", "must be a SELECT"),
+    ("SELECT * INTO #copy FROM PSGTMS.DetailFile1", "forbidden keyword 'INTO'"),
+    ("SELECT * FROM OPENROWSET('SQLNCLI', 'x', 'SELECT 1')", "forbidden keyword 'OPENROWSET'"),
+    ("SELECT xp_cmdshell('dir')", "forbidden keyword 'XP_CMDSHELL'"),
+    ("SELECT name FROM sys.tables", "outside the allowed schemas"),
+    ("SELECT * FROM master.dbo.sysdatabases", "outside the allowed schemas"),
+    ("SELECT * FROM Users", "must be qualified"),
+    ("SELECT * FROM PSGTMS.BATCHFILE, Users", "must be qualified"),
+])
+def test_blocks_unsafe_statements(sql_query, reason):
+    is_safe, message = sql_validator.check_query(sql_query)
+    assert not is_safe
+    assert reason in message
+
+
+@pytest.mark.parametrize("sql_query", [
+    "SELECT 1; SELECT 2",
+    "SELECT 1 /* harmless */; EXEC xp_cmdshell 'dir'",
+    "SELECT 1; -- trailing\nDROP TABLE PSGTMS.BATCHFILE",
+    "SELECT 1 SELECT name FROM PSGTMS.BATCHFILE",
+    "WITH b AS (SELECT 1 AS x) SELECT * FROM b SELECT * FROM b",
+])
+def test_blocks_multiple_statements(sql_query):
+    is_safe, message = sql_validator.check_query(sql_query)
+    assert not is_safe
+    assert "single SQL statement" in message or "forbidden keyword" in message
+
+
+def test_trailing_semicolon_and_comment_are_one_statement():
+    assert sql_validator.check_query("SELECT * FROM PSGTMS.BATCHFILE; -- done")[0]
+
+
+def test_verdicts_are_cached_by_normalized_query():
+    sql_validator.verdicts.clear()
+    assert sql_validator.is_safe_query("SELECT * FROM PSGTMS.BATCHFILE")[0]
+    assert not sql_validator.is_safe_query("SELECT * FROM sys.tables")[0]
+    hits = sql_validator.cache_stats()["hits"]
+    assert sql_validator.is_safe_query("SELECT  *\tFROM PSGTMS.BATCHFILE")[0]
+    assert sql_validator.cache_stats()["hits"] == hits + 1
@@ -1,6 +1,7 @@
 import streamlit as st
 import requests
 import pandas as pd
+import json
 
 # --- Page Configuration ---
 st.set_page_config(page_title="TMS Bot (Conversational)", page_icon="🤖", layout="wide")
@@ -9,6 +10,22 @@ st.set_page_config(page_title="TMS Bot (Conversational)", page_icon="🤖", layo
 st.title("TMS Bot: Your Conversational Database Assistant 🤖")
 
 API_URL = "https://tms-bot-h6ld.onrender.com/query"
+# Streams the answer stage by stage as newline-delimited JSON events
+STREAM_URL = f"{API_URL}/stream"
+# Rows are requested column by column, which is smaller and faster to decode
+# than one dict per row. requests sends Accept-Encoding and decompresses the
+# response (gzip, or zstd when the zstandard package is installed).
+STREAM_PARAMS = {"format": "columnar"}
+
+
+def decode_rows(event: dict) -> pd.DataFrame:
+    """The rows of a "rows" event as a DataFrame, in either wire format."""
+    if "data" in event:
+        # Columnar: data[i] holds the values of columns[i].
+        frame = pd.DataFrame(dict(enumerate(event["data"])))
+        frame.columns = event["columns"]
+        return frame
+    return pd.DataFrame(event["rows"], columns=event["columns"])
 
 # --- Initialize Chat History ---
 if "messages" not in st.session_state:
@@ -25,27 +42,60 @@ if prompt := st.chat_input("Ask a question about your data..."):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # --- Call the Backend with the ENTIRE history ---
-    with st.spinner('Thinking...'):
+    # --- Call the Backend with the ENTIRE history and render events as they stream in ---
+    with st.chat_message("assistant"):
+        status_placeholder = st.empty()
+        summary_placeholder = st.empty()
+        details = st.expander("Show Technical Details")
+        sql_placeholder = details.empty()
+        table_placeholder = details.empty()
+        table_caption = details.empty()
+
         try:
             # The payload now sends the full list of messages under the "history" key
             payload = {"history": st.session_state.messages}
-            response = requests.post(API_URL, json=payload)
+            summary, tables, row_count, error_details = "", [], 0, None
+            status_placeholder.caption("Understanding your question...")
 
-            if response.status_code == 200:
-                data = response.json()
-                summary = data['summary']
+            with requests.post(STREAM_URL, params=STREAM_PARAMS, json=payload, stream=True) as response:
+                if response.status_code != 200:
+                    error_details = response.json().get('detail', 'Unknown error')
+                else:
+                    # Each line is one JSON event (see /query/stream in the backend)
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        event = json.loads(line)
+                        kind = event["event"]
 
-                with st.chat_message("assistant"):
-                    st.markdown(summary)
-                    with st.expander("Show Technical Details"):
-                        st.code(data['sql_query'], language='sql')
-                        if data['query_result']:
-                            st.dataframe(pd.DataFrame(data['query_result']))
+                        if kind == "intent":
+                            status_placeholder.caption("Finding the relevant tables...")
+                        elif kind == "tables":
+                            status_placeholder.caption(f"Writing SQL using {', '.join(event['tables'])}...")
+                        elif kind == "sql":
+                            sql_placeholder.code(event['sql_query'], language='sql')
+                            status_placeholder.caption("Running the query...")
+                        elif kind == "rows":
+                            tables.append(decode_rows(event))
+                            row_count += len(tables[-1])
+                            if row_count:
+                                table_placeholder.dataframe(pd.concat(tables, ignore_index=True))
+                            if event.get('truncated'):
+                                table_caption.caption(f"Showing the first {row_count} of {event['total_rows']} rows.")
+                            status_placeholder.caption("Summarizing the results...")
+                        elif kind == "summary_token":
+                            summary += event['text']
+                            summary_placeholder.markdown(summary + "▌")
+                        elif kind == "summary":
+                            summary = event['summary']
+                        elif kind == "error":
+                            error_details = event['detail']
 
+            status_placeholder.empty()
+            if error_details is None:
+                summary_placeholder.markdown(summary)
                 st.session_state.messages.append({"role": "assistant", "content": summary})
             else:
-                error_details = response.json().get('detail', 'Unknown error')
                 st.error(f"Failed to get an answer. Server responded with: {error_details}")
 
         except requests.exceptions.ConnectionError: